@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+# A different query reuses a cached answer when their embeddings' cosine similarity is at
+# least this; above 1 turns the semantic tier off, leaving exact (normalized) matches only.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+class AnswerCache:
+    """LLM answers keyed by (scope, normalized query), evicted least recently used first or after a TTL.
+
+    A scope is a tuple starting with the repo id, then the index generation, model and
+    search options: everything besides the query that decides which commits an answer
+    was written from. Embedding new commits starts a new generation, so older answers
+    are never returned for it; invalidate() also drops them right away.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        # (scope, query) -> (expires at, unit query embedding or None, answer)
+        self._entries = OrderedDict()
+        # scope -> {query: embedding}, and its stacked (queries, matrix) built on demand
+        self._vectors = {}
+        self._matrices = {}
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity <= 1.0
+
+    def get(self, scope, query: str, vector=None):
+        """Return (answer, "exact" | "semantic"), or (None, None) on a miss.
+
+        `vector` is the query's unit-length embedding, for the semantic tier.
+        """
+        now = time.monotonic()
+        with self._lock:
+            answer = self._live((scope, query), now)
+            if answer is not None:
+                self.exact_hits += 1
+                return answer, "exact"
+            if vector is not None and self.semantic:
+                answer = self._nearest(scope, vector, now)
+                if answer is not None:
+                    self.semantic_hits += 1
+                    return answer, "semantic"
+            self.misses += 1
+            return None, None
+
+    def put(self, scope, query: str, answer, vector=None):
+        with self._lock:
+            self._remove((scope, query))
+            self._entries[(scope, query)] = (time.monotonic() + self.ttl_s, vector, answer)
+            if vector is not None:
+                self._vectors.setdefault(scope, {})[query] = np.asarray(vector, dtype="float32")
+                self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, repo_id: str):
+        """Drop every answer cached for a repo, e.g. once new commits are embedded."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0][0] == repo_id]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def _live(self, key, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def _nearest(self, scope, vector, now: float):
+        if not self._vectors.get(scope):
+            return None
+        if scope not in self._matrices:
+            queries = list(self._vectors[scope])
+            self._matrices[scope] = (queries, np.stack([self._vectors[scope][q] for q in queries]))
+        queries, matrix = self._matrices[scope]
+        similarities = matrix @ np.asarray(vector, dtype="float32")
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        return self._live((scope, queries[best]), now)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope, query = key
+        vectors = self._vectors.get(scope)
+        if vectors is not None and vectors.pop(query, None) is not None:
+            self._matrices.pop(scope, None)
+            if not vectors:
+                del self._vectors[scope]
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,82 @@
+"""Recall@k vs query latency for Flat, HNSW and IVF-PQ segments at several repo sizes.
+
+Vectors are clustered synthetic unit vectors (commit chunks cluster by topic,
+which is what makes ANN pay off); queries are perturbed held-out points and
+ground truth is exact search. Latency is single-threaded, one query at a time,
+as in the query path. The thresholds in vector_index.py come from this table.
+
+Usage: python -m benchmarks.ann_selection [--sizes 10000,50000,200000] [--k 10] [--queries 200]
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from vector_index import PQ_RERANK_FACTOR, ExactVectors, build_index, needs_rerank, search_params
+
+
+def make_vectors(n: int, dim: int, rng):
+    clusters = max(n // 200, 10)
+    centers = rng.standard_normal((clusters, dim), dtype="float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim), dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def run(index, queries, truth, k, exact=None, **effort):
+    params = search_params(index, **effort)
+    found = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        if exact is not None:
+            _, candidates = index.search(query[None, :], k * PQ_RERANK_FACTOR, params=params)
+            found[i] = exact.rerank(query[None, :], candidates, k)[1][0]
+        else:
+            found[i] = index.search(query[None, :], k, params=params)[1][0]
+    latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    return recall, latency_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,50000,200000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    # Builds use every core, as ingest does; queries run on one.
+    build_threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} {'index':<6} {'effort':<16} {'build s':>8} {'recall@' + str(args.k):>10} {'ms/query':>9}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        data = make_vectors(n + args.queries, args.dim, rng)
+        vectors, queries = data[:n], data[n:]
+        ids = np.arange(n, dtype="int64")
+        _, truth = build_index(vectors, ids, kind="flat")[0].search(queries, args.k)
+
+        for kind, sweep in (
+            ("flat", [{}]),
+            ("hnsw", [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+            ("ivfpq", [{"nprobe": p} for p in (4, 8, 16, 32)]),
+        ):
+            faiss.omp_set_num_threads(build_threads)
+            start = time.perf_counter()
+            index, _ = build_index(vectors, ids, kind=kind)
+            build_s = time.perf_counter() - start
+            faiss.omp_set_num_threads(1)
+            # PQ is shown both raw and with the exact re-rank the query path applies.
+            exacts = [None, ExactVectors(vectors, ids)] if needs_rerank(index) else [None]
+            for effort in sweep:
+                for exact in exacts:
+                    recall, latency_ms = run(index, queries, truth, args.k, exact=exact, **effort)
+                    label = ",".join(f"{key}={value}" for key, value in effort.items()) or "exact"
+                    label += "+rerank" if exact is not None else ""
+                    print(f"{n:>8} {kind:<6} {label:<16} {build_s:8.1f} {recall:10.3f} {latency_ms:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""/analyze-query with the answer cache: hit rate per tier and latency of hits vs misses.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does, starts the mock OpenRouter
+from benchmarks/llm_client.py and sends --requests questions drawn from --distinct commit
+subject lines with Zipf-like popularity. Each is asked verbatim, re-cased with extra spaces
+(an exact hit once normalized) or reworded with a filler prefix (only the semantic tier can
+match it). Halfway through, one more commit is embedded, which must invalidate the cache.
+
+Usage: python -m benchmarks.answer_cache [--requests 300] [--distinct 20] [--llm-latency 0.3]
+                                          [--similarity 0.9] [--repo PATH | corpus.json ...]
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+import search_commits
+from answer_cache import AnswerCache
+from benchmarks.corpus import load_corpus
+from benchmarks.hybrid_search import build_store, message_queries
+from benchmarks.llm_client import MockOpenRouter, start_mock
+from git_log import iter_log_commits
+
+
+def variant(query: str, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.5:
+        return query
+    if roll < 0.75:
+        return "  ".join(query.upper().split())
+    return "in this repo, " + query
+
+
+async def run(repo_id, requests, late_commit):
+    latencies = {"exact": [], "semantic": [], None: []}
+    for n, query in enumerate(requests):
+        if n == len(requests) // 2:
+            gitretrieval.embed_and_save(repo_id, [late_commit])
+            print(f"embedded 1 more commit after {n} requests: {gitretrieval.ANSWER_CACHE.stats()['invalidations']} answers invalidated")
+        start = time.perf_counter()
+        response = await gitretrieval.analyze_query({"repo_id": repo_id, "query": query})
+        latencies[response.get("cached")].append(time.perf_counter() - start)
+    await search_commits.LLM_CLIENT.aclose()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds the mock LLM takes per answer")
+    parser.add_argument("--similarity", type=float, default=0.9)
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="answer-cache-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits[:-1])
+    gitretrieval.ANSWER_CACHE = AnswerCache(similarity=args.similarity)
+
+    rng = random.Random(0)
+    queries = [q for q, _ in message_queries(commits)][: args.distinct]
+    weights = [1.0 / (rank + 1) for rank in range(len(queries))]
+    requests = [variant(q, rng) for q in rng.choices(queries, weights, k=args.requests)]
+
+    process, search_commits.LLM_CLIENT.url = start_mock(MockOpenRouter(args.llm_latency))
+    try:
+        latencies = asyncio.run(run(repo_id, requests, commits[-1]))
+    finally:
+        process.terminate()
+
+    print(f"{args.requests} requests over {len(queries)} questions, similarity >= {args.similarity}")
+    print(f"{'result':<10} {'n':>5} {'p50 ms':>9} {'p95 ms':>9}")
+    for tier, name in (("exact", "exact"), ("semantic", "semantic"), (None, "miss")):
+        if latencies[tier]:
+            p50, p95 = np.percentile(latencies[tier], [50, 95]) * 1000
+            print(f"{name:<10} {len(latencies[tier]):>5} {p50:9.2f} {p95:9.2f}")
+    print(gitretrieval.ANSWER_CACHE.stats())
+
+
+if __name__ == "__main__":
+    main()
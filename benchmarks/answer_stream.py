@@ -0,0 +1,122 @@
+"""/analyze-query vs /analyze-query/stream: time to first byte, time to the full answer, and disconnects.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does, starts the mock OpenRouter
+from benchmarks/llm_client.py (--first-token seconds, then --tokens pieces --token-gap apart)
+and calls both endpoints in-process through the ASGI app, timestamping every body message the
+app sends. Then it streams once more and disconnects after the first token, and reports how
+many tokens the mock still generated.
+
+Usage: python -m benchmarks.answer_stream [--rounds 10] [--first-token 0.5] [--tokens 50] [--token-gap 0.03]
+                                          [--repo PATH | corpus.json ...]
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+import numpy as np
+from fastapi import FastAPI
+from git import Repo
+
+import gitretrieval
+import search_commits
+from answer_cache import AnswerCache
+from benchmarks.corpus import load_corpus
+from benchmarks.hybrid_search import build_store, message_queries
+from benchmarks.llm_client import MockOpenRouter, start_mock
+from git_log import iter_log_commits
+
+
+async def call(app, path: str, body, disconnect_after_body: int = None):
+    """POST `body` to `path`; returns (seconds to first body byte, seconds to the end, body messages)."""
+    disconnected = asyncio.Event()
+    sent = [False]
+    messages = []
+
+    async def receive():
+        if not sent[0]:
+            sent[0] = True
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    start = time.perf_counter()
+    first = [None]
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            first[0] = first[0] or time.perf_counter() - start
+            messages.append(message["body"])
+            if disconnect_after_body is not None and len(messages) >= disconnect_after_body:
+                disconnected.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+    await app(scope, receive, send)
+    return first[0], time.perf_counter() - start, messages
+
+
+async def run(app, repo_id, queries, rounds, mock):
+    print(f"{'endpoint':<22} {'TTFB p50 ms':>12} {'full p50 ms':>12}")
+    for path in ("/analyze-query", "/analyze-query/stream"):
+        ttfb, full = [], []
+        for n in range(rounds):
+            first, end, _ = await call(app, path, {"repo_id": repo_id, "query": queries[n % len(queries)]})
+            ttfb.append(first)
+            full.append(end)
+        print(f"{path:<22} {np.median(ttfb) * 1000:12.1f} {np.median(full) * 1000:12.1f}")
+
+    before = mock.tokens_sent.value
+    # Body messages: the commits event, then the first token.
+    await call(app, "/analyze-query/stream", {"repo_id": repo_id, "query": queries[0]}, disconnect_after_body=2)
+    await asyncio.sleep(mock.token_latency * 5)
+    print(f"client gone after 1 token: mock generated {mock.tokens_sent.value - before} of {mock.tokens} tokens")
+    await search_commits.LLM_CLIENT.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--first-token", type=float, default=0.5, help="seconds until the mock's first token")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-gap", type=float, default=0.03, help="seconds between the mock's tokens")
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="answer-stream-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits)
+    queries = [q for q, _ in message_queries(commits)]
+    # Every call must reach the LLM: no cached answers.
+    gitretrieval.ANSWER_CACHE = AnswerCache(max_entries=0, similarity=2.0)
+    # Warm the model and the index cache before timing anything.
+    gitretrieval.retrieve_top_k(repo_id, "warm up")
+
+    mock = MockOpenRouter(args.first_token, args.tokens, args.token_gap)
+    process, search_commits.LLM_CLIENT.url = start_mock(mock)
+    app = FastAPI()
+    app.include_router(gitretrieval.router)
+    try:
+        asyncio.run(run(app, repo_id, queries, args.rounds, mock))
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
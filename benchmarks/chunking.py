@@ -0,0 +1,69 @@
+"""Compare whole-commit embedding with hunk/file chunking: encode time and recall@k.
+
+Queries are added lines taken from the second half of each commit's diff,
+i.e. the text whole-commit embedding is most likely to have truncated away.
+
+Usage: python -m benchmarks.chunking [--k 5] [--aggregate max|sum] [corpus.json ...]
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+import gitretrieval
+from benchmarks.corpus import load_corpus, make_queries
+from chunking import chunk_commit
+
+
+def build(texts, positions):
+    start = time.perf_counter()
+    vectors = np.asarray(gitretrieval.MODEL.encode(texts, batch_size=64), dtype="float32")
+    elapsed = time.perf_counter() - start
+    # Ids are commit positions, so hits come back already mapped to commits.
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.asarray(positions, dtype="int64"))
+    return index, elapsed
+
+
+def recall(index, queries, k, aggregate):
+    query_vecs = np.asarray(gitretrieval.MODEL.encode([q for q, _ in queries]), dtype="float32")
+    D, I = index.search(query_vecs, min(k * gitretrieval.CHUNK_OVERFETCH, index.ntotal))
+    hits = 0
+    for (_, target), distances, ids in zip(queries, D, I):
+        ranked = gitretrieval._aggregate_chunk_hits(distances, ids, aggregate)[:k]
+        hits += any(position == target for position, _ in ranked)
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--aggregate", default="max", choices=["max", "sum"])
+    args = parser.parse_args()
+
+    commits = load_corpus(args.corpora)
+    queries = make_queries(commits)
+
+    whole_texts = [f"{c['message']} \n {c['diff']}" for c in commits]
+    whole = build(whole_texts, range(len(commits)))
+
+    chunk_texts, chunk_positions = [], []
+    for position, commit in enumerate(commits):
+        for chunk in chunk_commit(commit, count_tokens=gitretrieval.MODEL.count_tokens):
+            chunk_texts.append(chunk)
+            chunk_positions.append(position)
+    chunked = build(chunk_texts, chunk_positions)
+
+    print(f"{len(commits)} commits, {len(queries)} queries, recall@{args.k}")
+    for label, (index, elapsed), vectors in (
+        ("whole-commit", whole, len(whole_texts)),
+        ("chunked", chunked, len(chunk_texts)),
+    ):
+        r = recall(index, queries, args.k, args.aggregate)
+        print(f"{label:<13} {vectors:>6} vectors  encode {elapsed:7.2f}s  recall {r:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""ask_llm prompt size: whole diffs vs commit lines only vs the context packer at several token budgets.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does and runs the "line" queries
+of benchmarks/corpus.py (a long added line from each diff) with /analyze-query's options.
+For each query's top k, reports the prompt's estimated tokens (p50 / p95 / max), the time to
+build it (diffs read on demand included) and how often the queried line itself made it into
+the prompt, as a stand-in for whether the LLM gets to see the relevant code.
+
+Usage: python -m benchmarks.context_packer [--k 5] [--max-queries 200] [--budgets 500 1500 4000]
+                                           [--repo PATH | corpus.json ...]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+import search_commits
+from benchmarks.corpus import load_corpus, make_queries
+from benchmarks.hybrid_search import build_store
+from chunking import estimate_tokens
+from context_packer import commit_line
+from git_log import iter_log_commits
+
+
+def prompt_text(payload) -> str:
+    return "\n".join(message["content"] for message in payload["messages"])
+
+
+def whole_diffs(top_commits, query, load_diff):
+    # Every result's full diff after its commit line, with no budget.
+    payload = search_commits.answer_payload([], query)
+    context = "\n".join(f"{commit_line(c)}\n{load_diff(c)}" for c in top_commits)
+    return prompt_text(payload) + context
+
+
+def report(name, rows):
+    tokens, ms, found = (np.array(column) for column in zip(*rows))
+    p50, p95 = np.percentile(tokens, [50, 95])
+    print(
+        f"{name:<16} {p50:8.0f} {p95:8.0f} {tokens.max():8.0f} "
+        f"{np.median(ms):8.2f} {np.percentile(ms, 95):8.2f} {found.mean():8.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-queries", type=int, default=200)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[500, 1500, 4000])
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="context-packer-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits)
+    queries = make_queries(commits)
+    random.Random(0).shuffle(queries)
+    queries = [q for q, _ in queries[: args.max_queries]]
+
+    options = gitretrieval._search_options({})
+    retrieved = [(q, gitretrieval.retrieve_top_k(repo_id, q, k=args.k, **options)) for q in queries]
+    load_diff = gitretrieval.diff_loader(repo_id)
+    full_diff = lambda commit: gitretrieval.result_diff(repo_id, commit)
+
+    builders = [
+        ("whole diffs", lambda top, q: whole_diffs(top, q, full_diff)),
+        ("commit lines", lambda top, q: prompt_text(search_commits.answer_payload(top, q))),
+    ]
+    for budget in args.budgets:
+        def packed(top, q, budget=budget):
+            search_commits.CONTEXT_TOKEN_BUDGET = budget
+            return prompt_text(search_commits.answer_payload(top, q, load_diff))
+        builders.append((f"packed {budget}", packed))
+
+    print(f"{len(queries)} queries, top {args.k}; prompt tokens by estimate_tokens")
+    print(f"{'prompt':<16} {'p50 tok':>8} {'p95 tok':>8} {'max tok':>8} {'p50 ms':>8} {'p95 ms':>8} {'line in':>8}")
+    for name, build in builders:
+        rows = []
+        for query, top in retrieved:
+            start = time.perf_counter()
+            text = build(top, query)
+            elapsed = (time.perf_counter() - start) * 1000
+            # The prompt quotes the query once; look for the line in the commit context only.
+            context = " ".join(text.replace(query, "", 1).split())
+            rows.append((estimate_tokens(text), elapsed, " ".join(query.split()) in context))
+        report(name, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import glob
+import json
+import os
+
+from commit_store import LEGACY_COMMITS_FILE, MANIFEST_FILE, iter_stored_commits
+
+DEFAULT_CORPORA = "data/*"
+
+
+def load_corpus(paths=None):
+    """Load the bundled commit corpora (or the given repo dirs or commits.json files) into one commit list.
+
+    A repo dir is read from its store once migrated, from its commits.json before that.
+    """
+    paths = paths or sorted(glob.glob(DEFAULT_CORPORA))
+    commits = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            commits.extend(iter_stored_commits(path))
+            continue
+        if os.path.isdir(path):
+            path = os.path.join(path, LEGACY_COMMITS_FILE)
+            if not os.path.exists(path):
+                continue
+        with open(path) as f:
+            commits.extend(json.load(f))
+    return commits
+
+
+def make_queries(commits):
+    """(query, commit position) pairs: a long added line from the second half of each diff."""
+    queries = []
+    for position, commit in enumerate(commits):
+        lines = commit["diff"].splitlines()
+        tail = [l[1:].strip() for l in lines[len(lines) // 2:] if l.startswith("+") and not l.startswith("+++")]
+        tail = [l for l in tail if len(l) > 20]
+        if tail:
+            queries.append((max(tail, key=len), position))
+    return queries
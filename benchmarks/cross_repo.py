@@ -0,0 +1,75 @@
+"""Cross-repo search latency vs number of repos: one search_repos call vs a client querying each repo in turn.
+
+Builds --repos synthetic repo stores (as benchmarks/many_repos.py), loads them all
+into the index cache, then times queries over the first N repos for growing N.
+
+Usage: python -m benchmarks.cross_repo [--repos 64] [--rows 2000] [--queries 30] [--mode vector] [--dir DIR]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import gitretrieval
+from benchmarks.many_repos import build
+from lexical_index import SEARCH_MODES
+
+QUERIES = ["fix cors bug", "update dependencies", "refactor login flow", "add retry to http client", "commit 1f"]
+
+
+def timed(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, [50, 95]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repos", type=int, default=64)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default="vector", choices=SEARCH_MODES)
+    parser.add_argument("--dir", help="reuse repo stores built by an earlier run")
+    args = parser.parse_args()
+
+    data_dir = args.dir or tempfile.mkdtemp(prefix="cross-repo-")
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.listdir(data_dir):
+        build(data_dir, args.repos, args.rows, args.dim)
+    gitretrieval.DATA_DIR = data_dir
+    repo_ids = sorted(os.listdir(data_dir))
+    queries = [QUERIES[n % len(QUERIES)] + f" {n}" for n in range(args.queries)]
+    # Load every repo once, so both sides are timed against a warm index cache.
+    gitretrieval.search_repos(repo_ids, "warm up", k=args.k, mode=args.mode)
+
+    def sequential(repos):
+        def run(query):
+            results = []
+            for repo_id in repos:
+                found = gitretrieval.retrieve_top_k(repo_id, query, k=args.k, mode=args.mode)
+                results += [dict(c, repo_id=repo_id) for c in found]
+            return sorted(results, key=lambda c: -c["score"])[: args.k]
+        return run
+
+    def fanned_out(repos):
+        return lambda query: gitretrieval.search_repos(repos, query, k=args.k, mode=args.mode)
+
+    print(f"{args.rows} rows per repo, mode={args.mode}, {gitretrieval.SHARD_WORKERS} shard workers")
+    print(f"{'repos':>6} {'sequential p50':>15} {'p95':>8} {'search_repos p50':>17} {'p95':>8} {'ms/repo':>8}")
+    n = 1
+    while n <= len(repo_ids):
+        seq_p50, seq_p95 = timed(sequential(repo_ids[:n]), queries)
+        fan_p50, fan_p95 = timed(fanned_out(repo_ids[:n]), queries)
+        print(f"{n:>6} {seq_p50:13.2f}ms {seq_p95:6.2f}ms {fan_p50:15.2f}ms {fan_p95:6.2f}ms {fan_p50 / n:8.3f}")
+        n *= 4
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Latency, throughput and top-k overlap of each CPU embedding backend against fp32 torch.
+
+Usage: python -m benchmarks.embedding_backends [--backends torch,onnx,int8] [--k 5] [corpus.json ...]
+"""
+import argparse
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.corpus import load_corpus, make_queries
+from chunking import chunk_commit
+from embeddings import load_embedder
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def top_k(model, texts, queries, k):
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=64), dtype="float32")
+    ingest_seconds = time.perf_counter() - start
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    latencies = []
+    rows = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        query_vec = np.asarray(model.encode(query), dtype="float32").reshape(1, -1)
+        latencies.append(time.perf_counter() - start)
+        _, I = index.search(query_vec, k)
+        rows.append(set(I[0].tolist()))
+    return ingest_seconds, latencies, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--backends", default="torch,onnx,int8")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    commits = load_corpus(args.corpora)
+    texts = [chunk for commit in commits for chunk in chunk_commit(commit)]
+    queries = make_queries(commits)
+    print(f"{len(texts)} chunks, {len(queries)} queries")
+
+    baseline = None
+    for backend in args.backends.split(","):
+        try:
+            model = load_embedder(MODEL_NAME, backend)
+        except Exception as e:
+            print(f"{backend:<6} unavailable: {e}")
+            continue
+
+        model.encode(texts[:8])  # warm-up
+        ingest_seconds, latencies, rows = top_k(model, texts, queries, args.k)
+        if baseline is None:
+            baseline = rows
+        overlap = statistics.mean(len(a & b) / args.k for a, b in zip(rows, baseline))
+
+        latencies.sort()
+        print(
+            f"{backend:<6} {len(texts) / ingest_seconds:8.1f} chunks/sec  "
+            f"query p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms  "
+            f"top-{args.k} overlap vs {args.backends.split(',')[0]} {overlap:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Encoder throughput (commits/sec) at several batch sizes, with and without length bucketing.
+
+Usage: python -m benchmarks.encode_throughput [--batch-sizes 1,8,32,64,128] [--repeat 3] [corpus.json ...]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import gitretrieval
+from benchmarks.corpus import load_corpus
+from chunking import chunk_commit
+
+
+def unbucketed(texts, batch_size):
+    """Per-batch encode in arrival order, as a baseline for the bucketed path."""
+    out = np.empty((len(texts), gitretrieval.MODEL.get_sentence_embedding_dimension()), dtype="float32")
+    for start in range(0, len(texts), batch_size):
+        out[start:start + batch_size] = gitretrieval.MODEL.encode(
+            texts[start:start + batch_size], batch_size=batch_size, convert_to_numpy=True
+        )
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--batch-sizes", default="1,8,32,64,128")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    commits = load_corpus(args.corpora) * args.repeat
+    texts = [chunk for commit in commits for chunk in chunk_commit(commit, count_tokens=gitretrieval.MODEL.count_tokens)]
+
+    print(f"{len(commits)} commits, {len(texts)} chunks, {gitretrieval.ENCODE_THREADS or 'default'} threads")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        for label, encode in (("arrival", unbucketed), ("bucketed", gitretrieval.encode_texts)):
+            start = time.perf_counter()
+            encode(texts, batch_size)
+            elapsed = time.perf_counter() - start
+            print(f"batch {batch_size:>4} {label:<9} {len(commits) / elapsed:9.1f} commits/sec  {len(texts) / elapsed:9.1f} chunks/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Hybrid (vector + BM25, fused by reciprocal rank) vs vector-only vs keyword-only retrieval.
+
+Builds a throwaway repo store from the bundled corpora (or --repo's history), then runs three query sets:
+  line        a long added line from the second half of each diff (as benchmarks/chunking.py)
+  identifier  "commit that changed <name>" for an identifier touched by only a few commits
+  message     each commit's subject line
+Reports hit rate @k, MRR and per-query latency for each retrieval mode.
+
+Usage: python -m benchmarks.hybrid_search [--k 5] [--max-queries 300] [--repo PATH | corpus.json ...]
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+from benchmarks.corpus import load_corpus, make_queries
+from chunking import chunk_commit
+from commit_store import append_commits, append_embeddings, append_row_ids, commit_generation, commit_id, load_manifest
+from git_log import iter_log_commits
+from lexical_index import SEARCH_MODES
+
+# Identifiers worth searching for by name: mixedCase, snake_case or long.
+_IDENTIFIER_RE = re.compile(r"\b(?:[a-z]+[A-Z]\w*|[A-Z][a-z]+[A-Z]\w*|[a-z]+_[a-z_]+|[A-Za-z]{12,})\b")
+
+
+def build_store(data_dir: str, repo_id: str, commits):
+    repo_dir = os.path.join(data_dir, repo_id)
+    texts, ids = [], []
+    for commit in commits:
+        for chunk in chunk_commit(commit, count_tokens=gitretrieval.MODEL.count_tokens):
+            texts.append(chunk)
+            ids.append(commit_id(commit["hash"]))
+    os.makedirs(repo_dir)
+    start = time.perf_counter()
+    append_commits(repo_dir, commits)
+    lexical_s = time.perf_counter() - start
+    append_embeddings(repo_dir, gitretrieval.encode_texts(texts))
+    append_row_ids(repo_dir, ids)
+    commit_generation(repo_dir, load_manifest(repo_dir), model=gitretrieval.MODEL.key)
+    return lexical_s
+
+
+def identifier_queries(commits, max_df: int = 3):
+    """("commit that changed X", position) for a rare identifier on each commit's added lines."""
+    per_commit = []
+    df = Counter()
+    for commit in commits:
+        names = set()
+        for line in commit["diff"].splitlines():
+            if line.startswith("+") and not line.startswith("+++"):
+                names.update(_IDENTIFIER_RE.findall(line))
+        per_commit.append(names)
+        df.update(names)
+    queries = []
+    for position, names in enumerate(per_commit):
+        rare = sorted((n for n in names if df[n] <= max_df), key=lambda n: (df[n], -len(n), n))
+        if rare:
+            queries.append((f"commit that changed {rare[0]}", position))
+    return queries
+
+
+def message_queries(commits):
+    return [(c["message"].splitlines()[0], p) for p, c in enumerate(commits) if c["message"].strip()]
+
+
+def evaluate(repo_id, queries, hashes, k, mode):
+    hits, reciprocal, latencies = 0, 0.0, []
+    for query, position in queries:
+        start = time.perf_counter()
+        results = gitretrieval.retrieve_top_k(repo_id, query, k=k, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        found = [r["hash"] for r in results]
+        if hashes[position] in found:
+            hits += 1
+            reciprocal += 1.0 / (found.index(hashes[position]) + 1)
+    return hits / len(queries), reciprocal / len(queries), np.percentile(latencies, [50, 95]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-queries", type=int, default=300)
+    args = parser.parse_args()
+
+    # Corpora can overlap; a store holds each commit once.
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    hashes = [c["hash"] for c in commits]
+
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="hybrid-search-")
+    repo_id = "bench"
+    lexical_s = build_store(gitretrieval.DATA_DIR, repo_id, commits)
+    print(f"{len(commits)} commits; commit rows + keyword index written in {lexical_s:.2f}s")
+
+    rng = random.Random(0)
+    query_sets = {
+        "line": make_queries(commits),
+        "identifier": identifier_queries(commits),
+        "message": message_queries(commits),
+    }
+    # Warm the model and the index cache before timing anything.
+    gitretrieval.retrieve_top_k(repo_id, "warm up", k=args.k)
+
+    print(f"{'queries':<11} {'n':>5} {'mode':<8} {'hit@' + str(args.k):>7} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, queries in query_sets.items():
+        if not queries:
+            continue
+        if len(queries) > args.max_queries:
+            queries = rng.sample(queries, args.max_queries)
+        for mode in SEARCH_MODES:
+            hit_rate, mrr, (p50, p95) = evaluate(repo_id, queries, hashes, args.k, mode)
+            print(f"{name:<11} {len(queries):>5} {mode:<8} {hit_rate:7.3f} {mrr:6.3f} {p50:8.2f} {p95:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compare commits/sec of the per-commit GitPython walk and the streaming `git log` parser.
+
+Usage: python -m benchmarks.ingest [--repo PATH] [--commits N]
+"""
+import argparse
+import time
+
+from git import Repo
+
+from benchmarks.synthetic import make_synthetic_repo
+from git_log import iter_log_commits
+
+
+def legacy_commits(repo):
+    """The previous `get_commits` walk: one `commit.diff()` subprocess per commit."""
+    for commit in repo.iter_commits():
+        yield {
+            "hash": commit.hexsha,
+            "author": commit.author.name,
+            "email": commit.author.email,
+            "date": commit.committed_datetime.isoformat(),
+            "message": commit.message.strip(),
+            "diff": "".join(
+                d.diff.decode("utf-8", errors="ignore")
+                for d in commit.diff(commit.parents[0], create_patch=True)
+            )
+            if commit.parents
+            else ""
+        }
+
+
+def run(label, commits):
+    start = time.perf_counter()
+    count = sum(1 for _ in commits)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {count:>7} commits  {elapsed:8.2f}s  {count / elapsed:10.1f} commits/sec")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo", help="existing repository to walk (default: synthetic repo)")
+    parser.add_argument("--commits", type=int, default=2000, help="size of the synthetic repo")
+    args = parser.parse_args()
+
+    repo = Repo(args.repo or make_synthetic_repo(args.commits))
+    run("legacy", legacy_commits(repo))
+    run("streaming", iter_log_commits(repo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check that ingest memory is bounded by the batch and segment sizes, not by history length.
+
+Walks a synthetic repo through get_commits -> embed_and_save and reports how far the
+process's peak RSS (ru_maxrss: numpy, FAISS and SQLite included) rose above its RSS
+before the ingest. Exits non-zero if that exceeds --max-mb. tests/test_ingest_memory.py
+runs it on 50k commits.
+
+Usage: python -m benchmarks.ingest_memory [--commits 50000] [--batch-size 256] [--max-mb 128] [--stub-encoder]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+from benchmarks.synthetic import make_synthetic_repo
+from chunking import estimate_tokens
+from embedding_cache import EmbeddingCache
+
+
+class StubEncoder:
+    """Constant-cost stand-in so the measurement isolates the pipeline itself."""
+
+    key = "stub"
+
+    def get_sentence_embedding_dimension(self):
+        return 384
+
+    def count_tokens(self, texts):
+        return [estimate_tokens(text) for text in texts]
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return np.zeros(384, dtype="float32")
+        return np.zeros((len(texts), 384), dtype="float32")
+
+
+def rss_mb(field: str = "VmRSS") -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key == field:
+                return int(value.split()[0]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    # Kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=gitretrieval.EMBED_BATCH_SIZE)
+    parser.add_argument("--max-mb", type=float, default=128.0)
+    parser.add_argument("--stub-encoder", action="store_true")
+    args = parser.parse_args()
+
+    repo = Repo(make_synthetic_repo(args.commits))
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="ingest-memory-")
+    # A cold cache of its own: every commit is encoded, and nothing lands in the shared one.
+    gitretrieval.EMBEDDING_CACHE = EmbeddingCache(os.path.join(gitretrieval.DATA_DIR, "embedding_cache.sqlite"))
+    if args.stub_encoder:
+        gitretrieval.MODEL = StubEncoder()
+
+    before = rss_mb()
+    start = time.perf_counter()
+    stats = gitretrieval.embed_and_save(
+        "bench", gitretrieval.get_commits(repo), batch_size=args.batch_size
+    )
+    elapsed = time.perf_counter() - start
+    growth = peak_rss_mb() - before
+
+    print(
+        f"{stats['embedded']} commits in {elapsed:.1f}s, batch size {args.batch_size}: "
+        f"peak RSS +{growth:.1f} MB over {before:.1f} MB, RssAnon now {rss_mb('RssAnon'):.1f} MB"
+    )
+    if growth > args.max_mb:
+        print(f"FAIL: peak RSS growth {growth:.1f} MB exceeds ceiling {args.max_mb:.1f} MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""LLM calls against a local mock OpenRouter: blocking requests.post per question vs the shared async client.
+
+The mock speaks just enough HTTP/1.1 (keep-alive, Content-Length) to answer chat completions
+after --latency seconds, and counts the TCP connections it accepts. It runs in its own process
+so it doesn't compete with the client for the GIL. --questions are asked at
+once, the old way (requests.post with no session, on a thread pool like Starlette's)
+and through llm_client.LLMClient, both --concurrency wide. Reports wall time, connections
+opened, threads held, and how long a no-op "health check" waits for its turn mid-load
+(a pool thread for the blocking client, the event loop for the async one).
+
+Usage: python -m benchmarks.llm_client [--questions 200] [--latency 0.2] [--concurrency 16]
+       python -m benchmarks.llm_client --serve [--port 8089]   # run only the mock; set
+       LLM_URL=http://127.0.0.1:8089/api/v1/chat/completions in the app under test
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from llm_client import LLM_MAX_CONCURRENCY, LLMClient
+
+
+class MockOpenRouter:
+    """Answers after `latency` seconds; with "stream": true, sends `tokens` SSE chunks `token_latency` apart."""
+
+    def __init__(self, latency: float, tokens: int = 1, token_latency: float = 0.0):
+        self.latency = latency
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.connections = multiprocessing.Value("i", 0)
+        self.requests = multiprocessing.Value("i", 0)
+        self.tokens_sent = multiprocessing.Value("i", 0)
+
+    async def stream(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        events = [{"choices": [{"delta": {"content": f"token{n} "}}]} for n in range(self.tokens)]
+        for n, event in enumerate(events):
+            if n:
+                await asyncio.sleep(self.token_latency)
+            data = f": keep-alive\n\ndata: {json.dumps(event)}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+            with self.tokens_sent.get_lock():
+                self.tokens_sent.value += 1
+        data = b"data: [DONE]\n\n"
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        with self.connections.get_lock():
+            self.connections.value += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+                payload = json.loads(await reader.readexactly(length)) if length else {}
+                with self.requests.get_lock():
+                    self.requests.value += 1
+                await asyncio.sleep(self.latency)
+                if payload.get("stream"):
+                    await self.stream(writer)
+                    continue
+                await asyncio.sleep(self.token_latency * (self.tokens - 1))
+                question = payload.get("messages", [{}])[-1].get("content", "")
+                body = json.dumps({"choices": [{"message": {"content": f"mock answer ({len(question)} chars asked)"}}]})
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n{body}".encode()
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port: int, bound):
+        server = await asyncio.start_server(self.handle, "127.0.0.1", port, backlog=1024)
+        bound.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+
+def start_mock(mock: MockOpenRouter, port: int = 0):
+    """Run the mock in a child process; returns (process, its chat completions URL)."""
+    bound = multiprocessing.Queue()
+    process = multiprocessing.Process(target=lambda: asyncio.run(mock.serve(port, bound)), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{bound.get()}/api/v1/chat/completions"
+
+
+def payload(n: int):
+    return {"model": "mock", "messages": [{"role": "user", "content": f"question {n}"}]}
+
+
+def blocking(url: str, questions: int, concurrency: int):
+    def ask(n):
+        response = requests.post(url, headers={"Authorization": "Bearer test"}, json=payload(n), timeout=30)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(ask, n) for n in range(questions)]
+        start = time.perf_counter()
+        pool.submit(lambda: None).result()
+        probe = time.perf_counter() - start
+        return [f.result() for f in futures], probe
+
+
+async def pooled(url: str, questions: int, concurrency: int):
+    client = LLMClient(url, max_concurrency=concurrency)
+    try:
+        tasks = [asyncio.ensure_future(client.chat(payload(n), "test")) for n in range(questions)]
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await asyncio.sleep(0)
+        probe = time.perf_counter() - start
+        return await asyncio.gather(*tasks), probe
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the mock takes per answer")
+    parser.add_argument("--concurrency", type=int, default=LLM_MAX_CONCURRENCY)
+    parser.add_argument("--serve", action="store_true", help="only run the mock server")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    if args.serve:
+        process, url = start_mock(MockOpenRouter(args.latency), args.port)
+        print(f"Mock OpenRouter on {url}")
+        process.join()
+        return
+
+    print(f"{args.questions} questions at once, {args.latency * 1000:.0f} ms per answer")
+    print(f"{'client':<14} {'wall s':>7} {'connections':>12} {'threads':>8} {'probe ms':>9}")
+    for name in ("requests.post", "LLMClient"):
+        mock = MockOpenRouter(args.latency)
+        process, url = start_mock(mock)
+        start = time.perf_counter()
+        if name == "LLMClient":
+            answers, probe = asyncio.run(pooled(url, args.questions, args.concurrency))
+            threads = 0
+        else:
+            answers, probe = blocking(url, args.questions, args.concurrency)
+            threads = args.concurrency
+        wall = time.perf_counter() - start
+        process.terminate()
+        assert len(answers) == args.questions
+        print(f"{name:<14} {wall:7.2f} {mock.connections.value:12d} {threads:8d} {probe * 1000:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
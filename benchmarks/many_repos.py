@@ -0,0 +1,127 @@
+"""Serve many repos from one process: resident memory and first-query latency, mmap vs full read.
+
+Builds --repos synthetic repo stores (random unit vectors, no model needed),
+then, in a fresh process per mode, opens every repo through an IndexCache
+and runs one query against each. Reports private (RssAnon) and page-cache
+backed (RssFile) resident memory: only the former is per-worker, the latter
+is shared by every process mapping the same files. For cold-disk numbers,
+drop the page cache (echo 3 > /proc/sys/vm/drop_caches) before each mode.
+
+Usage: python -m benchmarks.many_repos [--repos 500] [--rows 2000] [--dim 384] [--dir DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from commit_store import (
+    append_commits,
+    append_embeddings,
+    append_row_ids,
+    commit_generation,
+    commit_id,
+    load_manifest,
+    load_segments,
+    segments_heap_bytes,
+)
+from index_cache import IndexCache
+
+
+def rss_mb():
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def build(data_dir: str, repos: int, rows: int, dim: int):
+    rng = np.random.default_rng(0)
+    for r in range(repos):
+        repo_dir = os.path.join(data_dir, f"repo{r:04d}")
+        os.makedirs(repo_dir)
+        hashes = [hashlib.sha1(f"{r}:{i}".encode()).hexdigest() for i in range(rows)]
+        vectors = rng.standard_normal((rows, dim), dtype="float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [commit_id(h) for h in hashes]
+
+        append_commits(repo_dir, [{"hash": h, "message": f"commit {h}", "diff": ""} for h in hashes])
+        append_embeddings(repo_dir, vectors)
+        append_row_ids(repo_dir, ids)
+        commit_generation(repo_dir, load_manifest(repo_dir))
+
+
+def measure(data_dir: str, mmap: bool):
+    repo_dirs = sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir))
+    cache = IndexCache()
+    before = rss_mb()
+
+    def load(repo_dir, manifest):
+        segments = load_segments(repo_dir, manifest, mmap=mmap)
+        return segments, segments_heap_bytes(repo_dir, manifest, segments, mmap=mmap)
+
+    rng = np.random.default_rng(1)
+    first, warm = [], []
+    for latencies in (first, warm):
+        for repo_dir in repo_dirs:
+            start = time.perf_counter()
+            manifest = load_manifest(repo_dir)
+            segments = cache.get(repo_dir, manifest["generation"], lambda: load(repo_dir, manifest))
+            for segment in segments:
+                segment.search(rng.standard_normal((1, segment.d), dtype="float32"), 20)
+            latencies.append(time.perf_counter() - start)
+
+    after = rss_mb()
+    return {
+        "anon_mb": after["RssAnon"] - before["RssAnon"],
+        "file_mb": after["RssFile"] - before["RssFile"],
+        "cache_mb": cache.stats()["bytes"] / (1024 * 1024),
+        "first_p50_ms": float(np.percentile(first, 50) * 1000),
+        "first_p95_ms": float(np.percentile(first, 95) * 1000),
+        "warm_p50_ms": float(np.percentile(warm, 50) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repos", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--dir", help="reuse repo stores built by an earlier run")
+    parser.add_argument("--measure", choices=["mmap", "read"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.dir, args.measure == "mmap")))
+        return
+
+    data_dir = args.dir or tempfile.mkdtemp(prefix="many-repos-")
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.listdir(data_dir):
+        start = time.perf_counter()
+        build(data_dir, args.repos, args.rows, args.dim)
+        print(f"Built {args.repos} repos x {args.rows} rows in {time.perf_counter() - start:.1f}s: {data_dir}")
+
+    print(f"{'mode':<5} {'anon MB':>9} {'file MB':>9} {'cache MB':>9} {'first p50':>10} {'first p95':>10} {'warm p50':>9}")
+    for mode in ("read", "mmap"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.many_repos", "--dir", data_dir, "--measure", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{mode:<5} {r['anon_mb']:9.1f} {r['file_mb']:9.1f} {r['cache_mb']:9.1f} "
+            f"{r['first_p50_ms']:8.2f}ms {r['first_p95_ms']:8.2f}ms {r['warm_p50_ms']:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
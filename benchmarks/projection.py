@@ -0,0 +1,72 @@
+"""Search results with and without their diffs: latency, allocations and JSON serialization per query.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does and runs its
+message queries with the default result fields (metadata only), with "diff_ref"
+(diffs read later, on demand) and with "diff" (every diff read eagerly, as all
+results used to be). Reports p50 latency, peak traced allocation and json.dumps time.
+
+Usage: python -m benchmarks.projection [--k 5] [--rounds 200] [--repo PATH | corpus.json ...]
+"""
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+from benchmarks.corpus import load_corpus
+from benchmarks.hybrid_search import build_store, message_queries
+from git_log import iter_log_commits
+
+
+def measure(repo_id, queries, k, fields, rounds):
+    latencies, peaks, dumps = [], [], []
+    for n in range(rounds):
+        query = queries[n % len(queries)]
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = gitretrieval.retrieve_top_k(repo_id, query, k=k, fields=fields)
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        start = time.perf_counter()
+        json.dumps(results)
+        dumps.append(time.perf_counter() - start)
+    return np.median(latencies) * 1000, np.median(peaks) / 1024, np.median(dumps) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="projection-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits)
+    queries = [q for q, _ in message_queries(commits)]
+    # Warm the model and the index cache before timing anything.
+    gitretrieval.retrieve_top_k(repo_id, "warm up", k=args.k)
+
+    sizes = [len(c["diff"]) for c in commits]
+    print(f"{len(commits)} commits, diff bytes p50 {np.median(sizes):.0f} max {max(sizes)}, k={args.k}")
+    print(f"{'fields':<12} {'p50 ms':>8} {'peak KiB':>9} {'json ms':>8}")
+    variants = {
+        "metadata": gitretrieval.RESULT_FIELDS,
+        "+diff_ref": (*gitretrieval.RESULT_FIELDS, "diff_ref"),
+        "+diff": (*gitretrieval.RESULT_FIELDS, "diff"),
+    }
+    for name, fields in variants.items():
+        latency, peak, dump = measure(repo_id, queries, args.k, fields, args.rounds)
+        print(f"{name:<12} {latency:8.2f} {peak:9.1f} {dump:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
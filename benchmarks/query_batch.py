@@ -0,0 +1,77 @@
+"""N queries against one repo: N sequential retrieve_top_k calls vs one batched call, cold and warm query cache.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does. Each round runs
+--batch distinct queries (commit subject lines); "cold" clears the query-embedding
+cache before every round, "warm" leaves it filled. Reports p50/p99 latency per round.
+
+Usage: python -m benchmarks.query_batch [--batch 8] [--rounds 50] [--mode hybrid] [--repo PATH | corpus.json ...]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+from benchmarks.corpus import load_corpus
+from benchmarks.hybrid_search import build_store, message_queries
+from embedding_cache import QueryCache
+from git_log import iter_log_commits
+from lexical_index import SEARCH_MODES
+
+
+def run_rounds(label, rounds, batches, search, cold):
+    if not cold:
+        for batch in batches:
+            search(batch)
+    latencies = []
+    for n in range(rounds):
+        if cold:
+            gitretrieval.QUERY_CACHE = QueryCache()
+        start = time.perf_counter()
+        search(batches[n % len(batches)])
+        latencies.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{label:<22} {p50:9.2f} {p99:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default="hybrid", choices=SEARCH_MODES)
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="query-batch-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits)
+
+    queries = [q for q, _ in message_queries(commits)]
+    random.Random(0).shuffle(queries)
+    batches = [queries[i:i + args.batch] for i in range(0, len(queries) - args.batch + 1, args.batch)]
+    # Warm the model and the index cache before timing anything.
+    gitretrieval.retrieve_top_k(repo_id, "warm up", k=args.k)
+
+    def sequential(batch):
+        return [gitretrieval.retrieve_top_k(repo_id, q, k=args.k, mode=args.mode) for q in batch]
+
+    def batched(batch):
+        return gitretrieval.retrieve_top_k_many(repo_id, batch, k=args.k, mode=args.mode)
+
+    print(f"{len(commits)} commits, {args.batch} queries per round, mode={args.mode}")
+    print(f"{'round':<22} {'p50 ms':>9} {'p99 ms':>9}")
+    for cold in (True, False):
+        cache = "cold" if cold else "warm"
+        run_rounds(f"sequential, {cache} cache", args.rounds, batches, sequential, cold)
+        run_rounds(f"batched, {cache} cache", args.rounds, batches, batched, cold)
+
+
+if __name__ == "__main__":
+    main()
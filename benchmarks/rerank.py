@@ -0,0 +1,98 @@
+"""Second-stage re-ranking: added latency vs precision of the top k, per re-ranker and time budget.
+
+Builds a throwaway repo store as benchmarks/hybrid_search.py does and runs its
+line / identifier / message query sets through first-stage hybrid search alone,
+then with each re-ranker over the top RERANK_TOP_N at each --budget.
+Reports P@1 (the commit the LLM reads first is the right one), hit rate @k, MRR,
+p50/p95 latency and how many queries ran out of budget.
+
+Usage: python -m benchmarks.rerank [--k 5] [--budgets 50 150 1000] [--rerankers lexical cross-encoder]
+                                   [--max-queries 200] [--repo PATH | corpus.json ...]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+from git import Repo
+
+import gitretrieval
+from benchmarks.corpus import load_corpus, make_queries
+from benchmarks.hybrid_search import build_store, identifier_queries, message_queries
+from git_log import iter_log_commits
+from reranker import RERANK_TOP_N, RERANKERS, Reranker, get_cross_encoder
+
+
+def evaluate(repo_id, queries, hashes, k, mode, rerank, budget_ms):
+    gitretrieval.RERANKER = Reranker()
+    top1, hits, reciprocal, latencies = 0, 0, 0.0, []
+    for query, position in queries:
+        start = time.perf_counter()
+        results = gitretrieval.retrieve_top_k(repo_id, query, k=k, mode=mode, rerank=rerank, rerank_budget_ms=budget_ms)
+        latencies.append(time.perf_counter() - start)
+        found = [r["hash"] for r in results]
+        if hashes[position] in found:
+            rank = found.index(hashes[position])
+            top1 += rank == 0
+            hits += 1
+            reciprocal += 1.0 / (rank + 1)
+    n = len(queries)
+    exhausted = gitretrieval.RERANKER.stats()["budget_exhausted"]
+    return top1 / n, hits / n, reciprocal / n, np.percentile(latencies, [50, 95]) * 1000, exhausted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpora", nargs="*")
+    parser.add_argument("--repo", help="index this repository's history instead of the corpora")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default="hybrid")
+    parser.add_argument("--budgets", type=float, nargs="+", default=[50, 150, 1000], help="ms per query")
+    parser.add_argument("--rerankers", nargs="+", default=list(RERANKERS), choices=RERANKERS)
+    parser.add_argument("--max-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    source = iter_log_commits(Repo(args.repo)) if args.repo else load_corpus(args.corpora)
+    commits = list({c["hash"]: c for c in source}.values())
+    hashes = [c["hash"] for c in commits]
+    gitretrieval.DATA_DIR = tempfile.mkdtemp(prefix="rerank-")
+    repo_id = "bench"
+    build_store(gitretrieval.DATA_DIR, repo_id, commits)
+
+    rng = random.Random(0)
+    query_sets = {
+        "line": make_queries(commits),
+        "identifier": identifier_queries(commits),
+        "message": message_queries(commits),
+    }
+    # Warm the models and the index cache before timing anything; requests don't wait for a loading model.
+    if "cross-encoder" in args.rerankers:
+        get_cross_encoder()
+    for rerank in args.rerankers:
+        gitretrieval.retrieve_top_k(repo_id, "warm up", k=args.k, rerank=rerank, rerank_budget_ms=60000)
+
+    print(f"{len(commits)} commits, first stage {args.mode}, re-ranking the top {RERANK_TOP_N}")
+    print(
+        f"{'queries':<11} {'n':>5} {'reranker':<14} {'budget':>7} {'P@1':>6} {'hit@' + str(args.k):>7} "
+        f"{'MRR':>6} {'p50 ms':>8} {'p95 ms':>8} {'over':>5}"
+    )
+    for name, queries in query_sets.items():
+        if not queries:
+            continue
+        if len(queries) > args.max_queries:
+            queries = rng.sample(queries, args.max_queries)
+        runs = [("none", None)] + [(rerank, budget) for rerank in args.rerankers for budget in args.budgets]
+        for rerank, budget in runs:
+            p1, hit_rate, mrr, (p50, p95), exhausted = evaluate(
+                repo_id, queries, hashes, args.k, args.mode, None if rerank == "none" else rerank, budget or 0
+            )
+            budget_label = f"{budget:g}" if budget else "-"
+            print(
+                f"{name:<11} {len(queries):>5} {rerank:<14} {budget_label:>7} {p1:6.3f} {hit_rate:7.3f} "
+                f"{mrr:6.3f} {p50:8.2f} {p95:8.2f} {exhausted:>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Disk size and load time: legacy pretty-printed commits.json vs the binary commit store.
+
+The bundled corpora are replicated (with fresh hashes) up to --commits so the
+difference is visible at realistic history sizes.
+
+Usage: python -m benchmarks.store_format [--commits 20000] [--k 5]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.corpus import load_corpus
+from commit_store import (
+    append_commits,
+    append_embeddings,
+    append_row_ids,
+    commit_generation,
+    commit_id,
+    load_embeddings,
+    load_manifest,
+    read_commits,
+)
+
+DIM = 384
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    base = load_corpus()
+    rng = np.random.default_rng(0)
+    commits = []
+    for n in range(args.commits):
+        commit = dict(base[n % len(base)])
+        commit.pop("embedding", None)
+        # commit_id() keys on the leading 16 hex digits, so those must differ.
+        commit["hash"] = hashlib.sha1(str(n).encode()).hexdigest()
+        commits.append(commit)
+    vectors = rng.standard_normal((len(commits), DIM)).astype("float32")
+
+    legacy_dir = tempfile.mkdtemp(prefix="store-json-")
+    legacy_file = os.path.join(legacy_dir, "commits.json")
+    with open(legacy_file, "w") as f:
+        json.dump([dict(c, embedding=v.tolist()) for c, v in zip(commits, vectors)], f, indent=2)
+
+    store_dir = tempfile.mkdtemp(prefix="store-binary-")
+    for start in range(0, len(commits), 1000):
+        append_commits(store_dir, commits[start:start + 1000])
+    append_embeddings(store_dir, vectors)
+    append_row_ids(store_dir, [commit_id(c["hash"]) for c in commits])
+    # Readers only see published commits.
+    commit_generation(store_dir, load_manifest(store_dir))
+
+    positions = random.Random(0).sample(range(len(commits)), args.k)
+
+    def legacy_query_load():
+        with open(legacy_file) as f:
+            data = json.load(f)
+        return [data[p] for p in positions]
+
+    def binary_query_load():
+        load_embeddings(store_dir)
+        return read_commits(store_dir, [commit_id(commits[p]["hash"]) for p in positions])
+
+    _, legacy_seconds = timed(legacy_query_load)
+    fetched, binary_seconds = timed(binary_query_load)
+    assert len(fetched) == args.k
+    _, vectors_seconds = timed(lambda: np.array(load_embeddings(store_dir)))
+
+    print(f"{len(commits)} commits, fetching {args.k} per query")
+    print(f"json    {dir_size(legacy_dir) / 1e6:9.1f} MB  load+fetch {legacy_seconds * 1000:9.1f} ms")
+    print(f"binary  {dir_size(store_dir) / 1e6:9.1f} MB  load+fetch {binary_seconds * 1000:9.1f} ms  "
+          f"(full embedding matrix read: {vectors_seconds * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
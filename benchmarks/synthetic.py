@@ -0,0 +1,40 @@
+import os
+import random
+import subprocess
+import tempfile
+
+
+def make_synthetic_repo(num_commits: int, files: int = 50, path: str = None) -> str:
+    """Create a throwaway git repo with `num_commits` small commits via fast-import."""
+    path = path or tempfile.mkdtemp(prefix="synthetic-repo-")
+    subprocess.run(["git", "init", "-q", path], check=True)
+
+    rng = random.Random(0)
+    contents = {f"src/module_{i}.py": [f"value_{i} = 0\n"] for i in range(files)}
+
+    def stream():
+        for n in range(num_commits):
+            name = f"src/module_{rng.randrange(files)}.py"
+            lines = contents[name]
+            lines.insert(rng.randrange(len(lines) + 1), f"def func_{n}():\n    return {n}\n")
+            data = "".join(lines).encode()
+            message = f"Update {name}: add func_{n}\n".encode()
+
+            yield b"commit refs/heads/master\n"
+            yield f"mark :{n + 1}\n".encode()
+            yield f"committer Dev {n % 7} <dev{n % 7}@example.com> {1600000000 + n * 60} +0000\n".encode()
+            yield f"data {len(message)}\n".encode() + message
+            if n:
+                yield f"from :{n}\n".encode()
+            yield f"M 100644 inline {name}\n".encode()
+            yield f"data {len(data)}\n".encode() + data + b"\n"
+
+    proc = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=path, stdin=subprocess.PIPE)
+    for chunk in stream():
+        proc.stdin.write(chunk)
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError("git fast-import failed")
+
+    subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/master"], cwd=path, check=True)
+    return os.path.abspath(path)
@@ -0,0 +1,144 @@
+import os
+import re
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces, [CLS]/[SEP] included. Ingest
+# counts with the model's tokenizer; estimate_tokens alone undercounts, so
+# without it this leaves some headroom.
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "224"))
+MAX_HEADER_TOKENS = 48
+# Vendored files and mass reformatting can produce thousands of hunks;
+# beyond this many chunks a commit stops getting more retrievable.
+MAX_CHUNKS_PER_COMMIT = int(os.getenv("MAX_CHUNKS_PER_COMMIT", "32"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_FILE_RE = re.compile(r"^diff --git a/(.*?) b/(.*)$", re.MULTILINE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap word-piece estimate: one token per word or punctuation mark."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The start of `text` up to its first max_tokens tokens (estimate_tokens)."""
+    for count, match in enumerate(_TOKEN_RE.finditer(text)):
+        if count == max_tokens:
+            return text[: match.start()].rstrip()
+    return text
+
+
+def _count(texts, count_tokens=None):
+    """Token counts of texts: count_tokens(texts) if given (e.g. a model tokenizer), else estimate_tokens."""
+    if count_tokens is None:
+        return [estimate_tokens(text) for text in texts]
+    return list(count_tokens(texts))
+
+
+def _truncate(text: str, max_tokens: int, count_tokens=None) -> str:
+    """The longest start of `text`, cut between estimate_tokens tokens, within max_tokens counted tokens."""
+    if count_tokens is None:
+        return truncate_tokens(text, max_tokens)
+    if _count([text], count_tokens)[0] <= max_tokens:
+        return text
+    # A word or mark is at least one word piece, so the cut is within max_tokens estimated tokens.
+    low, high = 0, max_tokens
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _count([truncate_tokens(text, mid)], count_tokens)[0] <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return truncate_tokens(text, low)
+
+
+def split_diff_files(diff: str):
+    """Split a `git log --patch` diff into (path, section) pairs, one per file."""
+    starts = list(_FILE_RE.finditer(diff))
+    if not starts:
+        return [("", diff)] if diff.strip() else []
+
+    files = []
+    for n, match in enumerate(starts):
+        end = starts[n + 1].start() if n + 1 < len(starts) else len(diff)
+        files.append((match.group(2), diff[match.start():end]))
+    return files
+
+
+def diff_paths(diff: str):
+    """Distinct paths a diff touches; a rename contributes both its old and new path."""
+    paths = {}
+    for match in _FILE_RE.finditer(diff):
+        paths.setdefault(match.group(1), None)
+        paths.setdefault(match.group(2), None)
+    return list(paths)
+
+
+def split_hunks(section: str):
+    """Split one file's diff section into hunks, dropping the file header lines."""
+    hunks = []
+    current = None
+    for line in section.splitlines(keepends=True):
+        if line.startswith("@@"):
+            if current:
+                hunks.append("".join(current))
+            current = [line]
+        elif current is not None:
+            current.append(line)
+    if current:
+        hunks.append("".join(current))
+    return hunks
+
+
+def _split_lines(text: str, max_tokens: int, count_tokens=None):
+    """Split an oversized hunk on line boundaries into (piece, tokens) pairs under max_tokens."""
+    pieces = []
+    current = []
+    used = 0
+    lines = text.splitlines(keepends=True)
+    for line, tokens in zip(lines, _count(lines, count_tokens)):
+        if tokens > max_tokens:
+            line = _truncate(line, max_tokens - 1, count_tokens) + "\n"
+            tokens = _count([line], count_tokens)[0]
+        if current and used + tokens > max_tokens:
+            pieces.append(("".join(current), used))
+            current = []
+            used = 0
+        current.append(line)
+        used += tokens
+    if current:
+        pieces.append(("".join(current), used))
+    return pieces
+
+
+def chunk_commit(commit, max_tokens: int = MAX_CHUNK_TOKENS, count_tokens=None):
+    """Split a commit into embedding-sized texts: message + file path + packed hunks.
+
+    count_tokens maps a list of texts to their token counts; pass the embedding model's
+    (SharedEmbedder.count_tokens) so chunks fit what it reads. Counts are summed per
+    line, which holds for tokenizers that split on whitespace first, as WordPiece does.
+    """
+    message = _truncate(commit["message"], MAX_HEADER_TOKENS, count_tokens)
+    files = split_diff_files(commit.get("diff", ""))
+    if not files:
+        return [message]
+
+    chunks = []
+    for path, section in files:
+        header = f"{message}\n{path}\n"
+        budget = max(max_tokens - _count([header], count_tokens)[0], 16)
+
+        hunks = split_hunks(section) or [section]
+        current = []
+        used = 0
+        for hunk in hunks:
+            for piece, tokens in _split_lines(hunk, budget, count_tokens):
+                if current and used + tokens > budget:
+                    chunks.append(header + "".join(current))
+                    current = []
+                    used = 0
+                current.append(piece)
+                used += tokens
+        if current:
+            chunks.append(header + "".join(current))
+
+    return chunks[:MAX_CHUNKS_PER_COMMIT]
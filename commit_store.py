@@ -0,0 +1,893 @@
+import os
+import fcntl
+import json
+import shutil
+import sqlite3
+from contextlib import closing, contextmanager
+import numpy as np
+import faiss
+
+from chunking import diff_paths
+from lexical_index import (
+    LEXICAL_TABLE_SQL,
+    LEXICAL_VOCAB_SQL,
+    LEXICAL_WEIGHTS,
+    lexical_fields,
+    match_expression,
+    query_terms,
+    selective_terms,
+)
+from search_filters import commit_timestamp, filter_clause
+from vector_index import (
+    build_index,
+    mapped_bytes,
+    plan_segments,
+    read_flags,
+    segment_kind,
+    segment_name,
+    segment_rows,
+)
+
+# Per-repo layout:
+#   commits.sqlite  one row per commit, keyed by store position, plus a meta table,
+#                   an FTS5 table `lexical` (rowid = commit id) for keyword search
+#                   and `commit_paths` (touched path, commit id) for path filters
+#   diffs.bin       concatenated UTF-8 diffs, addressed by (offset, length) from the row
+#   embeddings.f32  raw float32 matrix, one row per chunk vector
+#   row_ids.bin     one little-endian int64 per embedding row: the owning commit id
+#                   (both renamed embeddings.<generation>.f32 / row_ids.<generation>.bin
+#                   once a compaction or re-embed has rewritten them; the manifest names them)
+#   segments/       ID-mapped FAISS indexes over runs of embedding rows; search returns commit ids
+#   manifest.json   the committed generation: valid lengths of all of the above
+#   .lock           flock()ed by the one writer (ingest or migration) at a time
+# Writers only append, then publish by atomically replacing the manifest;
+# readers never look past the manifest, so a crash mid-write is invisible.
+# Readers never write, not even to migrate an old layout: see migrate_legacy.
+# Dropped commits (force-pushes) are tombstoned by id: staged with the next
+# generation, applied once it is published, and filtered out at search time
+# until compaction rewrites the matrix without their vectors.
+STORE_FILE = "commits.sqlite"
+DIFFS_FILE = "diffs.bin"
+EMBEDDINGS_FILE = "embeddings.f32"
+ROW_IDS_FILE = "row_ids.bin"
+SEGMENTS_DIR = "segments"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+# Vectors published in one generation are indexed in segments of at most this many rows,
+# so publishing needs memory for that many (about 25 MB at 384 dims), however long the ingest.
+SEGMENT_MAX_ROWS = int(os.getenv("SEGMENT_MAX_ROWS", "16384"))
+# Segments are compacted once a repo has more than this many outside the compaction plan.
+MAX_SEGMENTS = int(os.getenv("MAX_SEGMENTS", "16"))
+# Memory one segment build in compaction may take: merged segments are split to stay under it.
+# Training an IVF-PQ segment of IVFPQ_MIN_ROWS takes about 1.2 GB, so under a smaller cap
+# repos that large are served by several HNSW segments instead.
+COMPACT_MAX_MB = int(os.getenv("COMPACT_MAX_MB", "1024"))
+
+LEGACY_COMMITS_FILE = "commits.json"
+LEGACY_INDEX_FILE = "faiss.index"
+
+METADATA_FIELDS = ("hash", "author", "email", "date", "message")
+# What read_commits can project: metadata, the diff text, or "diff_ref", the diff's
+# [offset, length] in the blob file for read_diff() when a caller needs it later.
+COMMIT_FIELDS = METADATA_FIELDS + ("diff", "diff_ref")
+
+# Bump when _connect's tables, columns or indexes change, so existing stores get the DDL again.
+SCHEMA_VERSION = 2
+
+# Tables derived from commit text (keyword index, touched paths). Bump when what they
+# hold changes; stores built by an older version are rebuilt on next use.
+SEARCH_TABLES_VERSION = "2"
+
+
+def commit_id(commit_hash: str) -> int:
+    """Stable 63-bit FAISS id for a commit: the leading 64 bits of its sha, sign bit cleared."""
+    return int(commit_hash[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+
+def _connect(repo_dir: str):
+    conn = sqlite3.connect(os.path.join(repo_dir, STORE_FILE))
+    # Stores already at the current schema skip the DDL below: one statement per connection.
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return conn
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS commits (
+            position INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,
+            author TEXT,
+            email TEXT,
+            date TEXT,
+            message TEXT,
+            diff_offset INTEGER NOT NULL,
+            diff_length INTEGER NOT NULL,
+            commit_id INTEGER,
+            timestamp INTEGER
+        )
+        """
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS commits_commit_id ON commits (commit_id)")
+    # Sorted columns behind metadata filters.
+    conn.execute("CREATE INDEX IF NOT EXISTS commits_author ON commits (author COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS commits_email ON commits (email COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS commits_timestamp ON commits (timestamp)")
+    conn.execute("CREATE TABLE IF NOT EXISTS commit_paths (path TEXT NOT NULL, commit_id INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS commit_paths_path ON commit_paths (path, commit_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS commit_paths_commit_id ON commit_paths (commit_id)")
+    # A removal, published with `generation` (NULL while staged), of the commit's rows
+    # before store position `before_position` and its vectors before `before_row`.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tombstones (
+            commit_id INTEGER PRIMARY KEY,
+            generation INTEGER,
+            before_position INTEGER NOT NULL DEFAULT 0,
+            before_row INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    if "generation" not in {row[1] for row in conn.execute("PRAGMA table_info(tombstones)")}:
+        # Version 1 applied removals at once and unlinked their vectors (id -1): its
+        # tombstones count as published with the first generation.
+        for column in (
+            "generation INTEGER DEFAULT 1",
+            "before_position INTEGER NOT NULL DEFAULT 0",
+            "before_row INTEGER NOT NULL DEFAULT 0",
+        ):
+            try:
+                conn.execute(f"ALTER TABLE tombstones ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # Another connection upgraded it first.
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(LEXICAL_TABLE_SQL)
+    conn.execute(LEXICAL_VOCAB_SQL)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def _legacy_commits(repo_dir: str):
+    with open(os.path.join(repo_dir, LEGACY_COMMITS_FILE), "r") as f:
+        yield from json.load(f)
+
+
+@contextmanager
+def repo_lock(repo_dir: str):
+    """Hold the repo's writer lock: one ingest or migration at a time, across threads and processes."""
+    os.makedirs(repo_dir, exist_ok=True)
+    with open(os.path.join(repo_dir, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def needs_migration(repo_dir: str) -> bool:
+    """True for a repo dir still in a pre-store layout (commits.json + faiss.index), which readers can't serve."""
+    return not os.path.exists(os.path.join(repo_dir, MANIFEST_FILE)) and os.path.exists(
+        os.path.join(repo_dir, LEGACY_COMMITS_FILE)
+    )
+
+
+def migrate_legacy(repo_dir: str) -> bool:
+    """Convert a commits.json + faiss.index repo dir into the binary store. Returns True if converted.
+
+    Call it holding repo_lock(repo_dir): migrate_data.py, app startup and ingest do. The
+    whole store is built aside and moved in with the manifest last, so readers see either
+    the old layout (and report it needs migrating) or the complete new one; an interrupted
+    migration is simply redone. The legacy files are left in place, unread once the
+    manifest exists, until finalize_migration removes them.
+    """
+    if not needs_migration(repo_dir):
+        return False
+    work_dir = os.path.join(repo_dir, ".migrating")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    # Legacy rows are one vector per commit, in file order. Index rows are the source
+    # of truth; inline JSON embeddings are only used when there is no index. Commits
+    # past the last vector (a crash between the two legacy writes) are left for the
+    # next ingest to embed rather than stored without one.
+    index_file = os.path.join(repo_dir, LEGACY_INDEX_FILE)
+    index = faiss.read_index(index_file) if os.path.exists(index_file) else None
+    inline_embeddings = []
+    ids = []
+    count = 0
+    batch = []
+    for commit in _legacy_commits(repo_dir):
+        embedding = commit.pop("embedding", None)
+        if index is not None:
+            if count + len(batch) >= index.ntotal:
+                break
+        elif embedding is None:
+            break
+        else:
+            inline_embeddings.append(embedding)
+        batch.append(commit)
+        ids.append(commit_id(commit["hash"]))
+        if len(batch) >= 1000:
+            append_commits(work_dir, batch)
+            count += len(batch)
+            batch = []
+    append_commits(work_dir, batch)
+    count += len(batch)
+
+    if count:
+        if index is not None:
+            append_embeddings(work_dir, index.reconstruct_n(0, count))
+        else:
+            append_embeddings(work_dir, np.asarray(inline_embeddings, dtype="float32"))
+        append_row_ids(work_dir, ids)
+    commit_generation(work_dir, load_manifest(work_dir))
+
+    for name in (DIFFS_FILE, EMBEDDINGS_FILE, ROW_IDS_FILE, STORE_FILE, SEGMENTS_DIR, MANIFEST_FILE):
+        target = os.path.join(repo_dir, name)
+        if os.path.isdir(target):
+            # Left by an interrupted migration; nothing reads it without a manifest.
+            shutil.rmtree(target)
+        if os.path.exists(os.path.join(work_dir, name)):
+            os.replace(os.path.join(work_dir, name), target)
+    shutil.rmtree(work_dir)
+    print(f"Migrated {count} commits in {repo_dir} to {STORE_FILE}")
+    return True
+
+
+def finalize_migration(repo_dir: str) -> bool:
+    """Delete a migrated repo dir's commits.json and faiss.index. Returns True if any were removed.
+
+    Only once the store is published: before that they are the only copy.
+    """
+    if not os.path.exists(os.path.join(repo_dir, MANIFEST_FILE)):
+        return False
+    removed = False
+    for name in (LEGACY_COMMITS_FILE, LEGACY_INDEX_FILE):
+        if os.path.exists(os.path.join(repo_dir, name)):
+            os.remove(os.path.join(repo_dir, name))
+            removed = True
+    return removed
+
+
+def has_commits(repo_dir: str) -> bool:
+    return any(
+        os.path.exists(os.path.join(repo_dir, name))
+        for name in (MANIFEST_FILE, LEGACY_COMMITS_FILE)
+    )
+
+
+def count_stored_commits(repo_dir: str) -> int:
+    committed = load_manifest(repo_dir)["commits"]
+    with closing(_connect(repo_dir)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM commits WHERE position < ?", (committed,)).fetchone()[0]
+
+
+def load_known_hashes(repo_dir: str):
+    committed = load_manifest(repo_dir)["commits"]
+    with closing(_connect(repo_dir)) as conn:
+        return {row[0] for row in conn.execute("SELECT hash FROM commits WHERE position < ?", (committed,))}
+
+
+def _read_blob(f, offset: int, length: int) -> str:
+    if not length:
+        return ""
+    f.seek(offset)
+    return f.read(length).decode("utf-8", errors="ignore")
+
+
+def read_diff(repo_dir: str, offset: int, length: int) -> str:
+    """Read one diff from the blob file; nothing else is loaded."""
+    with open(os.path.join(repo_dir, DIFFS_FILE), "rb") as f:
+        return _read_blob(f, offset, length)
+
+
+_COLUMNS = f"commit_id, {', '.join(METADATA_FIELDS)}, diff_offset, diff_length"
+
+
+def _row_to_commit(row, diffs):
+    commit = dict(zip(METADATA_FIELDS, row[1:6]))
+    if diffs is not None:
+        commit["diff"] = _read_blob(diffs, row[6], row[7])
+    return commit
+
+
+def _open_diffs(repo_dir: str, with_diff: bool):
+    if not with_diff:
+        return open(os.devnull, "rb")
+    return open(os.path.join(repo_dir, DIFFS_FILE), "rb")
+
+
+def iter_stored_commits(repo_dir: str, with_diff: bool = True):
+    """Yield committed commits one at a time, in position order."""
+    committed = load_manifest(repo_dir)["commits"]
+    if not committed:
+        return
+    with closing(_connect(repo_dir)) as conn, _open_diffs(repo_dir, with_diff) as diffs:
+        query = f"SELECT {_COLUMNS} FROM commits WHERE position < ? ORDER BY position"
+        for row in conn.execute(query, (committed,)):
+            yield _row_to_commit(row, diffs if with_diff else None)
+
+
+def _next_position(conn) -> int:
+    # A counter, not MAX(position) + 1: once the newest commits are removed, a position
+    # below the committed count would be handed out again, and recover() would keep an
+    # uncommitted row there whose diff and vectors it had cut off.
+    row = conn.execute("SELECT value FROM meta WHERE key = 'next_position'").fetchone()
+    highest = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM commits").fetchone()[0]
+    return max(int(row[0]) if row else 0, highest)
+
+
+def append_commits(repo_dir: str, commits):
+    """Append commits: diffs to the blob file, metadata to SQLite.
+
+    Positions follow append order and are never reused, even for removed commits.
+    """
+    diffs_file = os.path.join(repo_dir, DIFFS_FILE)
+    with closing(_connect(repo_dir)) as conn, open(diffs_file, "ab") as f:
+        position = _next_position(conn)
+        fresh = position == 0
+        offset = f.tell()
+        rows = []
+        lexical_rows = []
+        path_rows = []
+        for commit in commits:
+            diff = commit.get("diff", "").encode("utf-8")
+            f.write(diff)
+            rows.append((
+                position,
+                *(commit.get(field) for field in METADATA_FIELDS),
+                offset,
+                len(diff),
+                commit_id(commit["hash"]),
+                commit_timestamp(commit.get("date")),
+            ))
+            lexical_rows.append((commit_id(commit["hash"]), *lexical_fields(commit)))
+            path_rows.extend((path, commit_id(commit["hash"])) for path in diff_paths(commit.get("diff", "")))
+            position += 1
+            offset += len(diff)
+        f.flush()
+        with conn:
+            conn.executemany("INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO lexical (rowid, message, paths, diff) VALUES (?, ?, ?, ?)", lexical_rows)
+            conn.executemany("INSERT INTO commit_paths VALUES (?, ?)", path_rows)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('next_position', ?)", (str(position),))
+            if fresh:
+                # A new store is indexed from its first commit; no rebuild needed.
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('search_tables', ?)", (SEARCH_TABLES_VERSION,))
+
+
+def check_fields(fields):
+    unknown = [f for f in fields if f not in COMMIT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown commit fields: {', '.join(map(str, unknown))}; expected {', '.join(COMMIT_FIELDS)}")
+
+
+def read_commits(repo_dir: str, commit_ids, fields=METADATA_FIELDS + ("diff",)):
+    """Return {commit id: commit} for the requested ids only, with just `fields` (see COMMIT_FIELDS).
+
+    Diffs are only read from the blob file if "diff" is asked for.
+    """
+    check_fields(fields)
+    wanted = sorted(set(int(i) for i in commit_ids))
+    if not wanted:
+        return {}
+    metadata = [f for f in METADATA_FIELDS if f in fields]
+    columns = ", ".join(["commit_id", *metadata, "diff_offset", "diff_length"])
+    committed = load_manifest(repo_dir)["commits"]
+    rows = []
+    with closing(_connect(repo_dir)) as conn:
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            rows.extend(conn.execute(
+                f"SELECT {columns} FROM commits WHERE position < ? AND commit_id IN ({','.join('?' * len(chunk))})",
+                (committed, *chunk),
+            ).fetchall())
+
+    commits = {}
+    with _open_diffs(repo_dir, "diff" in fields) as diffs:
+        for row in rows:
+            commit = dict(zip(metadata, row[1:-2]))
+            offset, length = row[-2:]
+            if "diff" in fields:
+                commit["diff"] = _read_blob(diffs, offset, length)
+            if "diff_ref" in fields:
+                commit["diff_ref"] = [offset, length]
+            commits[row[0]] = commit
+    return commits
+
+
+def remove_commits(repo_dir: str, hashes) -> int:
+    """Stage the removal of commits (e.g. rewritten by a force-push) with the next generation.
+
+    Nothing changes for readers until commit_generation publishes it; then the commits'
+    rows are deleted and their vectors filtered out at search time until compaction
+    drops them. An unpublished removal is discarded by recover(). Returns how many of
+    the commits are stored.
+    """
+    ids = [commit_id(h) for h in hashes]
+    if not ids:
+        return 0
+    manifest = load_manifest(repo_dir)
+    with closing(_connect(repo_dir)) as conn, conn:
+        removed = 0
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            removed += conn.execute(
+                f"SELECT COUNT(*) FROM commits WHERE position < ? AND commit_id IN ({','.join('?' * len(chunk))})",
+                (manifest["commits"], *chunk),
+            ).fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO tombstones VALUES (?, NULL, ?, ?)",
+            [(i, manifest["commits"], manifest["rows"]) for i in ids],
+        )
+    return removed
+
+
+# Tombstones in effect for a manifest: published with it or before, and not yet reclaimed by compaction.
+_LIVE_TOMBSTONES = "generation > ? AND generation <= ?"
+
+
+def _live(manifest):
+    return manifest.get("reclaimed", 0), manifest["generation"]
+
+
+# Between a removal's manifest swap and _apply_tombstones, the removed commits' rows are still there.
+_NOT_REMOVED = f"commits.commit_id NOT IN (SELECT commit_id FROM tombstones WHERE {_LIVE_TOMBSTONES})"
+
+
+def _apply_tombstones(repo_dir: str, manifest):
+    """Delete the rows of commits removed by the published tombstones. Idempotent, so recover() can redo it."""
+    with closing(_connect(repo_dir)) as conn, conn:
+        # Not a commit re-added after its removal: that one sits at a later position.
+        ids = [row[0] for row in conn.execute(
+            f"""
+            SELECT commit_id FROM commits JOIN tombstones USING (commit_id)
+            WHERE commits.position < tombstones.before_position AND {_LIVE_TOMBSTONES}
+            """,
+            _live(manifest),
+        )]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM commits WHERE commit_id IN ({marks})", chunk)
+            conn.execute(f"DELETE FROM lexical WHERE rowid IN ({marks})", chunk)
+            conn.execute(f"DELETE FROM commit_paths WHERE commit_id IN ({marks})", chunk)
+
+
+def load_tombstones(repo_dir: str, manifest=None):
+    """Ids of the commits removed as of `manifest` (default: the committed one) whose vectors are still indexed."""
+    manifest = manifest or load_manifest(repo_dir)
+    with closing(_connect(repo_dir)) as conn:
+        rows = conn.execute(f"SELECT commit_id FROM tombstones WHERE {_LIVE_TOMBSTONES}", _live(manifest))
+        return np.array([row[0] for row in rows], dtype="int64")
+
+
+def search_tables_ready(repo_dir: str) -> bool:
+    """True if the keyword index and path table are current (see ensure_search_tables)."""
+    with closing(_connect(repo_dir)) as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'search_tables'").fetchone()
+    return bool(row) and row[0] == SEARCH_TABLES_VERSION
+
+
+def ensure_search_tables(repo_dir: str) -> bool:
+    """(Re)build the keyword index and path table of a store written by an older SEARCH_TABLES_VERSION.
+
+    Writers only (ingest, migrate_data.py). Returns True if they were rebuilt.
+    """
+    if search_tables_ready(repo_dir):
+        return False
+    with closing(_connect(repo_dir)) as conn:
+        # Hold the write lock throughout, so commits appended meanwhile can't be missed.
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'search_tables'").fetchone()
+        if row and row[0] == SEARCH_TABLES_VERSION:
+            conn.rollback()
+            return False
+        conn.execute("DELETE FROM lexical")
+        conn.execute("DELETE FROM commit_paths")
+        count = 0
+        with _open_diffs(repo_dir, with_diff=os.path.exists(os.path.join(repo_dir, DIFFS_FILE))) as diffs:
+            for row in conn.execute(f"SELECT {_COLUMNS} FROM commits ORDER BY position").fetchall():
+                commit = _row_to_commit(row, diffs)
+                conn.execute(
+                    "INSERT INTO lexical (rowid, message, paths, diff) VALUES (?, ?, ?, ?)",
+                    (row[0], *lexical_fields(commit)),
+                )
+                conn.executemany(
+                    "INSERT INTO commit_paths VALUES (?, ?)", [(path, row[0]) for path in diff_paths(commit["diff"])]
+                )
+                count += 1
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('search_tables', ?)", (SEARCH_TABLES_VERSION,))
+        conn.commit()
+    if count:
+        print(f"Built keyword index and path table over {count} commits in {repo_dir}")
+    return True
+
+
+def filter_commit_ids(repo_dir: str, filters):
+    """Ids of the committed commits matching parsed search filters, sorted."""
+    manifest = load_manifest(repo_dir)
+    clause, params = filter_clause(filters)
+    with closing(_connect(repo_dir)) as conn:
+        rows = conn.execute(
+            # Unary + keeps the planner off the position key, which matches almost every row,
+            # and on the filter's own indexes.
+            f"SELECT commit_id FROM commits WHERE +position < ? AND {clause} AND {_NOT_REMOVED}",
+            (manifest["commits"], *params, *_live(manifest)),
+        ).fetchall()
+    return np.sort(np.array([row[0] for row in rows], dtype="int64"))
+
+
+def search_lexical_many(repo_dir: str, queries, k: int, filters=None):
+    """BM25 keyword search over committed commits matching `filters`.
+
+    Returns one [(commit id, score)] ranking per query, best first.
+    """
+    manifest = load_manifest(repo_dir)
+    committed = manifest["commits"]
+    clause, params = filter_clause(filters or {})
+    weights = ", ".join(str(w) for w in LEXICAL_WEIGHTS)
+    rankings = []
+    with closing(_connect(repo_dir)) as conn:
+        for query in queries:
+            terms = query_terms(query)
+            if not terms:
+                rankings.append([])
+                continue
+            doc_counts = dict(conn.execute(
+                f"SELECT term, doc FROM lexical_vocab WHERE term IN ({','.join('?' * len(terms))})", terms
+            ).fetchall())
+            expression = match_expression(selective_terms(terms, doc_counts, committed))
+            rows = conn.execute(
+                f"""
+                SELECT lexical.rowid, -bm25(lexical, {weights}) AS score
+                FROM lexical JOIN commits ON commits.commit_id = lexical.rowid
+                WHERE lexical MATCH ? AND commits.position < ? AND {clause} AND {_NOT_REMOVED}
+                ORDER BY score DESC LIMIT ?
+                """,
+                (expression, committed, *params, *_live(manifest), k),
+            ).fetchall()
+            rankings.append([(int(cid), float(score)) for cid, score in rows])
+    return rankings
+
+
+def read_lexical_fields(repo_dir: str, commit_ids):
+    """{commit id: (message, paths, diff)} as indexed for keyword search, for the requested ids."""
+    wanted = sorted(set(int(i) for i in commit_ids))
+    fields = {}
+    with closing(_connect(repo_dir)) as conn:
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            for row in conn.execute(
+                f"SELECT rowid, message, paths, diff FROM lexical WHERE rowid IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                fields[row[0]] = row[1:]
+    return fields
+
+
+def _matrix_path(repo_dir: str, manifest, key: str) -> str:
+    """Path of the manifest's embedding matrix ("embeddings") or row id file ("row_ids")."""
+    return os.path.join(repo_dir, manifest[key])
+
+
+def _is_matrix_file(name: str) -> bool:
+    return name.startswith(("embeddings.", "row_ids.")) and name.endswith((".f32", ".bin", ".tmp"))
+
+
+def _dim(repo_dir: str, manifest) -> int:
+    if manifest.get("dim"):
+        return manifest["dim"]
+    with closing(_connect(repo_dir)) as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def append_embeddings(repo_dir: str, vectors):
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    if not len(vectors):
+        return
+    with closing(_connect(repo_dir)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(vectors.shape[1]),))
+    with open(_matrix_path(repo_dir, load_manifest(repo_dir), "embeddings"), "ab") as f:
+        vectors.tofile(f)
+
+
+def load_embeddings(repo_dir: str, mmap: bool = True, manifest=None):
+    """Return the (rows, dim) float32 embedding matrix of `manifest` (default: the committed one).
+
+    Memory-mapped read-only by default. Rows past manifest["rows"] are uncommitted.
+    """
+    manifest = manifest or load_manifest(repo_dir)
+    path = _matrix_path(repo_dir, manifest, "embeddings")
+    dim = _dim(repo_dir, manifest)
+    if not dim or not os.path.exists(path) or not os.path.getsize(path):
+        return np.empty((0, dim), dtype="float32")
+    if mmap:
+        return np.memmap(path, dtype="<f4", mode="r").reshape(-1, dim)
+    return np.fromfile(path, dtype="<f4").reshape(-1, dim)
+
+
+def _map_rows(repo_dir: str, manifest, dim: int, start: int, end: int):
+    """A read-only map of embedding rows [start, end) alone: once dropped, the pages read go with it."""
+    return np.memmap(
+        _matrix_path(repo_dir, manifest, "embeddings"), dtype="<f4", mode="r", offset=start * dim * 4, shape=(end - start, dim)
+    )
+
+
+def rewrite_matrix(repo_dir: str, generation: int, batches):
+    """Write (vectors, commit ids) batches, in row order, as a new embedding matrix and row id file.
+
+    The files are named for `generation` and nothing reads them until a manifest names
+    them: returns the manifest fields to publish them with (see compact).
+    """
+    matrix = {"embeddings": f"embeddings.{generation:08d}.f32", "row_ids": f"row_ids.{generation:08d}.bin"}
+    rows = 0
+    dim = None
+    with open(_matrix_path(repo_dir, matrix, "embeddings"), "wb") as vectors_file, open(
+        _matrix_path(repo_dir, matrix, "row_ids"), "wb"
+    ) as ids_file:
+        for vectors, ids in batches:
+            vectors = np.ascontiguousarray(vectors, dtype="<f4")
+            if not len(vectors):
+                continue
+            dim = vectors.shape[1]
+            vectors.tofile(vectors_file)
+            np.asarray(ids, dtype="<i8").tofile(ids_file)
+            rows += len(vectors)
+        for f in (vectors_file, ids_file):
+            f.flush()
+            os.fsync(f.fileno())
+    return dict(matrix, rows=rows, dim=dim)
+
+
+def append_row_ids(repo_dir: str, commit_ids):
+    with open(_matrix_path(repo_dir, load_manifest(repo_dir), "row_ids"), "ab") as f:
+        np.asarray(commit_ids, dtype="<i8").tofile(f)
+
+
+def load_row_ids(repo_dir: str, rows: int, start: int = 0, manifest=None):
+    """Commit ids of embedding rows [start, rows) of `manifest`'s matrix (default: the committed one)."""
+    path = _matrix_path(repo_dir, manifest or load_manifest(repo_dir), "row_ids")
+    if not os.path.exists(path) or rows <= start:
+        return np.empty(0, dtype="<i8")
+    return np.fromfile(path, dtype="<i8", count=rows - start, offset=start * 8)
+
+
+def _fsync(path: str):
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+
+
+def _write_json_atomic(path: str, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def load_manifest(repo_dir: str):
+    """Return the last committed generation: how much of each append-only file is valid.
+
+    Raises ValueError for a repo dir that needs migrating first (see migrate_legacy).
+    """
+    try:
+        with open(os.path.join(repo_dir, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    if manifest is None:
+        if needs_migration(repo_dir):
+            raise ValueError("Repo is stored in the old commits.json layout; run migrate_data.py or /embed-repo to migrate it.")
+        # Nothing committed yet.
+        manifest = {
+            "generation": 0,
+            "commits": 0,
+            "rows": 0,
+            "diff_bytes": 0,
+            "segments": [],
+            "heads": [],
+            "model": None,
+        }
+    # Older manifests predate these: the original file names, nothing reclaimed yet.
+    manifest.setdefault("embeddings", EMBEDDINGS_FILE)
+    manifest.setdefault("row_ids", ROW_IDS_FILE)
+    manifest.setdefault("reclaimed", 0)
+    return manifest
+
+
+def recover(repo_dir: str, manifest):
+    """Cut every append-only file back to the committed generation, dropping a crashed write.
+
+    A removal or compaction is finished if its generation was published and discarded if not.
+    """
+    with closing(_connect(repo_dir)) as conn, conn:
+        for table, column in (("lexical", "rowid"), ("commit_paths", "commit_id")):
+            conn.execute(
+                f"DELETE FROM {table} WHERE {column} IN (SELECT commit_id FROM commits WHERE position >= ?)",
+                (manifest["commits"],),
+            )
+        conn.execute("DELETE FROM commits WHERE position >= ?", (manifest["commits"],))
+        conn.execute(
+            "DELETE FROM tombstones WHERE generation IS NULL OR generation > ? OR generation <= ?",
+            (manifest["generation"], manifest["reclaimed"]),
+        )
+    _apply_tombstones(repo_dir, manifest)
+    dim = _dim(repo_dir, manifest)
+
+    for name, size in (
+        (DIFFS_FILE, manifest["diff_bytes"]),
+        (manifest["embeddings"], manifest["rows"] * dim * 4),
+        (manifest["row_ids"], manifest["rows"] * 8),
+    ):
+        path = os.path.join(repo_dir, name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+    # A matrix a published compaction replaced, or one written for an unpublished one.
+    for name in os.listdir(repo_dir):
+        if _is_matrix_file(name) and name not in (manifest["embeddings"], manifest["row_ids"]):
+            os.remove(os.path.join(repo_dir, name))
+
+    segments_dir = os.path.join(repo_dir, SEGMENTS_DIR)
+    if os.path.isdir(segments_dir):
+        live = {os.path.basename(s) for s in manifest["segments"]}
+        for name in os.listdir(segments_dir):
+            if name not in live:
+                os.remove(os.path.join(segments_dir, name))
+
+
+def _write_segment(repo_dir: str, manifest, generation: int, dim: int, start: int, end: int, kind: str = None) -> str:
+    """Index rows [start, end) of `manifest`'s matrix into a new segment file; returns its path within the repo dir."""
+    vectors = _map_rows(repo_dir, manifest, dim, start, end)
+    index, kind = build_index(vectors, load_row_ids(repo_dir, end, start, manifest), kind)
+    del vectors
+    os.makedirs(os.path.join(repo_dir, SEGMENTS_DIR), exist_ok=True)
+    segment = os.path.join(SEGMENTS_DIR, segment_name(generation, start, end, kind))
+    path = os.path.join(repo_dir, segment)
+    faiss.write_index(index, path + ".tmp")
+    _fsync(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return segment
+
+
+def _compaction_plan(manifest, dim: int):
+    return plan_segments(manifest["rows"], dim, COMPACT_MAX_MB * 1024 * 1024)
+
+
+def commit_generation(repo_dir: str, manifest, heads=None, model=None):
+    """Publish everything appended or removed since `manifest` as one new generation via an atomic manifest swap.
+
+    Vectors appended since `manifest` get segments of their own, SEGMENT_MAX_ROWS rows at most,
+    of the index type their count calls for. Staged removals are applied once it is published.
+    """
+    generation = manifest["generation"] + 1
+    segments = list(manifest["segments"])
+    row_ids_file = _matrix_path(repo_dir, manifest, "row_ids")
+    rows, dim = load_embeddings(repo_dir, manifest=manifest).shape
+    rows = min(rows, os.path.getsize(row_ids_file) // 8 if os.path.exists(row_ids_file) else 0)
+    for start in range(manifest["rows"], rows, SEGMENT_MAX_ROWS):
+        segments.append(_write_segment(repo_dir, manifest, generation, dim, start, min(start + SEGMENT_MAX_ROWS, rows)))
+    rows = max(rows, manifest["rows"])
+
+    for name in (DIFFS_FILE, manifest["embeddings"], manifest["row_ids"]):
+        _fsync(os.path.join(repo_dir, name))
+    with closing(_connect(repo_dir)) as conn, conn:
+        commits = _next_position(conn)
+        # Stamped before the swap, so recover() can tell whether they were published.
+        conn.execute("UPDATE tombstones SET generation = ? WHERE generation IS NULL", (generation,))
+
+    diffs_file = os.path.join(repo_dir, DIFFS_FILE)
+    new_manifest = dict(
+        manifest,
+        generation=generation,
+        commits=commits,
+        rows=rows,
+        dim=dim or manifest.get("dim"),
+        diff_bytes=os.path.getsize(diffs_file) if os.path.exists(diffs_file) else 0,
+        segments=segments,
+        heads=heads if heads is not None else manifest["heads"],
+        model=model if model is not None else manifest.get("model"),
+    )
+    _write_json_atomic(os.path.join(repo_dir, MANIFEST_FILE), new_manifest)
+    _apply_tombstones(repo_dir, new_manifest)
+
+    # A tombstone also hides a dropped commit that was re-added under the same id;
+    # compaction is what lifts it, since only then are the stale vectors gone.
+    with closing(_connect(repo_dir)) as conn:
+        readded = conn.execute(
+            f"""
+            SELECT 1 FROM tombstones JOIN commits USING (commit_id)
+            WHERE commits.position >= tombstones.before_position AND {_LIVE_TOMBSTONES} LIMIT 1
+            """,
+            _live(new_manifest),
+        ).fetchone()
+    planned = set(_compaction_plan(new_manifest, dim))
+    stray = [s for s in segments if (*segment_rows(s), segment_kind(s)) not in planned]
+    if len(stray) > MAX_SEGMENTS or readded:
+        new_manifest = compact(repo_dir, new_manifest)
+    return new_manifest
+
+
+def _reclaim(repo_dir: str, manifest, generation: int):
+    """Copy `manifest`'s matrix without the vectors of removed commits (and of rows unlinked
+    as id -1), via rewrite_matrix. Returns its manifest fields, or None if nothing is dead."""
+    with closing(_connect(repo_dir)) as conn:
+        tombstones = conn.execute(
+            f"SELECT commit_id, before_row FROM tombstones WHERE {_LIVE_TOMBSTONES} ORDER BY commit_id", _live(manifest)
+        ).fetchall()
+    removed = np.array([t[0] for t in tombstones], dtype="int64")
+    before = np.array([t[1] for t in tombstones], dtype="int64")
+    runs = [(start, min(start + SEGMENT_MAX_ROWS, manifest["rows"])) for start in range(0, manifest["rows"], SEGMENT_MAX_ROWS)]
+
+    def dead(start, ids):
+        rows = ids < 0
+        if len(removed):
+            at = np.minimum(np.searchsorted(removed, ids), len(removed) - 1)
+            # Not the rows of a commit re-added after its removal: those come later.
+            rows |= (removed[at] == ids) & (np.arange(start, start + len(ids)) < before[at])
+        return rows
+
+    if not any(dead(start, load_row_ids(repo_dir, end, start, manifest)).any() for start, end in runs):
+        return None
+    dim = _dim(repo_dir, manifest)
+
+    def batches():
+        for start, end in runs:
+            ids = load_row_ids(repo_dir, end, start, manifest)
+            keep = ~dead(start, ids)
+            yield _map_rows(repo_dir, manifest, dim, start, end)[keep], ids[keep]
+
+    return rewrite_matrix(repo_dir, generation, batches())
+
+
+def compact(repo_dir: str, manifest, matrix=None):
+    """Rebuild the segments as compaction plans them for the current row count, dropping removed commits.
+
+    Their vectors go from the matrix itself: the live rows are copied into a new embedding
+    matrix and row id file, published with the new segments. `matrix` (from rewrite_matrix,
+    e.g. after re-embedding) replaces the matrix instead. With a new matrix every segment is
+    rebuilt; otherwise segments already covering a planned run are kept. Each planned
+    segment is built on its own, within COMPACT_MAX_MB.
+    """
+    generation = manifest["generation"] + 1
+    if matrix is None:
+        matrix = _reclaim(repo_dir, manifest, generation)
+    # Every tombstone published so far is done with: its vectors are gone.
+    new_manifest = dict(manifest, generation=generation, reclaimed=manifest["generation"], **(matrix or {}))
+    dim = _dim(repo_dir, new_manifest)
+    existing = {} if matrix else {(*segment_rows(s), segment_kind(s)): s for s in manifest["segments"]}
+    new_manifest["segments"] = [
+        existing.get((start, end, kind)) or _write_segment(repo_dir, new_manifest, generation, dim, start, end, kind)
+        for start, end, kind in _compaction_plan(new_manifest, dim)
+    ]
+    _write_json_atomic(os.path.join(repo_dir, MANIFEST_FILE), new_manifest)
+
+    with closing(_connect(repo_dir)) as conn, conn:
+        conn.execute("DELETE FROM tombstones WHERE generation <= ?", (new_manifest["reclaimed"],))
+    for segment in manifest["segments"]:
+        if segment not in new_manifest["segments"]:
+            os.remove(os.path.join(repo_dir, segment))
+    if matrix:
+        for key in ("embeddings", "row_ids"):
+            if os.path.exists(_matrix_path(repo_dir, manifest, key)):
+                os.remove(_matrix_path(repo_dir, manifest, key))
+        print(f"Rewrote {manifest['rows']} embedding rows as {new_manifest['rows']} in {repo_dir}")
+    print(f"Compacted {len(manifest['segments'])} segments into {len(new_manifest['segments'])} in {repo_dir}")
+    return new_manifest
+
+
+def load_segments(repo_dir: str, manifest, mmap: bool = True):
+    """Open the committed segment indexes, memory-mapped read-only by default; each maps vectors to commit ids."""
+    return [
+        faiss.read_index(os.path.join(repo_dir, segment), read_flags(segment_kind(segment)) if mmap else 0)
+        for segment in manifest["segments"]
+    ]
+
+
+def segments_heap_bytes(repo_dir: str, manifest, segments, mmap: bool = True) -> int:
+    """Approximate private memory held by loaded segments: file sizes, less vector codes left mapped."""
+    total = 0
+    for name, segment in zip(manifest["segments"], segments):
+        total += os.path.getsize(os.path.join(repo_dir, name))
+        if mmap:
+            total -= mapped_bytes(segment)
+    return total
@@ -0,0 +1,137 @@
+import hashlib
+import os
+
+from chunking import estimate_tokens, split_diff_files, split_hunks, truncate_tokens
+from lexical_index import query_terms
+
+# Commit context per ask_llm prompt, in estimate_tokens units (one per word or punctuation
+# mark; a model's tokenizer usually counts somewhat more). With the fixed prompt text this
+# bounds the prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MAX_MESSAGE_TOKENS = int(os.getenv("CONTEXT_MAX_MESSAGE_TOKENS", "64"))
+# Longer hunks are cut on a line boundary.
+MAX_HUNK_TOKENS = int(os.getenv("CONTEXT_MAX_HUNK_TOKENS", "160"))
+# Packing stops once less than this is left: a file path and a line or two.
+MIN_HUNK_TOKENS = 16
+# So the top commit can't take the whole budget.
+MAX_HUNKS_PER_COMMIT = int(os.getenv("CONTEXT_MAX_HUNKS_PER_COMMIT", "3"))
+# Marks text cut short; counted against the budget like any other line.
+CUT_MARKER = "..."
+# Only this much of each diff is read from the store; hunks further in are never packed.
+CONTEXT_MAX_DIFF_BYTES = int(os.getenv("CONTEXT_MAX_DIFF_BYTES", "65536"))
+
+
+def _head_tokens(text: str, max_tokens: int):
+    """(whole lines from the start of `text` within max_tokens, their token count); at least part of the first line.
+
+    A cut is marked with CUT_MARKER, and the count includes it.
+    """
+    text_lines = text.splitlines()
+    lines = []
+    counts = []
+    for line in text_lines:
+        tokens = estimate_tokens(line) + 1
+        if sum(counts) + tokens > max_tokens:
+            marker = estimate_tokens(CUT_MARKER) + 1
+            while lines and sum(counts) + marker > max_tokens:
+                lines.pop()
+                counts.pop()
+            if not lines:
+                first = truncate_tokens(text_lines[0], max(max_tokens - marker - 1, 0))
+                lines.append(first)
+                counts.append(estimate_tokens(first) + 1)
+            lines.append(CUT_MARKER)
+            counts.append(marker)
+            break
+        lines.append(line)
+        counts.append(tokens)
+    return "\n".join(lines), sum(counts)
+
+
+def commit_line(commit) -> str:
+    """One line per commit: short hash, repo (for cross-repo results), date, author, message."""
+    message = " ".join((commit.get("message") or "").split())
+    message = _head_tokens(message, MAX_MESSAGE_TOKENS)[0].replace("\n", " ")
+    repo = f" in {commit['repo_name']}" if commit.get("repo_name") else ""
+    return f"- {commit['hash'][:7]}{repo} ({commit.get('date', 'no-date')} by {commit.get('author', 'Unknown')}): {message}"
+
+
+def _hunk_key(hunk: str) -> str:
+    # Changed lines only, signs, order and whitespace dropped: the same change
+    # cherry-picked, reverted or re-applied elsewhere counts once.
+    changed = sorted(
+        " ".join(line[1:].split())
+        for line in hunk.splitlines()
+        if line[:1] in "+-" and not line.startswith(("+++", "---"))
+    )
+    return hashlib.blake2b("\n".join(changed).encode(), digest_size=16).hexdigest()
+
+
+def pack_context(commits, query: str, budget: int = CONTEXT_TOKEN_BUDGET, load_diff=None):
+    """Commit context for an LLM prompt, at most `budget` tokens (estimate_tokens).
+
+    `commits` are in relevance order. Their one-line summaries go first, best first,
+    until the budget runs out. What is left is filled greedily with diff hunks: those
+    sharing more of the query's terms, from better-ranked commits, first; at most
+    MAX_HUNKS_PER_COMMIT per commit; each distinct change once. `load_diff(commit)`
+    returns a commit's diff text on demand; without it only the summaries are packed.
+    Returns (context text, stats).
+    """
+    lines = []
+    used = 0
+    for commit in commits:
+        line = commit_line(commit)
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+    packed = commits[: len(lines)]
+
+    candidates = []
+    if load_diff is not None and used < budget:
+        # Substring checks on the lower-cased hunk: camelCase parts match too, and
+        # this is far cheaper than tokenizing every hunk of every diff.
+        terms = set(query_terms(query))
+        for rank, commit in enumerate(packed):
+            for path, section in split_diff_files(load_diff(commit) or ""):
+                for hunk in split_hunks(section) or [section]:
+                    text = f"{path}\n{hunk}".lower()
+                    hits = sum(term in text for term in terms)
+                    candidates.append(((1 + hits) / (rank + 1), rank, path, hunk))
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+
+    hunks = {}
+    seen = set()
+    duplicates = 0
+    for _, rank, path, hunk in candidates:
+        if budget - used < MIN_HUNK_TOKENS:
+            break
+        if len(hunks.get(rank, ())) >= MAX_HUNKS_PER_COMMIT:
+            continue
+        body, tokens = _head_tokens(hunk, MAX_HUNK_TOKENS)
+        tokens += estimate_tokens(path) + 2
+        if used + tokens > budget:
+            # A smaller hunk further down may still fit.
+            continue
+        # Keyed on what would be sent, so a long hunk isn't normalized in full.
+        key = _hunk_key(body)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        hunks.setdefault(rank, []).append(f"  {path}\n" + "\n".join("    " + line for line in body.splitlines()))
+        used += tokens
+
+    blocks = []
+    for rank, line in enumerate(lines):
+        blocks.append(line)
+        blocks.extend(hunks.get(rank, ()))
+    stats = {
+        "tokens": used,
+        "commits": len(lines),
+        "dropped_commits": len(commits) - len(lines),
+        "hunks": sum(map(len, hunks.values())),
+        "duplicate_hunks": duplicates,
+    }
+    return "\n".join(blocks), stats
@@ -1,15 +1,21 @@
 import os
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, status, APIRouter
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Optional
 from psycopg2 import DatabaseError
 from models.config import conn 
 import datetime
 from psycopg2 import Error, pool
+import gitretrieval
+from search_commits import ask_llm
 
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Most results one cross-repo search may ask for; every shard fetches this many.
+MAX_SEARCH_K = int(os.getenv("MAX_SEARCH_K", "50"))
 
 pg_pool = pool.SimpleConnectionPool(1, 10, DATABASE_URL)
 
@@ -26,6 +32,15 @@ class RepoUserRequest(BaseModel):
 class RepoDeleteRequest(BaseModel):
     repo_id: int
 
+class RepoSearchRequest(BaseModel):
+    user_id: int
+    query: str
+    k: int = Field(5, gt=0, le=MAX_SEARCH_K)
+    mode: str = "hybrid"
+    filters: Optional[dict] = None
+    rerank: Optional[str] = gitretrieval.DEFAULT_RERANKER
+    summarize: bool = True
+
 
 @router.post("/repos/", status_code=201)
 def create_new_repo(payload: RepoCreateRequest):
@@ -98,3 +113,66 @@ def delete_repo(payload: RepoDeleteRequest):
     finally:
         if conn:
             pg_pool.putconn(conn)
+
+
+def _user_repo_rows(user_id: int):
+    conn = None
+    try:
+        conn = pg_pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, repo_name, repo_link FROM repo_names WHERE user_id = %s", (user_id,))
+            return cur.fetchall()
+    except DatabaseError as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn:
+            pg_pool.putconn(conn)
+
+
+@router.post("/repos/search", status_code=200)
+async def search_user_repos(payload: RepoSearchRequest):
+    """Answer a query from all of a user's indexed repos at once; every commit says which repo it came from."""
+    # The database read and the search block, so they run on the threadpool; the LLM call doesn't.
+    rows = await run_in_threadpool(_user_repo_rows, payload.user_id)
+
+    # Indexed repos live under the id /embed-repo derived from their link.
+    repos = {
+        gitretrieval.get_repo_id(link): {"id": pk, "repo_name": name, "repo_link": link} for pk, name, link in rows
+    }
+    try:
+        found = await run_in_threadpool(
+            gitretrieval.search_repos,
+            list(repos),
+            payload.query,
+            k=payload.k,
+            mode=payload.mode,
+            filters=payload.filters,
+            rerank=payload.rerank,
+            fields=gitretrieval.ANSWER_FIELDS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    top_commits = [dict(c, **repos[c["repo_id"]]) for c in found["results"]]
+    response = {
+        "top_commits": [
+            {
+                "repo_id": c["id"],
+                "repo_name": c["repo_name"],
+                "date": c["date"],
+                "author": c["author"],
+                "message": c["message"].strip(),
+                "hash": c["hash"][:7]
+            }
+            for c in top_commits
+        ],
+        "repos_searched": len(found["searched"]),
+        "repos_skipped": [
+            {"repo_name": repos[r]["repo_name"], "reason": reason} for r, reason in found["skipped"].items()
+        ],
+        "repos_timed_out": [repos[r]["repo_name"] for r in found["timed_out"]],
+    }
+    if payload.summarize:
+        response["summary"] = await ask_llm(top_commits, payload.query, gitretrieval.diff_loader())
+    return response
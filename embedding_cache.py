@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# ~1.5 KB per 384-dim vector, so the default bound is roughly 750 MB on disk.
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+# Evict down to this fraction of the bound, so eviction runs rarely.
+EVICT_TO = 0.9
+# SQLite caps bound parameters per statement.
+LOOKUP_CHUNK = 500
+# In-process query embeddings; ~1.5 KB each at 384 dims.
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000"))
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).digest()
+
+
+def normalize_query(query: str) -> str:
+    """Cache key text of a query: case-folded, whitespace collapsed (MiniLM is uncased anyway)."""
+    return " ".join(query.casefold().split())
+
+
+class EmbeddingCache:
+    """Embeddings keyed by (model name, sha256 of the embedded text), shared by all repos."""
+
+    def __init__(self, path: str, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, digest)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, digests):
+        """Return {digest: vector} for the digests that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(digests))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), LOOKUP_CHUNK):
+                chunk = unique[start:start + LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(chunk))})",
+                    (model, *chunk),
+                ).fetchall()
+                for digest, vector in rows:
+                    found[bytes(digest)] = np.frombuffer(vector, dtype="float32")
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, digest) for digest in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for d in digests if d in found)
+            self.misses += sum(1 for d in digests if d not in found)
+        return found
+
+    def put_many(self, model: str, digests, vectors):
+        now = time.time()
+        rows = [
+            (model, digest, np.asarray(vector, dtype="float32").tobytes(), now)
+            for digest, vector in zip(digests, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * EVICT_TO)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+        self.evictions += excess
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class QueryCache:
+    """LRU of query embeddings keyed by (model, normalized query), in front of the encoder."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_many(self, model: str, keys):
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get((model, key))
+                if vector is not None:
+                    self._entries.move_to_end((model, key))
+                    found[key] = vector
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def put_many(self, model: str, keys, vectors):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._entries[(model, key)] = np.array(vector, dtype="float32")
+                self._entries.move_to_end((model, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,75 @@
+import os
+import threading
+from sentence_transformers import SentenceTransformer
+
+# torch: fp32 PyTorch (default). onnx: ONNX Runtime, needs `optimum[onnxruntime]`.
+# int8: PyTorch with Linear layers dynamically quantized to int8.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "int8")
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def embedder_key(model_name: str, backend: str = EMBED_BACKEND) -> str:
+    """Identity of the vectors an embedder produces, e.g. for cache keys."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def load_embedder(model_name: str, backend: str = EMBED_BACKEND) -> SentenceTransformer:
+    """Load a sentence embedder on the requested CPU backend; same encode() API for all."""
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, backend="onnx", device="cpu")
+        except ImportError as e:
+            raise RuntimeError("EMBED_BACKEND=onnx needs `pip install optimum[onnxruntime]`") from e
+
+    if backend == "int8":
+        import torch
+
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    raise ValueError(f"Unknown EMBED_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+class SharedEmbedder:
+    """A process-wide loaded model; encode() calls are serialized because HF tokenizers aren't thread-safe."""
+
+    def __init__(self, model_name: str, backend: str, model: SentenceTransformer):
+        self.model_name = model_name
+        self.backend = backend
+        self.key = embedder_key(model_name, backend)
+        self._model = model
+        self._lock = threading.Lock()
+
+    def encode(self, *args, **kwargs):
+        with self._lock:
+            return self._model.encode(*args, **kwargs)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._model.get_sentence_embedding_dimension()
+
+    def count_tokens(self, texts):
+        """Word pieces per text as the model tokenizes it, special tokens excluded."""
+        with self._lock:
+            encoded = self._model.tokenizer(list(texts), add_special_tokens=False, verbose=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+
+def get_embedder(model_name: str = DEFAULT_MODEL, backend: str = EMBED_BACKEND) -> SharedEmbedder:
+    """Return the shared embedder for (model, backend), loading it on first use only."""
+    key = (model_name, backend)
+    embedder = _registry.get(key)
+    if embedder is None:
+        with _registry_lock:
+            embedder = _registry.get(key)
+            if embedder is None:
+                print(f"Loading embedding model {embedder_key(model_name, backend)}")
+                embedder = SharedEmbedder(model_name, backend, load_embedder(model_name, backend))
+                _registry[key] = embedder
+    return embedder
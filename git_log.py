@@ -0,0 +1,84 @@
+from git import Repo, GitCommandError
+
+# Record separators used in the `git log` format. Diff content lines always
+# start with a prefix (" ", "+", "-", "@", "\", "diff", ...) so a line that
+# begins with COMMIT_START can only be one of our headers.
+COMMIT_START = "\x1e"
+FIELD_SEP = "\x1f"
+
+LOG_FORMAT = f"{COMMIT_START}%H{FIELD_SEP}%an{FIELD_SEP}%ae{FIELD_SEP}%cI{FIELD_SEP}%B{COMMIT_START}"
+
+
+def _build_commit(header, diff_lines):
+    hexsha, author, email, date, message = header.split(FIELD_SEP, 4)
+    return {
+        "hash": hexsha,
+        "author": author,
+        "email": email,
+        "date": date,
+        "message": message.strip(),
+        "diff": "".join(diff_lines).strip("\n"),
+    }
+
+
+def iter_log_commits(repo: Repo, revs=None):
+    """Stream commits + diffs from a single `git log --patch` process."""
+    args = [
+        f"--format={LOG_FORMAT}",
+        "--patch",
+        "--no-color",
+        "--no-ext-diff",
+        "--no-textconv",
+        "--diff-merges=first-parent",
+    ]
+    args.extend(revs or ["HEAD"])
+    args.append("--")
+
+    proc = repo.git.log(*args, as_process=True)
+
+    header = None
+    header_done = False
+    diff_lines = []
+    finished = False
+
+    try:
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", errors="ignore")
+
+            if header is not None and not header_done:
+                # Still inside a multi-line commit message.
+                if line.rstrip("\n").endswith(COMMIT_START):
+                    header += line.rstrip("\n")[: -len(COMMIT_START)]
+                    header_done = True
+                else:
+                    header += line
+                continue
+
+            if line.startswith(COMMIT_START):
+                if header is not None:
+                    yield _build_commit(header, diff_lines)
+                body = line[len(COMMIT_START):]
+                diff_lines = []
+                if body.rstrip("\n").endswith(COMMIT_START):
+                    header = body.rstrip("\n")[: -len(COMMIT_START)]
+                    header_done = True
+                else:
+                    header = body
+                    header_done = False
+            elif header is not None:
+                diff_lines.append(line)
+
+        if header is not None:
+            yield _build_commit(header, diff_lines)
+        finished = True
+    finally:
+        proc.stdout.close()
+        if finished:
+            proc.wait()
+        else:
+            # Consumer stopped early; don't let a SIGPIPE exit status leak out.
+            proc.proc.kill()
+            try:
+                proc.wait()
+            except GitCommandError:
+                pass
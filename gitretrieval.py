@@ -102,25 +102,116 @@
    
 
 import os
+import asyncio
+import heapq
 import json
+import shutil
 import tempfile
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
 from typing import Optional
 import numpy as np
 import faiss
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from git import Repo
-
-from search_commits import ask_llm, ask_llm_name
+from git import Repo, GitCommandError
+
+from chunking import chunk_commit, estimate_tokens
+from commit_store import (
+    METADATA_FIELDS,
+    append_commits,
+    append_embeddings,
+    append_row_ids,
+    check_fields,
+    commit_generation,
+    commit_id,
+    compact,
+    ensure_search_tables,
+    filter_commit_ids,
+    iter_stored_commits,
+    load_embeddings,
+    load_known_hashes,
+    load_manifest,
+    load_row_ids,
+    load_segments,
+    load_tombstones,
+    migrate_legacy,
+    needs_migration,
+    read_commits,
+    read_diff,
+    read_lexical_fields,
+    recover,
+    remove_commits,
+    repo_lock,
+    rewrite_matrix,
+    search_lexical_many,
+    search_tables_ready,
+    segments_heap_bytes,
+)
+from answer_cache import AnswerCache
+from context_packer import CONTEXT_MAX_DIFF_BYTES
+from embedding_cache import EmbeddingCache, QueryCache, normalize_query, text_digest
+from embeddings import DEFAULT_MODEL, get_embedder
+from git_log import iter_log_commits
+from index_cache import IndexCache
+from ingest_jobs import IngestJob, IngestQueue, QueueFull
+from lexical_index import SEARCH_MODES, rrf_fuse
+from reranker import DEFAULT_RERANKER, RERANK_BUDGET_MS, RERANK_TOP_N, Reranker, check_reranker, get_cross_encoder
+from search_filters import parse_filters
+from search_commits import LLM_FAILED_ANSWER, ask_llm, ask_llm_name, stream_llm
+from vector_index import FILTER_EXACT_MAX_ROWS, PQ_RERANK_FACTOR, ExactVectors, is_exact, needs_rerank, search_params
 
 router = APIRouter()
 
-MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = DEFAULT_MODEL
+MODEL = get_embedder(MODEL_NAME)
+
+# Texts per encoder forward pass, and intra-op threads for CPU inference
+# (0 keeps torch's default of one per core).
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", "0"))
+if ENCODE_THREADS:
+    import torch
+
+    torch.set_num_threads(ENCODE_THREADS)
 
 DATA_DIR = "data"
-os.makedirs(DATA_DIR, exist_ok=True)
+MIRROR_DIR = os.path.join(DATA_DIR, "mirrors")
+os.makedirs(MIRROR_DIR, exist_ok=True)
+
+# Commits held in memory at once during ingest; caps peak RSS regardless of repo size.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+CHUNK_OVERFETCH = 4
+
+# Shared across repos, so forks and mirrors of an indexed repo reuse vectors.
+EMBEDDING_CACHE = EmbeddingCache(os.path.join(DATA_DIR, "embedding_cache.sqlite"))
+
+INGEST_QUEUE = IngestQueue()
+
+# Loaded segments per repo, so warm queries skip index reads entirely.
+INDEX_CACHE = IndexCache()
+
+# Repeated questions skip the encoder.
+QUERY_CACHE = QueryCache()
+
+# Cross-repo search runs one task per repo here; FAISS and SQLite release the GIL while they work.
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(min(8, os.cpu_count() or 1))))
+SHARD_TIMEOUT_S = float(os.getenv("SHARD_TIMEOUT_S", "5"))
+SHARD_POOL = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard")
+# /analyze-query answers, per repo generation; see answer_cache.py.
+ANSWER_CACHE = AnswerCache()
+# What search results carry unless a caller asks for more (e.g. "diff" or "diff_ref").
+RESULT_FIELDS = METADATA_FIELDS
+# Results for LLM answers also carry where their diff is, so the context packer can read hunks on demand.
+ANSWER_FIELDS = RESULT_FIELDS + ("diff_ref",)
+# Optional second-stage re-ranking of the first-stage top commits (see reranker.py).
+RERANKER = Reranker()
+if DEFAULT_RERANKER == "cross-encoder":
+    # Starts loading now; until it's ready, requests keep first-stage order rather than wait.
+    get_cross_encoder(wait=False)
 
 
 def get_repo_id(repo_url_or_path: str) -> str:
@@ -128,79 +219,223 @@ def get_repo_id(repo_url_or_path: str) -> str:
     return hashlib.md5(repo_url_or_path.encode()).hexdigest()
 
 
-def get_commits(repo_url_or_path):
-    """Clone or open repo and extract commits + diffs."""
+def open_repo(repo_url_or_path: str, repo_id: str) -> Repo:
+    """Open a local repo, or a persistent bare mirror of a remote one (fetching updates)."""
     if os.path.exists(repo_url_or_path):
-        repo_path = repo_url_or_path
-    else:
-        temp_dir = tempfile.mkdtemp()
-        print(f"Cloning repo to temp dir: {temp_dir}")
-        repo_path = Repo.clone_from(repo_url_or_path, temp_dir).working_tree_dir
+        return Repo(repo_url_or_path)
+
+    mirror_path = os.path.join(MIRROR_DIR, f"{repo_id}.git")
+    if os.path.exists(mirror_path):
+        print(f"Fetching updates into mirror: {mirror_path}")
+        repo = Repo(mirror_path)
+        repo.git.fetch("--prune", "origin")
+        return repo
+
+    # Clone next to the final location and rename, so a failed clone never
+    # leaves a half-populated mirror behind.
+    temp_dir = tempfile.mkdtemp(dir=MIRROR_DIR)
+    print(f"Cloning mirror to: {mirror_path}")
+    try:
+        Repo.clone_from(repo_url_or_path, temp_dir, mirror=True)
+        os.rename(temp_dir, mirror_path)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return Repo(mirror_path)
 
-    repo = Repo(repo_path)
-    commits = []
 
+def get_heads(repo: Repo):
+    """Return the ref tips that an ingest of this repo walks."""
     if not repo.head.is_valid():
-        print("No commits found.")
         return []
+    return [repo.head.commit.hexsha]
 
-    for commit in repo.iter_commits():
-        commit_data = {
-            "hash": commit.hexsha,
-            "author": commit.author.name,
-            "email": commit.author.email,
-            "date": commit.committed_datetime.isoformat(),
-            "message": commit.message.strip(),
-            "diff": "".join(
-                d.diff.decode("utf-8", errors="ignore")
-                for d in commit.diff(commit.parents[0], create_patch=True)
-            )
-            if commit.parents
-            else ""
-        }
-        commits.append(commit_data)
 
-    print(f"Indexed {len(commits)} commits.")
-    return commits
+def load_watermark(repo_id: str):
+    """Return the ref tips recorded by the last successful ingest."""
+    repo_dir = os.path.join(DATA_DIR, repo_id)
+    # The legacy layout recorded none; ingest migrates it and walks the whole history.
+    if not os.path.isdir(repo_dir) or needs_migration(repo_dir):
+        return []
+    return load_manifest(repo_dir)["heads"]
 
 
-def embed_and_save(repo_id: str, commits):
-    """Embed only new commits and update FAISS index for this repo."""
-    repo_dir = os.path.join(DATA_DIR, repo_id)
-    os.makedirs(repo_dir, exist_ok=True)
+def _exclusions(repo: Repo, since):
+    exclude = []
+    for sha in since:
+        try:
+            repo.git.rev_parse("--verify", "--quiet", f"{sha}^{{commit}}")
+        except GitCommandError:
+            # Tip was rewritten away and pruned; fall back to a full walk.
+            continue
+        exclude.append(f"^{sha}")
+    return exclude
 
-    commits_file = os.path.join(repo_dir, "commits.json")
-    index_file = os.path.join(repo_dir, "faiss.index")
 
-    try:
-        with open(commits_file, "r") as f:
-            existing = {c["hash"]: c for c in json.load(f)}
-    except FileNotFoundError:
-        existing = {}
-
-    new_commits = []
-    for commit in commits:
-        if commit["hash"] not in existing:
-            content = f"{commit['message']} \n {commit['diff']}"
-            commit["embedding"] = MODEL.encode(content).tolist()
-            existing[commit["hash"]] = commit
-            new_commits.append(commit)
-
-    with open(commits_file, "w") as f:
-        json.dump(list(existing.values()), f, indent=2)
-
-    if new_commits:
-        embeddings = np.array([c["embedding"] for c in new_commits]).astype("float32")
-
-        if os.path.exists(index_file):
-            index = faiss.read_index(index_file)
-        else:
-            index = faiss.IndexFlatL2(embeddings.shape[1])
+def get_dropped_commits(repo: Repo, repo_id: str, since=()):
+    """Hashes indexed from the `since` tips that HEAD no longer reaches, e.g. after a force-push."""
+    if not since:
+        return []
+    tips = _exclusions(repo, since)
+    if len(tips) == len(since) and repo.head.is_valid():
+        # Only the rewritten-away part of history is walked.
+        return repo.git.rev_list(*(tip[1:] for tip in tips), "^HEAD", "--").split()
+
+    # An old tip was pruned from the mirror, so diff against everything indexed.
+    reachable = set(repo.git.rev_list("HEAD", "--").split()) if repo.head.is_valid() else set()
+    return [h for h in load_known_hashes(os.path.join(DATA_DIR, repo_id)) if h not in reachable]
 
-        index.add(embeddings)
-        faiss.write_index(index, index_file)
 
-    return f"Embedded {len(new_commits)} new commits."
+def count_commits(repo: Repo, since=()) -> int:
+    """Number of commits get_commits will yield; cheap, no diffs are generated."""
+    if not repo.head.is_valid():
+        return 0
+    return int(repo.git.rev_list("--count", "HEAD", *_exclusions(repo, since), "--"))
+
+
+def get_commits(repo: Repo, since=()):
+    """Yield commits + diffs reachable from HEAD but not from the `since` tips."""
+    if not repo.head.is_valid():
+        print("No commits found.")
+        return
+
+    count = 0
+    for commit in iter_log_commits(repo, ["HEAD", *_exclusions(repo, since)]):
+        count += 1
+        yield commit
+
+    print(f"Indexed {count} commits.")
+
+
+def _batched(iterable, batch_size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_texts(texts, batch_size: int = ENCODE_BATCH_SIZE):
+    """Encode texts in length-sorted buckets straight into one float32 matrix."""
+    embeddings = np.empty((len(texts), MODEL.get_sentence_embedding_dimension()), dtype="float32")
+    if not texts:
+        return embeddings
+
+    # Similar-length texts share a batch, so little compute goes to padding.
+    order = sorted(range(len(texts)), key=lambda i: estimate_tokens(texts[i]))
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        embeddings[bucket] = MODEL.encode(
+            [texts[i] for i in bucket], batch_size=len(bucket), convert_to_numpy=True, normalize_embeddings=True
+        )
+    return embeddings
+
+
+def cached_encode(texts):
+    """Encode texts, reusing vectors already computed for identical text by any repo."""
+    digests = [text_digest(text) for text in texts]
+    cache_key = MODEL.key
+    cached = EMBEDDING_CACHE.get_many(cache_key, digests)
+
+    missing = [i for i, digest in enumerate(digests) if digest not in cached]
+    fresh = encode_texts([texts[i] for i in missing])
+    if missing:
+        EMBEDDING_CACHE.put_many(cache_key, [digests[i] for i in missing], fresh)
+
+    embeddings = np.empty((len(texts), MODEL.get_sentence_embedding_dimension()), dtype="float32")
+    for i, digest in enumerate(digests):
+        if digest in cached:
+            embeddings[i] = cached[digest]
+    embeddings[missing] = fresh
+    return embeddings
+
+
+def reembed(repo_dir: str, manifest, batch_size: int = EMBED_BATCH_SIZE):
+    """Re-chunk and re-encode every stored commit with the current model into a new matrix; commit ids stay."""
+    print(f"Re-embedding {repo_dir}: {manifest.get('model') or DEFAULT_MODEL} -> {MODEL.key}")
+
+    def batches():
+        # From each commit's stored diff: the chunks (and so the rows) follow the new model's tokenizer.
+        for commits in _batched(iter_stored_commits(repo_dir), batch_size):
+            texts = []
+            ids = []
+            for commit in commits:
+                for chunk in chunk_commit(commit, count_tokens=MODEL.count_tokens):
+                    texts.append(chunk)
+                    ids.append(commit_id(commit["hash"]))
+            yield cached_encode(texts), ids
+
+    matrix = rewrite_matrix(repo_dir, manifest["generation"] + 1, batches())
+    return compact(repo_dir, dict(manifest, model=MODEL.key), matrix=matrix)
+
+
+def embed_and_save(
+    repo_id: str, commits, batch_size: int = EMBED_BATCH_SIZE, progress=None, heads=None, removed=()
+):
+    """Embed only new commits and append them to this repo's store as one new generation.
+
+    `progress(walked, embedded)` is called after every batch and may raise to stop early;
+    whatever was embedded up to that point is still committed. `heads` become the new
+    watermark, but only if every commit was consumed. `removed` hashes are dropped first.
+    """
+    repo_dir = os.path.join(DATA_DIR, repo_id)
+    # One writer per repo; old layouts are migrated here, never on the query path.
+    with repo_lock(repo_dir):
+        migrate_legacy(repo_dir)
+        manifest = load_manifest(repo_dir)
+        recover(repo_dir, manifest)
+        ensure_search_tables(repo_dir)
+        if manifest["rows"] and (manifest.get("model") or DEFAULT_MODEL) != MODEL.key:
+            manifest = reembed(repo_dir, manifest)
+        known = load_known_hashes(repo_dir)
+
+        dropped = remove_commits(repo_dir, [h for h in removed if h in known])
+        if dropped:
+            print(f"Dropped {dropped} commits no longer reachable from HEAD.")
+            known.difference_update(removed)
+
+        # New vectors go into fresh segments at publish time; existing segments are never rewritten.
+        walked = 0
+        embedded = 0
+        completed = False
+        try:
+            for batch in _batched(commits, batch_size):
+                walked += len(batch)
+
+                new_commits = []
+                texts = []
+                ids = []
+                for commit in batch:
+                    if commit["hash"] not in known:
+                        known.add(commit["hash"])
+                        new_commits.append(commit)
+                        for chunk in chunk_commit(commit, count_tokens=MODEL.count_tokens):
+                            texts.append(chunk)
+                            ids.append(commit_id(commit["hash"]))
+
+                if new_commits:
+                    embeddings = cached_encode(texts)
+                    append_commits(repo_dir, new_commits)
+                    append_embeddings(repo_dir, embeddings)
+                    append_row_ids(repo_dir, ids)
+                    embedded += len(new_commits)
+
+                if progress:
+                    progress(walked, embedded)
+            completed = True
+        finally:
+            # Publish the commits, vectors and segment appended so far in one
+            # manifest swap, even when ingest is cancelled part-way.
+            if embedded or dropped or (completed and heads is not None):
+                commit_generation(repo_dir, manifest, heads=heads if completed else None, model=MODEL.key)
+                INDEX_CACHE.invalidate(repo_dir)
+                ANSWER_CACHE.invalidate(repo_id)
+
+    print(f"Embedding cache: {EMBEDDING_CACHE.stats()}")
+    return {"walked": walked, "embedded": embedded, "dropped": dropped}
 
 
 # def retrieve_top_k(repo_id: str, query: str, k: int = 5):
@@ -223,47 +458,396 @@ def embed_and_save(repo_id: str, commits):
 #     return [commits[i] for i in I[0] if i < len(commits)]
 
 
-def retrieve_top_k(repo_id: str, query: str, k: int = 5, max_message_len: int = 300):
-    """Retrieve top-k relevant commits for a given repo."""
-    repo_dir = os.path.join(DATA_DIR, repo_id)
-    commits_file = os.path.join(repo_dir, "commits.json")
-    index_file = os.path.join(repo_dir, "faiss.index")
+def _aggregate_chunk_hits(distances, ids, aggregate: str = "max"):
+    """Fold chunk-level hits into per-commit scores, best first."""
+    scores = {}
+    for distance, cid in zip(distances, ids):
+        if cid < 0:
+            continue
+        cid = int(cid)
+        # Unit-length MiniLM vectors: squared L2 = 2 - 2 * cosine.
+        similarity = 1.0 - float(distance) / 2.0
+        if aggregate == "sum":
+            scores[cid] = scores.get(cid, 0.0) + similarity
+        else:
+            scores[cid] = max(scores.get(cid, -1.0), similarity)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def search_segments(
+    segments, query_emb, k: int, exclude=(), nprobe: int = None, ef_search: int = None, exact=None, allow=None
+):
+    """Search each segment and merge into one global top-k over commit ids, skipping `exclude` ids.
+
+    `nprobe` / `ef_search` override the effort stored in IVF / HNSW segments for this query.
+    Hits from PQ-compressed segments are re-scored on `exact` vectors when given.
+    `allow`, a sorted id array, restricts the search to those ids and then overrides `exclude`.
+    """
+    selector = None
+    effort = 1.0
+    if allow is not None:
+        if exact is not None:
+            allowed_rows = exact.count_rows(allow)
+            if allowed_rows <= FILTER_EXACT_MAX_ROWS:
+                # Few enough vectors to score every one: exact, whatever the segment types.
+                return exact.rerank(query_emb, [allow] * len(query_emb), k)
+            # Only a fraction of what ANN visits is allowed; visit proportionally more.
+            effort = len(exact.row_ids) / allowed_rows
+        selector = faiss.IDSelectorBatch(allow)
+    elif len(exclude):
+        excluded = faiss.IDSelectorBatch(np.asarray(exclude, dtype="int64"))
+        selector = faiss.IDSelectorNot(excluded)
+
+    distances = []
+    ids = []
+    for segment in segments:
+        params = search_params(segment, selector, nprobe=nprobe, ef_search=ef_search, effort=effort)
+        if exact is not None and needs_rerank(segment):
+            _, candidates = segment.search(query_emb, min(k * PQ_RERANK_FACTOR, segment.ntotal), params=params)
+            D, I = exact.rerank(query_emb, candidates, min(k, segment.ntotal))
+        else:
+            D, I = segment.search(query_emb, min(k, segment.ntotal), params=params)
+        distances.append(D)
+        ids.append(I)
+
+    D = np.concatenate(distances, axis=1)
+    I = np.concatenate(ids, axis=1)
+    order = np.argsort(D, axis=1)[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+def load_search_state(repo_dir: str, manifest):
+    """Return (segments, tombstones, exact vectors or None) for this generation, from INDEX_CACHE when warm."""
+
+    def load():
+        segments = load_segments(repo_dir, manifest)
+        tombstones = load_tombstones(repo_dir, manifest)
+        nbytes = segments_heap_bytes(repo_dir, manifest, segments) + tombstones.nbytes
+        exact = None
+        # Exact vectors back PQ re-ranking and narrow filters on approximate segments.
+        if not all(is_exact(segment) for segment in segments):
+            rows = manifest["rows"]
+            exact = ExactVectors(
+                load_embeddings(repo_dir, manifest=manifest)[:rows], load_row_ids(repo_dir, rows, manifest=manifest)
+            )
+            nbytes += exact.nbytes
+        return (segments, tombstones, exact), nbytes
+
+    return INDEX_CACHE.get(repo_dir, manifest["generation"], load)
 
-    if not (os.path.exists(commits_file) and os.path.exists(index_file)):
-        raise ValueError("Repo not embedded yet. Please call /embed-repo first.")
 
-    with open(commits_file, "r") as f:
-        commits = json.load(f)
+def encode_queries(queries):
+    """Unit-length query embeddings, one row per query; cache misses share one encode call."""
+    keys = [normalize_query(q) for q in queries]
+    cached = QUERY_CACHE.get_many(MODEL.key, keys)
+    missing = list(dict.fromkeys(key for key in keys if key not in cached))
+    if missing:
+        fresh = MODEL.encode(missing, batch_size=len(missing), convert_to_numpy=True, normalize_embeddings=True)
+        QUERY_CACHE.put_many(MODEL.key, missing, fresh)
+        cached.update(zip(missing, fresh))
+    return np.asarray([cached[key] for key in keys], dtype="float32")
 
-    index = faiss.read_index(index_file)
 
-    query_emb = MODEL.encode(query).astype("float32").reshape(1, -1)
-    D, I = index.search(query_emb, k)
+def _open_for_search(repo_id: str):
+    """(repo dir, manifest) of an embedded repo, ready to search; ValueError if it can't be.
 
-    results = []
-    for i in I[0]:
-        if i < len(commits):
-            commit = commits[i].copy()
-            msg = commit["message"].strip()
+    Nothing is written here: repos that need migrating or re-indexing are reported as such.
+    """
+    repo_dir = os.path.join(DATA_DIR, repo_id)
+    manifest = load_manifest(repo_dir) if os.path.isdir(repo_dir) else None
+
+    if not manifest or not manifest["rows"]:
+        raise ValueError("Repo not embedded yet. Please call /embed-repo first.")
+    stored_model = manifest.get("model") or DEFAULT_MODEL
+    if stored_model != MODEL.key:
+        raise ValueError(f"Repo was embedded with {stored_model}; call /embed-repo to re-embed it with {MODEL.key}.")
+    if not search_tables_ready(repo_dir):
+        raise ValueError("Repo's keyword index is out of date; run migrate_data.py or /embed-repo to rebuild it.")
+    return repo_dir, manifest
+
+
+def _rank_repo(repo_dir: str, manifest, queries, query_embs, k: int, aggregate, nprobe, ef_search, mode, filters):
+    """Per query, the [(commit id, score)] rankings `mode` calls for: vector first, then keyword."""
+    allow = None
+    if filters:
+        allow = filter_commit_ids(repo_dir, filters)
+        if not len(allow):
+            return [[[] for _ in range(2 if mode == "hybrid" else 1)] for _ in queries]
+
+    rankings = [[] for _ in queries]
+    if mode != "lexical":
+        segments, tombstones, exact = load_search_state(repo_dir, manifest)
+        if allow is not None and len(tombstones):
+            allow = np.setdiff1d(allow, tombstones)
+        # Several chunks of one commit can crowd the top rows; over-fetch so
+        # k distinct commits usually survive aggregation.
+        D, I = search_segments(
+            segments,
+            query_embs,
+            min(k * CHUNK_OVERFETCH, manifest["rows"]),
+            exclude=tombstones,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            exact=exact,
+            allow=allow,
+        )
+        for n in range(len(queries)):
+            rankings[n].append(_aggregate_chunk_hits(D[n], I[n], aggregate))
+    if mode != "vector":
+        for n, ranking in enumerate(search_lexical_many(repo_dir, queries, k * CHUNK_OVERFETCH, filters=filters)):
+            rankings[n].append(ranking)
+    return rankings
+
+
+def _fuse(rankings, k: int):
+    """Top k of one query's rankings: the ranking itself, or their reciprocal-rank fusion."""
+    if len(rankings) == 1:
+        return rankings[0][:k]
+    return rrf_fuse([[item for item, _ in ranking] for ranking in rankings])[:k]
+
+
+def _load_results(repo_dir: str, commit_ids, max_message_len: int, fields):
+    """{commit id: commit} with only `fields` (and the hash), messages shortened."""
+    commits = read_commits(repo_dir, commit_ids, fields=("hash", *fields))
+    for commit in commits.values():
+        msg = commit.get("message")
+        if msg is not None:
+            msg = msg.strip()
             if len(msg) > max_message_len:
                 msg = msg[:max_message_len] + "..."
             commit["message"] = msg
-            results.append(commit)
+    return commits
 
-    return results
+
+def _drop_diffs(results):
+    # The cross-encoder needed them; the caller didn't ask for them.
+    return [{key: value for key, value in commit.items() if key != "diff"} for commit in results]
+
+
+def result_diff(repo_id: str, commit, max_bytes: int = None) -> str:
+    """A result's diff, or its first `max_bytes`: read from the store by "diff_ref" only when needed."""
+    if "diff" in commit:
+        return commit["diff"][:max_bytes] if max_bytes is not None else commit["diff"]
+    offset, length = commit["diff_ref"]
+    if max_bytes is not None:
+        length = min(length, max_bytes)
+    return read_diff(os.path.join(DATA_DIR, repo_id), offset, length)
+
+
+def diff_loader(repo_id: str = None):
+    """load_diff for ask_llm: a result's first CONTEXT_MAX_DIFF_BYTES of diff, from the result's own repo if it has one."""
+    return lambda commit: result_diff(commit.get("repo_id") or repo_id, commit, CONTEXT_MAX_DIFF_BYTES)
+
+
+def _rerank_fields(repo_dir: str, commits):
+    """{hash: indexed keyword fields} for {commit id: commit}, for the lexical re-ranker."""
+    return {commits[cid]["hash"]: fields for cid, fields in read_lexical_fields(repo_dir, commits).items()}
+
+
+def retrieve_top_k_many(
+    repo_id: str,
+    queries,
+    k: int = 5,
+    max_message_len: int = 300,
+    aggregate: str = "max",
+    nprobe: int = None,
+    ef_search: int = None,
+    mode: str = "hybrid",
+    filters: dict = None,
+    rerank: str = DEFAULT_RERANKER,
+    rerank_budget_ms: float = RERANK_BUDGET_MS,
+    fields=RESULT_FIELDS,
+):
+    """Retrieve top-k relevant commits for each of several queries against one repo.
+
+    The repo is opened once, all queries are encoded together and each segment
+    is searched once with the whole query matrix. Returns one result list per query.
+
+    `mode` "hybrid" fuses vector and BM25 keyword rankings by reciprocal rank;
+    "vector" or "lexical" use one of them alone. `filters` (see search_filters.py)
+    restrict both searches to matching commits up front, so k is never spent on others.
+    `rerank` ("lexical" or "cross-encoder") re-orders the top RERANK_TOP_N per query
+    within `rerank_budget_ms` for the whole call before the top k are taken.
+    Results carry only `fields` (see commit_store.COMMIT_FIELDS) plus the hash and
+    score; diffs are not read unless "diff" is asked for ("diff_ref" + result_diff()
+    reads them later, on demand).
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    check_reranker(rerank)
+    check_fields(fields)
+    filters = parse_filters(filters)
+    repo_dir, manifest = _open_for_search(repo_id)
+    if not queries:
+        return []
+
+    depth = max(k, RERANK_TOP_N) if rerank else k
+    query_embs = encode_queries(queries) if mode != "lexical" else None
+    rankings = _rank_repo(repo_dir, manifest, queries, query_embs, depth, aggregate, nprobe, ef_search, mode, filters)
+    ranked = [_fuse(query_rankings, depth) for query_rankings in rankings]
+    # One read for every query's commits.
+    load_fields = (*fields, "diff") if rerank == "cross-encoder" else fields
+    commits = _load_results(
+        repo_dir, [cid for query_ranked in ranked for cid, _ in query_ranked], max_message_len, load_fields
+    )
+    results = [
+        [dict(commits[cid], score=score) for cid, score in query_ranked if cid in commits]
+        for query_ranked in ranked
+    ]
+    if rerank:
+        lexical = _rerank_fields(repo_dir, commits) if rerank == "lexical" else None
+        results = RERANKER.rerank_many(queries, results, rerank, rerank_budget_ms, lexical)
+    if rerank == "cross-encoder" and "diff" not in fields:
+        return [_drop_diffs(query_results[:k]) for query_results in results]
+    return [query_results[:k] for query_results in results]
+
+
+def retrieve_top_k(repo_id: str, query: str, k: int = 5, **options):
+    """Retrieve top-k relevant commits for a given repo; options as for retrieve_top_k_many."""
+    return retrieve_top_k_many(repo_id, [query], k=k, **options)[0]
+
+
+def _search_shard(repo_id: str, query: str, query_embs, k: int, options):
+    repo_dir, manifest = _open_for_search(repo_id)
+    return _rank_repo(repo_dir, manifest, [query], query_embs, k, **options)[0]
+
+
+def search_repos(
+    repo_ids,
+    query: str,
+    k: int = 5,
+    max_message_len: int = 300,
+    aggregate: str = "max",
+    nprobe: int = None,
+    ef_search: int = None,
+    mode: str = "hybrid",
+    filters: dict = None,
+    rerank: str = DEFAULT_RERANKER,
+    rerank_budget_ms: float = RERANK_BUDGET_MS,
+    timeout: float = SHARD_TIMEOUT_S,
+    fields=RESULT_FIELDS,
+):
+    """Search several repos (shards) at once and return the global top-k, each result tagged with its repo_id.
+
+    The query is encoded once. Shards are searched in parallel, each returning at most
+    its own top k * CHUNK_OVERFETCH commits per ranking from the shared INDEX_CACHE.
+    Each ranking is heap-merged across shards by score, then fused as for one repo.
+    Shards that can't be searched or exceed `timeout` seconds are reported, not fatal.
+    `rerank` re-orders the global top RERANK_TOP_N and `fields` projects results, as in retrieve_top_k_many.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    check_reranker(rerank)
+    check_fields(fields)
+    filters = parse_filters(filters)
+    depth = max(k, RERANK_TOP_N) if rerank else k
+    repo_ids = list(dict.fromkeys(repo_ids))
+    query_embs = encode_queries([query]) if mode != "lexical" else None
+    options = {"aggregate": aggregate, "nprobe": nprobe, "ef_search": ef_search, "mode": mode, "filters": filters}
+
+    futures = {
+        SHARD_POOL.submit(_search_shard, repo_id, query, query_embs, depth, options): repo_id for repo_id in repo_ids
+    }
+    done, not_done = wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+
+    shard_rankings = {}
+    skipped = {}
+    for future in done:
+        repo_id = futures[future]
+        try:
+            shard_rankings[repo_id] = future.result()
+        except Exception as e:
+            # Not embedded yet, embedded with another model, unreadable: the other shards still answer.
+            skipped[repo_id] = str(e)
+
+    # Every shard ranking is sorted best first, so a k-way heap merge yields the
+    # global order; only the first depth * CHUNK_OVERFETCH are kept, as for one repo.
+    merged = []
+    for n in range(2 if mode == "hybrid" else 1):
+        streams = [
+            [((repo_id, cid), score) for cid, score in rankings[n]] for repo_id, rankings in shard_rankings.items()
+        ]
+        merged.append(list(islice(heapq.merge(*streams, key=lambda item: -item[1]), depth * CHUNK_OVERFETCH)))
+    ranked = _fuse(merged, depth)
+
+    by_repo = {}
+    for (repo_id, cid), score in ranked:
+        by_repo.setdefault(repo_id, []).append((cid, score))
+    load_fields = (*fields, "diff") if rerank == "cross-encoder" else fields
+    commits = {}
+    lexical = {}
+    for repo_id, repo_ranked in by_repo.items():
+        repo_dir = os.path.join(DATA_DIR, repo_id)
+        loaded = _load_results(repo_dir, [cid for cid, _ in repo_ranked], max_message_len, load_fields)
+        for cid, commit in loaded.items():
+            commit["repo_id"] = repo_id
+            commits[(repo_id, cid)] = commit
+        if rerank == "lexical":
+            lexical.update(_rerank_fields(repo_dir, loaded))
+
+    results = [dict(commits[key], score=score) for key, score in ranked if key in commits]
+    if rerank:
+        results = RERANKER.rerank_many([query], [results], rerank, rerank_budget_ms, lexical)[0]
+    results = results[:k]
+    if rerank == "cross-encoder" and "diff" not in fields:
+        results = _drop_diffs(results)
+    return {
+        "results": results,
+        "searched": sorted(shard_rankings),
+        "skipped": skipped,
+        "timed_out": sorted(futures[f] for f in not_done),
+    }
 
 
 class RepoRequest(BaseModel):
     repo_path: str
 
+def run_ingest(job: IngestJob):
+    """Clone/fetch, walk and embed one repo, reporting progress on the job."""
+    repo = open_repo(job.repo_path, job.repo_id)
+    heads = get_heads(repo)
+    since = load_watermark(job.repo_id)
+    job.total = count_commits(repo, since)
+    dropped = get_dropped_commits(repo, job.repo_id, since)
+
+    stats = embed_and_save(
+        job.repo_id, get_commits(repo, since=since), progress=job.update, heads=heads, removed=dropped
+    )
+
+    return {
+        "message": f"Embedded {stats['embedded']} new commits.",
+        "commit_count": stats["walked"],
+        "embedding_cache": EMBEDDING_CACHE.stats(),
+    }
+
+
 @router.post("/embed-repo")
 def process_repo(request: RepoRequest):
-    print("helloo", request)
     repo_id = get_repo_id(request.repo_path)
-    commits = get_commits(request.repo_path)
-    result_message = embed_and_save(repo_id, commits)
+    try:
+        job = INGEST_QUEUE.submit(repo_id, request.repo_path, run_ingest)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return {"repo_id": repo_id, "job_id": job.id, "status": job.status}
 
-    return {"repo_id": repo_id, "message": result_message, "commit_count": len(commits)}
+
+@router.get("/embed-repo/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = INGEST_QUEUE.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.delete("/embed-repo/jobs/{job_id}")
+def cancel_ingest_job(job_id: str):
+    job = INGEST_QUEUE.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 # @router.post("/analyze-query")
 # def analyze_query(request: dict):
 #     try:
@@ -290,27 +874,185 @@ def process_repo(request: RepoRequest):
 
 
 
+@router.get("/index-cache/stats")
+def index_cache_stats():
+    return INDEX_CACHE.stats()
+
+
+@router.get("/query-cache/stats")
+def query_cache_stats():
+    return QUERY_CACHE.stats()
+
+
+@router.get("/answer-cache/stats")
+def answer_cache_stats():
+    return ANSWER_CACHE.stats()
+
+
+@router.get("/reranker/stats")
+def reranker_stats():
+    return RERANKER.stats()
+
+
+def _search_options(request: dict):
+    return {
+        "nprobe": request.get("nprobe"),
+        "ef_search": request.get("ef_search"),
+        "mode": request.get("mode", "hybrid"),
+        "filters": request.get("filters"),
+        "rerank": request.get("rerank", DEFAULT_RERANKER),
+        "rerank_budget_ms": request.get("rerank_budget_ms", RERANK_BUDGET_MS),
+        "fields": ANSWER_FIELDS,
+    }
+
+
+def _commit_summaries(top_commits):
+    return [
+        {
+            "date": c["date"],
+            "author": c["author"],
+            "message": c["message"].strip(),
+            "hash": c["hash"][:7]
+        }
+        for c in top_commits
+    ]
+
+
 @router.post("/analyze-query")
-def analyze_query(request: dict):
+async def analyze_query(request: dict):
     try:
         repo_id = request["repo_id"]
         query = request["query"]
+        options = _search_options(request)
 
-        top_commits = retrieve_top_k(repo_id, query)
-        summary = ask_llm(top_commits, query)
+        # Search is CPU-bound and runs on the threadpool; the LLM call then waits
+        # on the event loop without holding a thread.
+        slot = await run_in_threadpool(_answer_slot, repo_id, query, options)
+        cached, tier = ANSWER_CACHE.get(*slot) if slot else (None, None)
+        if cached is not None:
+            return dict(cached, cached=tier)
 
-        return {
-            "top_commits": [
-                {
-                    "date": c["date"],
-                    "author": c["author"],
-                    "message": c["message"].strip(),
-                    "hash": c["hash"][:7]
-                }
-                for c in top_commits
-            ],
+        top_commits = await run_in_threadpool(retrieve_top_k, repo_id, query, **options)
+        summary = await ask_llm(top_commits, query, diff_loader(repo_id))
+
+        response = {
+            "top_commits": _commit_summaries(top_commits),
             "summary": summary
         }
+        if slot and summary != LLM_FAILED_ANSWER:
+            ANSWER_CACHE.put(slot[0], slot[1], response, slot[2])
+        return response
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _answer_slot(repo_id: str, query: str, options):
+    """Where an /analyze-query answer is cached: (scope, normalized query, query embedding), or None.
+
+    The embedding is only computed for the semantic tier, and not for keyword-only search.
+    """
+    repo_dir = os.path.join(DATA_DIR, repo_id)
+    manifest = load_manifest(repo_dir) if os.path.isdir(repo_dir) else None
+    if not manifest or not manifest["rows"]:
+        return None
+    scope = (repo_id, manifest["generation"], MODEL.key, json.dumps(options, sort_keys=True, default=str))
+    vector = encode_queries([query])[0] if ANSWER_CACHE.semantic and options["mode"] != "lexical" else None
+    return scope, normalize_query(query), vector
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/analyze-query/stream")
+async def analyze_query_stream(request: Request):
+    """/analyze-query as server-sent events, so the answer shows up while it is generated.
+
+    Sends "commits" ({"top_commits": [...]}) as soon as retrieval is done, then one
+    "token" ({"text": ...}) per piece of the LLM's answer, then "done"; "error"
+    ({"error": ...}) replaces whatever could not be sent. When the client goes away
+    the upstream LLM stream is closed, so no more tokens are generated or paid for.
+    Cached answers come as one "token", with "cached" set on the "commits" event.
+    """
+    body = await request.json()
+
+    async def events():
+        try:
+            query = body["query"]
+            options = _search_options(body)
+            slot = await run_in_threadpool(_answer_slot, body["repo_id"], query, options)
+            cached, tier = ANSWER_CACHE.get(*slot) if slot else (None, None)
+            if cached is None:
+                top_commits = await run_in_threadpool(retrieve_top_k, body["repo_id"], query, **options)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+            return
+        if cached is not None:
+            # The whole answer in one token event.
+            yield _sse("commits", {"top_commits": cached["top_commits"], "cached": tier})
+            yield _sse("token", {"text": cached["summary"]})
+            yield _sse("done", {})
+            return
+        yield _sse("commits", {"top_commits": _commit_summaries(top_commits)})
+
+        tokens = None
+        pieces = []
+        try:
+            tokens = await stream_llm(top_commits, query, diff_loader(body["repo_id"]))
+            async for text in tokens:
+                if await request.is_disconnected():
+                    return
+                pieces.append(text)
+                yield _sse("token", {"text": text})
+            summary = "".join(pieces)
+            # Only a whole answer is cached: the loop above ran to "[DONE]" (stream_chat
+            # raises otherwise), and an empty one would be replayed as a blank answer.
+            if slot and summary.strip():
+                answer = {"top_commits": _commit_summaries(top_commits), "summary": summary}
+                ANSWER_CACHE.put(slot[0], slot[1], answer, slot[2])
+            yield _sse("done", {})
+        except Exception as e:
+            print("LLM stream failed:", repr(e))
+            yield _sse("error", {"error": "Failed to get response from LLM."})
+        finally:
+            # Also runs when the response is cancelled on disconnect.
+            if tokens is not None:
+                await tokens.aclose()
+
+    # no-cache / no buffering so proxies pass each event on immediately.
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/analyze-query/batch")
+async def analyze_query_batch(request: dict):
+    """Several queries against one repo: one encode call and one index search for all of them.
+
+    Same options as /analyze-query; pass "summarize": false to skip the per-query LLM summaries.
+    """
+    try:
+        repo_id = request["repo_id"]
+        queries = request["queries"]
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise ValueError("queries must be a list of strings")
+
+        all_top_commits = await run_in_threadpool(retrieve_top_k_many, repo_id, queries, **_search_options(request))
+        results = [
+            {"query": query, "top_commits": _commit_summaries(top_commits)}
+            for query, top_commits in zip(queries, all_top_commits)
+        ]
+        if request.get("summarize", True):
+            # Summaries are requested concurrently, within the LLM client's concurrency bound.
+            summaries = await asyncio.gather(
+                *(
+                    ask_llm(top_commits, query, diff_loader(repo_id))
+                    for query, top_commits in zip(queries, all_top_commits)
+                )
+            )
+            for result, summary in zip(results, summaries):
+                result["summary"] = summary
+        return {"results": results}
     except Exception as e:
         return {"error": str(e)}
 
@@ -320,12 +1062,12 @@ class RepoRequest(BaseModel):
 
 
 @router.post("/analyze-repo")
-def analyze_repo(request: RepoRequest):
+async def analyze_repo(request: RepoRequest):
     repo_url = request.repo_path.strip()
     try:
 
         query = "Give a concise name for this repository based on its content. Return ONLY the name. Use exactly 2 words. Do not include quotes or extra text or brackets or explanations."
-        generated_name = ask_llm_name(repo_url, query)
+        generated_name = await ask_llm_name(repo_url, query)
         print("repo", generated_name)
 
         return {
@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Resident budget for loaded repo indexes; least recently queried repos are dropped first.
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "1024"))
+
+
+class IndexCache:
+    """Loaded per-repo search state, keyed by repo dir and valid for one manifest generation."""
+
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str, generation: int, load):
+        """Return the value cached for (key, generation); on a miss `load()` returns (value, nbytes)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Load outside the lock so a cold repo doesn't stall queries on warm ones.
+        value, nbytes = load()
+
+        with self._lock:
+            self._remove(key)
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (generation, value, nbytes)
+                self.bytes += nbytes
+                while self.bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._remove(oldest)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if self._remove(key):
+                self.invalidations += 1
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[2]
+        return True
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,138 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "32"))
+# Finished jobs kept around for status polling.
+JOB_HISTORY = 200
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, repo_id: str, repo_path: str):
+        self.id = uuid.uuid4().hex
+        self.repo_id = repo_id
+        self.repo_path = repo_path
+        self.status = "queued"
+        self.total = None
+        self.walked = 0
+        self.embedded = 0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    def update(self, walked: int, embedded: int):
+        """Progress callback for the ingest loop; raises JobCancelled once cancel is requested."""
+        self.walked = walked
+        self.embedded = embedded
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def eta_seconds(self):
+        if self.status != "running" or not self.total or not self.walked:
+            return None
+        rate = self.walked / (time.time() - self.started_at)
+        return max(self.total - self.walked, 0) / rate
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "repo_id": self.repo_id,
+            "status": self.status,
+            "total_commits": self.total,
+            "commits_walked": self.walked,
+            "commits_embedded": self.embedded,
+            "eta_seconds": self.eta_seconds(),
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class IngestQueue:
+    """Bounded worker pool for ingest jobs, with at most one active job per repo."""
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_pending: int = INGEST_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active_by_repo = {}
+
+    def submit(self, repo_id: str, repo_path: str, run):
+        """Queue `run(job)` for a repo, or return the job already queued/running for it."""
+        with self._lock:
+            active = self._active_by_repo.get(repo_id)
+            if active is not None:
+                return active
+
+            pending = sum(1 for job in self._active_by_repo.values() if job.status == "queued")
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} ingest jobs already queued")
+
+            job = IngestJob(repo_id, repo_path)
+            self._jobs[job.id] = job
+            self._active_by_repo[repo_id] = job
+            self._trim_history()
+
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job._cancel.set()
+        with self._lock:
+            if job.status == "queued":
+                self._finish(job, "cancelled")
+        return job
+
+    def _run(self, job, run):
+        with self._lock:
+            if job.status != "queued":
+                return
+            job.status = "running"
+            job.started_at = time.time()
+
+        try:
+            job.result = run(job)
+            status = "succeeded"
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            print(f"Ingest job {job.id} for {job.repo_id} failed:", e)
+            job.error = str(e)
+            status = "failed"
+
+        with self._lock:
+            self._finish(job, status)
+
+    def _finish(self, job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        if self._active_by_repo.get(job.repo_id) is job:
+            del self._active_by_repo[job.repo_id]
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[: max(len(finished) - JOB_HISTORY, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,98 @@
+import os
+import re
+
+from chunking import split_diff_files
+
+# Lexical side of hybrid search: an SQLite FTS5 (BM25) index over each commit's
+# message, touched paths and diff identifiers, kept in the repo's commits.sqlite.
+LEXICAL_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lexical "
+    "USING fts5(message, paths, diff, tokenize = \"unicode61 tokenchars '_'\")"
+)
+# Per-term document counts of the table above.
+LEXICAL_VOCAB_SQL = "CREATE VIRTUAL TABLE IF NOT EXISTS lexical_vocab USING fts5vocab(lexical, row)"
+# BM25 column weights for (message, paths, diff).
+LEXICAL_WEIGHTS = (2.0, 3.0, 1.0)
+# Each distinct diff token is indexed once per commit; huge diffs are capped.
+MAX_DIFF_TOKENS = int(os.getenv("MAX_DIFF_TOKENS", "4000"))
+# Reciprocal-rank fusion constant: score = sum of 1 / (RRF_K + rank) over rankings.
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Only dropped from queries; they'd match nearly every commit and add nothing to the ranking.
+_STOPWORDS = frozenset(
+    "a an and are as at be by commit commits did do does for from how in is it of on or that the this to was "
+    "were what when where which who why with".split()
+)
+
+
+def tokenize(text: str):
+    """Lower-cased words, with camelCase / snake_case identifiers also split into their parts."""
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        tokens.append(word.lower())
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def _diff_text(section: str):
+    # Changed lines and hunk-header context (usually the enclosing function) only.
+    for line in section.splitlines():
+        if line.startswith(("+++", "---")):
+            continue
+        if line.startswith(("+", "-")):
+            yield line[1:]
+        elif line.startswith("@@"):
+            yield line.rpartition("@@")[2]
+
+
+def lexical_fields(commit):
+    """(message, paths, diff) text indexed for one commit."""
+    paths = []
+    diff_tokens = {}
+    for path, section in split_diff_files(commit.get("diff", "")):
+        paths.append(path)
+        for line in _diff_text(section):
+            for token in tokenize(line):
+                if len(diff_tokens) >= MAX_DIFF_TOKENS:
+                    break
+                diff_tokens.setdefault(token, None)
+    return (
+        " ".join(tokenize(commit.get("message") or "")),
+        " ".join(tokenize(" ".join(paths))),
+        " ".join(diff_tokens),
+    )
+
+
+def query_terms(query: str):
+    """Distinct search terms of a query, in order."""
+    return list(dict.fromkeys(t for t in tokenize(query) if t not in _STOPWORDS))
+
+
+def selective_terms(terms, doc_counts, total: int):
+    """Drop terms found in over half the commits, unless that would drop them all.
+
+    FTS5's bm25() clamps their IDF to ~0, so they never change the ranking;
+    they only make the query visit (nearly) every row.
+    """
+    selective = [t for t in terms if doc_counts.get(t, 0) * 2 <= total]
+    return selective or terms
+
+
+def match_expression(terms) -> str:
+    """An FTS5 MATCH string ranking rows that contain any of `terms`."""
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def rrf_fuse(rankings, k: int = RRF_K):
+    """Fuse ranked lists of ids into one [(id, score)] list, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,96 @@
+import asyncio
+import importlib.util
+import json
+import os
+
+import httpx
+
+# OpenRouter chat completions; point LLM_URL at a local mock server to test without the real API.
+LLM_URL = os.getenv("LLM_URL", "https://openrouter.ai/api/v1/chat/completions")
+# Whole-call budget per question, including the wait for a concurrency slot.
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+# Questions in flight at once; the rest wait (within their timeout) instead of piling onto the API.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "60"))
+# HTTP/2 multiplexes concurrent questions over one connection; needs `pip install httpx[http2]`.
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") != "0"
+
+
+class LLMClient:
+    """One shared async HTTP client for chat completions: pooled keep-alive connections, bounded concurrency.
+
+    The httpx client and semaphore are created on first use, inside the serving event loop.
+    """
+
+    def __init__(self, url: str = LLM_URL, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT_S):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._client = None
+        self._slots = None
+
+    def _open(self):
+        http2 = LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+        if LLM_HTTP2 and not http2:
+            print("h2 is not installed; LLM client falls back to HTTP/1.1 keep-alive")
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=LLM_KEEPALIVE_S,
+            ),
+        )
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def _post(self, payload, headers):
+        async with self._slots:
+            response = await self._client.post(self.url, json=payload, headers=headers)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def _headers(self, api_key: str):
+        if self._client is None:
+            self._open()
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    async def chat(self, payload, api_key: str, timeout: float = None) -> str:
+        """Send one chat-completions request and return the first choice's text; raises on failure or timeout."""
+        headers = self._headers(api_key)
+        return await asyncio.wait_for(self._post(payload, headers), timeout or self.timeout)
+
+    async def stream_chat(self, payload, api_key: str):
+        """Yield the first choice's text as it is generated (server-sent events, "stream": true).
+
+        Closing the generator, or cancelling whatever iterates it, closes the upstream
+        response, so the provider stops generating. Each wait for the next chunk is
+        bounded by the client's read timeout rather than one whole-call timeout. Raises
+        if the stream ends without "[DONE]", so a cut-off answer never looks complete.
+        """
+        headers = self._headers(api_key)
+        async with self._slots:
+            request = self._client.stream("POST", self.url, json=dict(payload, stream=True), headers=headers)
+            async with request as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # Blank separators and ": keep-alive" comments carry no data.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    chunk = json.loads(data)
+                    if "error" in chunk:
+                        raise RuntimeError(chunk["error"].get("message", "LLM stream failed"))
+                    text = chunk["choices"][0].get("delta", {}).get("content")
+                    if text:
+                        yield text
+                # A connection dropped mid-answer ends the lines without the terminator.
+                raise RuntimeError("LLM stream ended before [DONE]")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
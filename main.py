@@ -8,6 +8,7 @@ from models.chat_history import create_history_table
 from models.repo_names import create_tables
 from models.users import create_users
 import gitretrieval
+from migrate_data import migrate_all
 from models.config import conn
 import search_commits
 
@@ -50,8 +51,17 @@ async def add_cors_headers(request: Request, call_next):
     response.headers["Access-Control-Max-Age"] = "3600"
     return response
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await search_commits.LLM_CLIENT.aclose()
+
+
 @app.on_event("startup")
 def on_startup():
+    # Repos still in the commits.json layout can't be searched. Every worker runs this; the
+    # repo lock makes the others wait and then find nothing left to convert.
+    migrate_all(gitretrieval.DATA_DIR)
+
     try:
         cur = conn.cursor()
 
@@ -0,0 +1,40 @@
+import argparse
+import os
+
+from commit_store import ensure_search_tables, finalize_migration, has_commits, migrate_legacy, repo_lock
+
+DATA_DIR = "data"
+
+
+def migrate_all(data_dir: str = DATA_DIR, finalize: bool = False):
+    """Bring every repo dir under data_dir to the current store: convert legacy layouts, rebuild stale search tables.
+
+    With finalize, also delete the commits.json and faiss.index of repo dirs already converted.
+    """
+    if not os.path.isdir(data_dir):
+        return
+    converted = 0
+    finalized = 0
+    for name in sorted(os.listdir(data_dir)):
+        repo_dir = os.path.join(data_dir, name)
+        if not os.path.isdir(repo_dir) or not has_commits(repo_dir):
+            continue
+        # Waits for an ingest of the same repo to finish.
+        with repo_lock(repo_dir):
+            migrated = migrate_legacy(repo_dir)
+            rebuilt = ensure_search_tables(repo_dir)
+            if finalize and finalize_migration(repo_dir):
+                finalized += 1
+        if migrated or rebuilt:
+            converted += 1
+    print(f"✅ Migrated {converted} repo directories in {data_dir}")
+    if finalize:
+        print(f"✅ Removed legacy files from {finalized} repo directories")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("--finalize", action="store_true", help="delete commits.json and faiss.index once converted")
+    args = parser.parse_args()
+    migrate_all(args.data_dir, finalize=args.finalize)
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+
+from sentence_transformers import CrossEncoder
+
+from chunking import diff_paths
+from lexical_index import LEXICAL_WEIGHTS, lexical_fields, query_terms
+
+# Optional second stage: re-score each query's first-stage top RERANK_TOP_N commits.
+#   lexical        weighted coverage of the query's terms by message / paths / diff; no model
+#   cross-encoder  RERANK_MODEL reads (query, commit text) pairs jointly
+RERANKERS = ("lexical", "cross-encoder")
+# Used when a request doesn't pick one; empty means no re-ranking.
+DEFAULT_RERANKER = os.getenv("RERANKER", "")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# Per request; commits not scored in time keep their first-stage order.
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+# Assumed cross-encoder cost per pair until one has been measured, so even a first batch fits the budget.
+RERANK_PAIR_MS = float(os.getenv("RERANK_PAIR_MS", "5"))
+# Changed-line text given to the cross-encoder per commit; it truncates to its own max length anyway.
+RERANK_MAX_DIFF_CHARS = int(os.getenv("RERANK_MAX_DIFF_CHARS", "1500"))
+# How long the cross-encoder is left alone after it measured too slow for the budget (or failed
+# to load) before one pair is timed again in the background.
+RERANK_PROBE_S = float(os.getenv("RERANK_PROBE_S", "30"))
+
+_cross_encoder = None
+# Held while the cross-encoder scores: HF tokenizers aren't thread-safe, so requests take turns.
+_cross_encoder_lock = threading.Lock()
+_load_lock = threading.Lock()
+_loader = None
+_load_failed_at = None
+
+
+def check_reranker(reranker):
+    if reranker and reranker not in RERANKERS:
+        raise ValueError(f"Unknown reranker {reranker!r}; expected one of {', '.join(RERANKERS)}")
+
+
+def _load_cross_encoder():
+    global _cross_encoder, _load_failed_at, _loader
+    try:
+        print(f"Loading re-ranking model {RERANK_MODEL}")
+        model = CrossEncoder(RERANK_MODEL)
+        # The first predict is much slower than the rest; pay it here rather than in a request's budget.
+        with _cross_encoder_lock:
+            model.predict([("warm up", "warm up")], show_progress_bar=False)
+        _cross_encoder = model
+    except Exception as e:
+        print(f"❌ Failed to load re-ranking model {RERANK_MODEL}: {e}")
+        _load_failed_at = time.monotonic()
+    finally:
+        with _load_lock:
+            _loader = None
+
+
+def get_cross_encoder(wait: bool = True):
+    """The process-wide RERANK_MODEL, loaded in a background thread on first use (at import when RERANKER picks it).
+
+    Without `wait`, returns None until the model is ready. A failed load is retried
+    after RERANK_PROBE_S.
+    """
+    global _loader
+    if _cross_encoder is None:
+        with _load_lock:
+            retry = _load_failed_at is None or time.monotonic() - _load_failed_at >= RERANK_PROBE_S
+            if _cross_encoder is None and _loader is None and (wait or retry):
+                _loader = threading.Thread(target=_load_cross_encoder, daemon=True)
+                _loader.start()
+            loader = _loader
+        if wait and loader is not None:
+            loader.join()
+        if wait and _cross_encoder is None:
+            raise RuntimeError(f"Re-ranking model {RERANK_MODEL} failed to load")
+    return _cross_encoder
+
+
+def rerank_text(commit) -> str:
+    """Message, touched paths and the start of the changed lines of a commit."""
+    diff = commit.get("diff", "")
+    changed = []
+    size = 0
+    for line in diff.splitlines():
+        if line.startswith(("+", "-")) and not line.startswith(("+++", "---")):
+            changed.append(line)
+            size += len(line) + 1
+            if size >= RERANK_MAX_DIFF_CHARS:
+                break
+    parts = [(commit.get("message") or "").strip(), " ".join(diff_paths(diff)), "\n".join(changed)]
+    return "\n".join(part for part in parts if part)
+
+
+def score_lexical(pairs, fields=None):
+    """Share of the query's terms found in each commit, a term in the paths counting most, in the diff least.
+
+    `fields` maps commit hashes to their indexed (message, paths, diff) text, which
+    is much cheaper than tokenizing the diff again; other commits are tokenized.
+    """
+    fields = fields or {}
+    scores = []
+    best = max(LEXICAL_WEIGHTS)
+    for query, commit in pairs:
+        terms = query_terms(query)
+        commit_fields = fields.get(commit["hash"]) or lexical_fields(commit)
+        commit_fields = [set(text.split()) for text in commit_fields]
+        found = sum(
+            max((w for w, field in zip(LEXICAL_WEIGHTS, commit_fields) if term in field), default=0.0) for term in terms
+        )
+        scores.append(found / (best * len(terms)) if terms else 0.0)
+    return scores
+
+
+def score_cross_encoder(pairs, fields=None):
+    """Cross-encoder scores; the caller holds _cross_encoder_lock."""
+    texts = [(query, rerank_text(commit)) for query, commit in pairs]
+    return get_cross_encoder().predict(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+
+class Reranker:
+    """Re-orders first-stage results within a time budget; counts how often the budget ran out."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Moving average of seconds per scored pair, per re-ranker; sizes batches to the budget left.
+        self._pair_s = {"cross-encoder": RERANK_PAIR_MS / 1000}
+        # When the cross-encoder was last found or timed too slow for a request's budget.
+        self._slow_at = None
+        self.requests = 0
+        self.pairs_scored = 0
+        self.budget_exhausted = 0
+        self.lexical_fallbacks = 0
+        self.model_loading = 0
+        self.seconds = 0.0
+
+    def _probe(self, query, commit):
+        """Time one cross-encoder pair and take it as the estimate, so a slow spell doesn't stick."""
+        with _cross_encoder_lock:
+            began = time.perf_counter()
+            score_cross_encoder([(query, commit)])
+            took = time.perf_counter() - began
+        with self._lock:
+            self._pair_s["cross-encoder"] = took
+
+    def rerank_many(self, queries, candidates, reranker: str, budget_ms: float = RERANK_BUDGET_MS, fields=None):
+        """Re-order each query's candidate commits (given in first-stage order) by `reranker` scores.
+
+        (query, commit) pairs are scored in batches of up to RERANK_BATCH_SIZE, every
+        query's best first-stage ranks first. Each batch is cut to what the measured
+        cost per pair says still fits in the budget; once not even one pair does, each
+        query's scored commits go, best score first, ahead of its unscored ones, which
+        keep their first-stage order. Scored commits get a "rerank_score".
+        The budget covers waiting for the cross-encoder, which scores one batch at a time
+        across requests. Until it has loaded, candidates keep their first-stage order. If
+        not even one of its pairs fits the budget, the lexical re-ranker is used instead,
+        and every RERANK_PROBE_S one pair is timed in the background to see whether it
+        fits again. `fields` is passed to score_lexical.
+        """
+        check_reranker(reranker)
+        start = time.perf_counter()
+        deadline = start + budget_ms / 1000
+        pairs = [
+            (n, i)
+            for i in range(max(map(len, candidates), default=0))
+            for n in range(len(queries))
+            if i < len(candidates[n])
+        ]
+
+        loading = fallback = False
+        lock = None
+        if reranker == "cross-encoder":
+            if get_cross_encoder(wait=False) is None:
+                loading = True
+                pairs = []
+            else:
+                probe = False
+                now = time.monotonic()
+                with self._lock:
+                    fallback = self._pair_s[reranker] > budget_ms / 1000
+                    if not fallback:
+                        self._slow_at = None
+                    elif self._slow_at is None:
+                        self._slow_at = now
+                    elif now - self._slow_at >= RERANK_PROBE_S:
+                        self._slow_at = now
+                        probe = True
+                if probe and pairs:
+                    n, i = pairs[0]
+                    threading.Thread(target=self._probe, args=(queries[n], candidates[n][i]), daemon=True).start()
+                if fallback:
+                    reranker = "lexical"
+                else:
+                    lock = _cross_encoder_lock
+        score = score_lexical if reranker == "lexical" else score_cross_encoder
+
+        scores = [{} for _ in queries]
+        scored = 0
+        while scored < len(pairs):
+            if lock is not None and not lock.acquire(timeout=max(deadline - time.perf_counter(), 0)):
+                break
+            try:
+                began = time.perf_counter()
+                with self._lock:
+                    pair_s = self._pair_s.get(reranker)
+                size = RERANK_BATCH_SIZE
+                if pair_s:
+                    size = min(size, int((deadline - began) / pair_s))
+                if size < 1 or began >= deadline:
+                    break
+                batch = pairs[scored:scored + size]
+                batch_scores = score([(queries[n], candidates[n][i]) for n, i in batch], fields)
+            finally:
+                if lock is not None:
+                    lock.release()
+            for (n, i), s in zip(batch, batch_scores):
+                scores[n][i] = float(s)
+            scored += len(batch)
+            took = (time.perf_counter() - began) / len(batch)
+            with self._lock:
+                # Re-read: concurrent requests update the same estimate.
+                pair_s = self._pair_s.get(reranker)
+                self._pair_s[reranker] = took if pair_s is None else 0.8 * pair_s + 0.2 * took
+
+        with self._lock:
+            self.requests += 1
+            self.pairs_scored += scored
+            self.budget_exhausted += scored < len(pairs)
+            self.lexical_fallbacks += fallback
+            self.model_loading += loading
+            self.seconds += time.perf_counter() - start
+
+        reranked = []
+        for query_scores, query_candidates in zip(scores, candidates):
+            # sorted() is stable: ties keep first-stage order.
+            order = sorted(query_scores, key=lambda i: -query_scores[i])
+            results = [dict(query_candidates[i], rerank_score=query_scores[i]) for i in order]
+            results += [c for i, c in enumerate(query_candidates) if i not in query_scores]
+            reranked.append(results)
+        return reranked
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "pairs_scored": self.pairs_scored,
+                "budget_exhausted": self.budget_exhausted,
+                "lexical_fallbacks": self.lexical_fallbacks,
+                "model_loading": self.model_loading,
+                "mean_ms": round(self.seconds * 1000 / self.requests, 3) if self.requests else 0.0,
+            }
@@ -1,18 +1,27 @@
 import os
 import json
 import faiss
-import requests
 import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+
+from context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from embeddings import get_embedder
+from llm_client import LLMClient
 
 router =  APIRouter()
 
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv('OPEN_ROUTER_AI_KEY')
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Shared by every LLM call: pooled keep-alive connections instead of a new TLS handshake per question.
+LLM_CLIENT = LLMClient()
+# What ask_llm answers when the LLM call fails.
+LLM_FAILED_ANSWER = "⚠️ Failed to get response from LLM."
+# Caps each answer's length; with the packed context this bounds each call's tokens, latency and cost.
+LLM_MAX_ANSWER_TOKENS = int(os.getenv("LLM_MAX_ANSWER_TOKENS", "500"))
+
+model = get_embedder()
 index = faiss.read_index("faiss.index")
 
 with open("commits_with_embeddings.json") as f:
@@ -70,29 +79,12 @@ with open("commits_with_embeddings.json") as f:
     
 
 
-def load_repo_data(repo_id):
-    """Load commits + FAISS index for a given repo_id"""
-    repo_dir = f"data/{repo_id}"
-
-    # Load commits
-    with open(f"{repo_dir}/commits.json", "r") as f:
-        commits = json.load(f)
-
-    # Load FAISS index
-    index = faiss.read_index(f"{repo_dir}/faiss.index")
-
-    return commits, index
-
-
-def retrieve_top_k(repo_id, query, k=3, model_name="all-MiniLM-L6-v2"):
-    """Retrieve top-k relevant commits for a query from a given repo"""
-    commits, index = load_repo_data(repo_id)
-    model = SentenceTransformer(model_name)
-
-    query_vec = model.encode(query).astype("float32").reshape(1, -1)
-    _, indices = index.search(query_vec, k)
+def retrieve_top_k(repo_id, query, k=3):
+    """Retrieve top-k relevant commits, with their diffs, for a query from a given repo"""
+    # Imported here: gitretrieval imports this module for ask_llm.
+    import gitretrieval
 
-    return [commits[i] for i in indices[0]]
+    return gitretrieval.retrieve_top_k(repo_id, query, k=k, fields=(*gitretrieval.RESULT_FIELDS, "diff"))
 
 
 # def ask_llm(commit_context, question):
@@ -141,17 +133,19 @@ def retrieve_top_k(repo_id, query, k=3, model_name="all-MiniLM-L6-v2"):
 #     except Exception as e:
 #         return f"LLM request failed: {str(e)}"
 
-def ask_llm(top_commits, query: str):
-    commit_summaries = "\n".join(
-        [f"- {c['hash'][:7]} ({c['date']} by {c['author']}): {c['message']}" for c in top_commits]
-    )
+def answer_payload(top_commits, query: str, load_diff=None):
+    """The chat request for ask_llm: commit context packed into CONTEXT_TOKEN_BUDGET (see context_packer.py).
+
+    With `load_diff(commit)` the context includes the diff hunks most relevant to the query.
+    """
+    context, _ = pack_context(top_commits, query, CONTEXT_TOKEN_BUDGET, load_diff)
 
     prompt = f"""
     You are analyzing a Git repository.
     The user asked: "{query}".
 
-    Here are the most relevant commits:
-    {commit_summaries}
+    Here are the most relevant commits, with the most relevant parts of their diffs:
+    {context}
 
     Provide a concise, human-readable answer.
     """
@@ -161,30 +155,33 @@ def ask_llm(top_commits, query: str):
         "messages": [
             {"role": "system", "content": "You are a helpful Git commit analyst."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        "max_tokens": LLM_MAX_ANSWER_TOKENS,
     }
+    return payload
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+async def ask_llm(top_commits, query: str, load_diff=None):
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        # Packing may read diffs from disk.
+        payload = await run_in_threadpool(answer_payload, top_commits, query, load_diff)
+        return await LLM_CLIENT.chat(payload, OPENROUTER_API_KEY)
     except Exception as e:
-        print("LLM request failed:", e)
-        return "⚠️ Failed to get response from LLM."
+        print("LLM request failed:", repr(e))
+        return LLM_FAILED_ANSWER
+
 
+async def stream_llm(top_commits, query: str, load_diff=None):
+    """ask_llm's answer as an async generator of text pieces as they are generated; it raises if the call fails.
+
+    Await it for the generator, and aclose() that when done early, so the upstream stream is closed right away.
+    """
+    payload = await run_in_threadpool(answer_payload, top_commits, query, load_diff)
+    return LLM_CLIENT.stream_chat(payload, OPENROUTER_API_KEY)
 
 
-def ask_llm_name(url, question):
+
+async def ask_llm_name(url, question):
     
 
     prompt = f"""You are a helpful and expert AI code assistant. Below is a url and a query
@@ -196,30 +193,23 @@ Now answer the following query sticking to its rules nad requirements:
 {question}
 """
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "model": "mistralai/mistral-7b-instruct",
         "messages": [{"role": "user", "content": prompt}]
     }
 
     try:
-        res = requests.post(url, headers=headers, json=payload)
-        res.raise_for_status()
-        return res.json()["choices"][0]["message"]["content"]
+        return await LLM_CLIENT.chat(payload, OPENROUTER_API_KEY)
     except Exception as e:
-        return f"LLM request failed: {str(e)}"
+        return f"LLM request failed: {str(e) or repr(e)}"
 
 
 @router.post("/analyze-query")
-def analyze_query(query: str):
+async def analyze_query(query: str):
     
     try:
         top_commits = retrieve_top_k(query)
-        summary = ask_llm(top_commits, query)
+        summary = await ask_llm(top_commits, query)
 
         return {
             "top_commits": [
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+# Structured search filters, e.g. {"author": "yemi", "since": "2024-05-01", "path": "scanner/*"}:
+#   author  case-insensitive prefix of the author name or email
+#   since   ISO date or datetime, inclusive
+#   until   ISO date or datetime; a bare date includes that whole day
+#   path    path prefix (file or directory) a commit touched, or a glob over those paths (SQLite GLOB: * also matches /)
+# They are resolved in SQL on indexed columns of the commit store before searching,
+# never by filtering results afterwards.
+FILTER_FIELDS = ("author", "since", "until", "path")
+
+
+def commit_timestamp(date: str):
+    """Unix time of a commit's ISO-8601 date, or None if it has none."""
+    if not date:
+        return None
+    return int(_parse_datetime(date).timestamp())
+
+
+def _parse_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    # Naive dates and times are taken as UTC.
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_bound(name: str, value: str, end_of_day: bool) -> int:
+    try:
+        parsed = _parse_datetime(value)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Filter {name!r} must be an ISO date or datetime, got {value!r}")
+    if end_of_day and len(value.strip()) == 10:
+        return int((parsed + timedelta(days=1)).timestamp()) - 1
+    return int(parsed.timestamp())
+
+
+def parse_filters(raw):
+    """Validate a filters object from a request; returns a normalized dict, or None if it filters nothing."""
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(raw) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}; expected {', '.join(FILTER_FIELDS)}")
+
+    filters = {}
+    for name in ("author", "path"):
+        value = raw.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Filter {name!r} must be a string")
+        if value and value.strip():
+            filters[name] = value.strip()
+    if raw.get("since"):
+        filters["since"] = _parse_bound("since", raw["since"], end_of_day=False)
+    if raw.get("until"):
+        filters["until"] = _parse_bound("until", raw["until"], end_of_day=True)
+    return filters or None
+
+
+def _prefix_range(prefix: str):
+    # Under NOCASE, [prefix, prefix with its last character bumped) is every string it starts.
+    prefix = prefix.lower()
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _path_glob(path: str) -> str:
+    if any(c in path for c in "*?["):
+        return path
+    return path.rstrip("/") + "*"
+
+
+def filter_clause(filters):
+    """SQL condition on the `commits` table, plus its parameters, for parsed filters."""
+    clauses = []
+    params = []
+    if "author" in filters:
+        # Range scans on the NOCASE indexes over both columns.
+        clauses.append(
+            "((commits.author COLLATE NOCASE >= ? AND commits.author COLLATE NOCASE < ?)"
+            " OR (commits.email COLLATE NOCASE >= ? AND commits.email COLLATE NOCASE < ?))"
+        )
+        params += [*_prefix_range(filters["author"])] * 2
+    if "since" in filters:
+        clauses.append("commits.timestamp >= ?")
+        params.append(filters["since"])
+    if "until" in filters:
+        clauses.append("commits.timestamp <= ?")
+        params.append(filters["until"])
+    if "path" in filters:
+        clauses.append(
+            "commits.commit_id IN (SELECT commit_id FROM commit_paths WHERE path GLOB ?)"
+        )
+        params.append(_path_glob(filters["path"]))
+    return " AND ".join(clauses) or "1", params
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+
+SCOPE = ("repo", 3, "model", "hybrid")
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype="float32")
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_exact_hit_and_miss():
+    cache = AnswerCache()
+    cache.put(SCOPE, "what changed", "answer")
+    assert cache.get(SCOPE, "what changed") == ("answer", "exact")
+    assert cache.get(SCOPE, "what else changed") == (None, None)
+    # Same query, another generation or option set.
+    assert cache.get(("repo", 4, "model", "hybrid"), "what changed") == (None, None)
+    assert cache.stats()["exact_hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(ttl_s=60)
+    cache.put(SCOPE, "q", "answer", unit(1, 0))
+    clock[0] += 60
+    assert cache.get(SCOPE, "q") == ("answer", "exact")
+    clock[0] += 1
+    assert cache.get(SCOPE, "q") == (None, None)
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+    # Its vector went with it.
+    assert cache.get(SCOPE, "other", unit(1, 0)) == (None, None)
+
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put(SCOPE, "a", "A")
+    cache.put(SCOPE, "b", "B")
+    cache.get(SCOPE, "a")
+    cache.put(SCOPE, "c", "C")
+    assert cache.get(SCOPE, "b") == (None, None)
+    assert cache.get(SCOPE, "a") == ("A", "exact")
+    assert cache.get(SCOPE, "c") == ("C", "exact")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_putting_a_query_again_replaces_it():
+    cache = AnswerCache(max_entries=2)
+    cache.put(SCOPE, "a", "old", unit(1, 0))
+    cache.put(SCOPE, "a", "new", unit(0, 1))
+    assert cache.stats()["entries"] == 1
+    assert cache.get(SCOPE, "x", unit(0, 1)) == ("new", "semantic")
+    assert cache.get(SCOPE, "y", unit(1, 0)) == (None, None)
+
+
+def test_semantic_hit_above_the_similarity_threshold():
+    cache = AnswerCache(similarity=0.95)
+    cache.put(SCOPE, "why was the parser rewritten", "answer", unit(1, 0, 0))
+    cache.put(SCOPE, "who maintains the docs", "docs answer", unit(0, 0, 1))
+    assert cache.get(SCOPE, "why did the parser get rewritten", unit(1, 0.1, 0)) == ("answer", "semantic")
+    assert cache.get(SCOPE, "how fast is the parser", unit(1, 1, 0)) == (None, None)
+    # Vectors are only compared within a scope.
+    assert cache.get(("other",), "why did the parser get rewritten", unit(1, 0.1, 0)) == (None, None)
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_similarity_above_one_turns_the_semantic_tier_off():
+    cache = AnswerCache(similarity=1.01)
+    cache.put(SCOPE, "q", "answer", unit(1, 0))
+    assert not cache.semantic
+    assert cache.get(SCOPE, "same meaning", unit(1, 0)) == (None, None)
+    assert cache.get(SCOPE, "q", unit(1, 0)) == ("answer", "exact")
+
+
+def test_invalidate_drops_one_repo():
+    cache = AnswerCache()
+    cache.put(("repo", 1), "q", "answer", unit(1, 0))
+    cache.put(("other", 1), "q", "other answer", unit(1, 0))
+    cache.invalidate("repo")
+    assert cache.get(("repo", 1), "q", unit(1, 0)) == (None, None)
+    assert cache.get(("other", 1), "q") == ("other answer", "exact")
+    assert cache.stats()["invalidations"] == 1
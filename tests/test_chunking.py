@@ -0,0 +1,51 @@
+import pytest
+
+from chunking import MAX_CHUNK_TOKENS, chunk_commit, estimate_tokens
+
+
+def count_chars(texts):
+    # Stricter than any word-piece tokenizer: every character is a token.
+    return [len(text) for text in texts]
+
+
+def make_diff(path, lines):
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,{len(lines)} +1,{len(lines)} @@\n" + "".join(
+        f"+{line}\n" for line in lines
+    )
+
+
+COMMIT = {
+    "hash": "0" * 40,
+    "message": "Fix the parser",
+    "diff": make_diff("src/parse.py", [f"value_{n} = parse(tokens[{n}])" for n in range(60)])
+    + make_diff("src/long.py", ["x" * 500, "y = 1"]),
+}
+
+
+def test_chunks_fit_the_given_counter():
+    chunks = chunk_commit(COMMIT, max_tokens=200, count_tokens=count_chars)
+    assert len(chunks) > 2
+    assert max(count_chars(chunks)) <= 200
+    # The estimate alone would pack many times more per chunk.
+    assert len(chunk_commit(COMMIT, max_tokens=200)) < len(chunks)
+
+
+def test_long_message_is_cut_to_fit():
+    commit = {"hash": "1" * 40, "message": "word " * 100, "diff": ""}
+    (chunk,) = chunk_commit(commit, count_tokens=count_chars)
+    assert len(chunk) <= 48
+    assert chunk == chunk_commit(commit)[0][: len(chunk)]
+
+
+def test_chunks_fit_the_model_tokenizer():
+    pytest.importorskip("sentence_transformers")
+    from benchmarks.corpus import load_corpus
+    from embeddings import get_embedder
+
+    count_tokens = get_embedder().count_tokens
+    commits = load_corpus() + [COMMIT]
+    chunks = [chunk for commit in commits for chunk in chunk_commit(commit, count_tokens=count_tokens)]
+    counts = count_tokens(chunks)
+    assert max(counts) <= MAX_CHUNK_TOKENS
+    # What the check guards against: the regex estimate undercounts word pieces.
+    assert sum(counts) > sum(estimate_tokens(chunk) for chunk in chunks)
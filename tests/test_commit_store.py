@@ -0,0 +1,139 @@
+import hashlib
+import os
+
+import numpy as np
+
+import commit_store
+from commit_store import (
+    append_commits,
+    append_embeddings,
+    append_row_ids,
+    commit_generation,
+    commit_id,
+    compact,
+    load_embeddings,
+    load_known_hashes,
+    load_manifest,
+    load_row_ids,
+    load_tombstones,
+    read_commits,
+    recover,
+    remove_commits,
+    search_lexical_many,
+)
+
+DIM = 8
+
+
+def make_commit(name: str):
+    return {
+        "hash": hashlib.sha1(name.encode()).hexdigest(),
+        "author": "dev",
+        "email": "dev@example.com",
+        "date": "2024-01-01T00:00:00+00:00",
+        "message": f"commit {name}",
+        "diff": f"diff --git a/{name}.py b/{name}.py\n+++ b/{name}.py\n+{name} = True\n",
+    }
+
+
+def ingest(repo_dir, commits):
+    """Append commits with one vector each, as embed_and_save does, without publishing them."""
+    append_commits(repo_dir, commits)
+    vectors = np.random.default_rng(len(commits)).standard_normal((len(commits), DIM)).astype("float32")
+    append_embeddings(repo_dir, vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    append_row_ids(repo_dir, [commit_id(c["hash"]) for c in commits])
+
+
+def test_crash_after_force_push_drops_the_unpublished_removal_and_replacement(tmp_path):
+    repo_dir = str(tmp_path)
+    first, second, newest = (make_commit(name) for name in ("first", "second", "newest"))
+    ingest(repo_dir, [first, second, newest])
+    commit_generation(repo_dir, load_manifest(repo_dir))
+
+    # A force-push replaces the newest commit; ingest dies before publishing.
+    replacement = make_commit("replacement")
+    remove_commits(repo_dir, [newest["hash"]])
+    ingest(repo_dir, [replacement])
+
+    manifest = load_manifest(repo_dir)
+    recover(repo_dir, manifest)
+    assert load_known_hashes(repo_dir) == {first["hash"], second["hash"], newest["hash"]}
+    assert not len(load_tombstones(repo_dir))
+
+    # The next ingest stages the removal again and publishes it with the replacement.
+    remove_commits(repo_dir, [newest["hash"]])
+    ingest(repo_dir, [replacement])
+    manifest = commit_generation(repo_dir, manifest)
+    assert load_known_hashes(repo_dir) == {first["hash"], second["hash"], replacement["hash"]}
+    stored = read_commits(repo_dir, [commit_id(replacement["hash"])])
+    assert stored[commit_id(replacement["hash"])]["diff"] == replacement["diff"]
+    assert list(load_tombstones(repo_dir)) == [commit_id(newest["hash"])]
+    row_ids = load_row_ids(repo_dir, manifest["rows"])
+    assert commit_id(replacement["hash"]) in row_ids
+    assert len(load_embeddings(repo_dir)) == manifest["rows"]
+
+
+def test_removal_is_invisible_until_published(tmp_path):
+    repo_dir = str(tmp_path)
+    first, second = make_commit("first"), make_commit("second")
+    ingest(repo_dir, [first, second])
+    manifest = commit_generation(repo_dir, load_manifest(repo_dir))
+    rows = load_row_ids(repo_dir, manifest["rows"]).copy()
+
+    assert remove_commits(repo_dir, [second["hash"]]) == 1
+    assert not len(load_tombstones(repo_dir))
+    assert commit_id(second["hash"]) in read_commits(repo_dir, [commit_id(second["hash"])])
+    assert [cid for cid, _ in search_lexical_many(repo_dir, ["second"], 5)[0]] == [commit_id(second["hash"])]
+    assert (load_row_ids(repo_dir, manifest["rows"]) == rows).all()
+
+    commit_generation(repo_dir, manifest)
+    assert list(load_tombstones(repo_dir)) == [commit_id(second["hash"])]
+    assert read_commits(repo_dir, [commit_id(second["hash"])]) == {}
+    assert search_lexical_many(repo_dir, ["second"], 5) == [[]]
+
+
+def test_recover_finishes_a_published_removal(tmp_path, monkeypatch):
+    repo_dir = str(tmp_path)
+    first, second = make_commit("first"), make_commit("second")
+    ingest(repo_dir, [first, second])
+    manifest = commit_generation(repo_dir, load_manifest(repo_dir))
+
+    # Crash after the manifest swap, before the removal's rows are deleted.
+    remove_commits(repo_dir, [second["hash"]])
+    with monkeypatch.context() as m:
+        m.setattr(commit_store, "_apply_tombstones", lambda repo_dir, manifest: None)
+        commit_generation(repo_dir, manifest)
+    assert search_lexical_many(repo_dir, ["second"], 5) == [[]]
+
+    recover(repo_dir, load_manifest(repo_dir))
+    assert load_known_hashes(repo_dir) == {first["hash"]}
+    assert list(load_tombstones(repo_dir)) == [commit_id(second["hash"])]
+
+
+def test_compaction_drops_removed_vectors_but_keeps_a_re_added_commit(tmp_path):
+    repo_dir = str(tmp_path)
+    first, second = make_commit("first"), make_commit("second")
+    ingest(repo_dir, [first, second])
+    manifest = commit_generation(repo_dir, load_manifest(repo_dir))
+    remove_commits(repo_dir, [second["hash"]])
+    manifest = commit_generation(repo_dir, manifest)
+    assert manifest["rows"] == 2
+
+    manifest = compact(repo_dir, manifest)
+    assert manifest["rows"] == 1
+    assert list(load_row_ids(repo_dir, manifest["rows"])) == [commit_id(first["hash"])]
+    assert len(load_embeddings(repo_dir)) == 1
+    assert not len(load_tombstones(repo_dir))
+    assert sorted(os.listdir(repo_dir)) == sorted(
+        ["commits.sqlite", "diffs.bin", "manifest.json", "segments", manifest["embeddings"], manifest["row_ids"]]
+    )
+
+    # Removed, then pushed again: the re-added commit's rows outlive the stale ones.
+    remove_commits(repo_dir, [first["hash"]])
+    manifest = commit_generation(repo_dir, manifest)
+    ingest(repo_dir, [first])
+    manifest = commit_generation(repo_dir, manifest)
+    assert list(load_row_ids(repo_dir, manifest["rows"])) == [commit_id(first["hash"])]
+    assert not len(load_tombstones(repo_dir))
+    assert load_known_hashes(repo_dir) == {first["hash"]}
+    assert [cid for cid, _ in search_lexical_many(repo_dir, ["first"], 5)[0]] == [commit_id(first["hash"])]
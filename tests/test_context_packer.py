@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from chunking import estimate_tokens
+from context_packer import CUT_MARKER, MAX_HUNK_TOKENS, _head_tokens, pack_context
+
+WORDS = ["foo", "(", ")", "x.y", "bar_baz", "!!", "+", "a,b,c", "", "longidentifier", "..."]
+
+
+def random_line(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def random_commits(rng, trial):
+    commits = []
+    diffs = {}
+    for i in range(rng.randint(1, 8)):
+        commit_hash = f"{trial:08x}{i:032x}"
+        commits.append({"hash": commit_hash, "message": random_line(rng, rng.randint(1, 120)), "date": "2024", "author": "a"})
+        files = []
+        for f in range(rng.randint(0, 4)):
+            hunks = "".join(
+                "@@ -1 +1 @@\n"
+                + "\n".join("+" + random_line(rng, rng.choice([2, 10, 300])) for _ in range(rng.randint(1, 40)))
+                + "\n"
+                for _ in range(rng.randint(1, 3))
+            )
+            files.append(f"diff --git a/p{f}.py b/p{f}.py\n--- a/p{f}.py\n+++ b/p{f}.py\n{hunks}")
+        diffs[commit_hash] = "".join(files)
+    return commits, diffs
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_packed_context_fits_the_budget(seed):
+    rng = random.Random(seed)
+    for trial in range(100):
+        commits, diffs = random_commits(rng, trial)
+        budget = rng.choice([1, 5, 20, 50, 200, 500, 1500])
+        context, stats = pack_context(commits, "foo bar", budget, lambda c: diffs[c["hash"]])
+        assert estimate_tokens(context) <= stats["tokens"] <= budget
+
+
+def test_summary_lines_over_the_budget_are_dropped():
+    commits = [{"hash": "a" * 40, "message": "word " * 200}]
+    context, stats = pack_context(commits, "word", 5, lambda c: "")
+    assert context == ""
+    assert stats["tokens"] == 0
+    assert stats["dropped_commits"] == 1
+
+
+def test_cut_hunks_end_with_a_counted_marker():
+    hunk = "\n".join(f"+line {n} = value_{n}" for n in range(200))
+    body, tokens = _head_tokens(hunk, MAX_HUNK_TOKENS)
+    assert body.endswith("\n" + CUT_MARKER)
+    assert tokens <= MAX_HUNK_TOKENS
+    assert tokens == sum(estimate_tokens(line) + 1 for line in body.splitlines())
+
+
+@pytest.mark.parametrize("max_tokens", [8, 16, 64, 160])
+def test_a_long_first_line_is_cut_within_the_limit(max_tokens):
+    line = " ".join(f"word{n}" for n in range(500))
+    body, tokens = _head_tokens(line, max_tokens)
+    first, marker = body.split("\n")
+    assert line.startswith(first) and first
+    assert marker == CUT_MARKER
+    assert tokens == estimate_tokens(first) + estimate_tokens(CUT_MARKER) + 2 <= max_tokens
@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import pytest
+from git import Repo
+
+from git_log import iter_log_commits
+
+ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="Dev",
+    GIT_AUTHOR_EMAIL="dev@example.com",
+    GIT_COMMITTER_NAME="Dev",
+    GIT_COMMITTER_EMAIL="dev@example.com",
+    GIT_CONFIG_GLOBAL=os.devnull,
+    GIT_CONFIG_NOSYSTEM="1",
+)
+
+MULTILINE_MESSAGE = "Parse nested configs\n\nNested sections were flattened.\n\n- keep the order\n- keep comments"
+
+
+def git(repo_dir, *args):
+    return subprocess.run(["git", *args], cwd=repo_dir, env=ENV, check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture(scope="module")
+def repo(tmp_path_factory):
+    repo_dir = str(tmp_path_factory.mktemp("repo"))
+    git(repo_dir, "init", "-q")
+    with open(os.path.join(repo_dir, "config.py"), "w") as f:
+        f.write("SECTIONS = []\n")
+    git(repo_dir, "add", "-A")
+    git(repo_dir, "commit", "-q", "-m", "Root commit")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "Empty commit")
+    with open(os.path.join(repo_dir, "logo.png"), "wb") as f:
+        f.write(bytes(range(256)) * 4)
+    git(repo_dir, "add", "-A")
+    git(repo_dir, "commit", "-q", "-m", "Add binary logo")
+    with open(os.path.join(repo_dir, "config.py"), "w") as f:
+        f.write("SECTIONS = {}\n")
+    git(repo_dir, "add", "-A")
+    git(repo_dir, "commit", "-q", "-m", MULTILINE_MESSAGE)
+    return Repo(repo_dir)
+
+
+def test_streams_every_commit_newest_first(repo):
+    commits = list(iter_log_commits(repo))
+    assert [c["hash"] for c in commits] == git(repo.working_dir, "rev-list", "HEAD").split()
+    assert [c["message"].splitlines()[0] for c in commits] == [
+        "Parse nested configs", "Add binary logo", "Empty commit", "Root commit"
+    ]
+    assert all(c["author"] == "Dev" and c["email"] == "dev@example.com" and c["date"] for c in commits)
+
+
+def test_root_commit_diff_adds_its_files(repo):
+    root = list(iter_log_commits(repo))[-1]
+    assert root["diff"].startswith("diff --git a/config.py b/config.py")
+    assert "+SECTIONS = []" in root["diff"]
+
+
+def test_empty_commit_has_no_diff(repo):
+    empty = list(iter_log_commits(repo))[2]
+    assert empty["message"] == "Empty commit"
+    assert empty["diff"] == ""
+
+
+def test_binary_commit_diff_is_a_stub(repo):
+    binary = list(iter_log_commits(repo))[1]
+    assert binary["diff"].startswith("diff --git a/logo.png b/logo.png")
+    assert "Binary files /dev/null and b/logo.png differ" in binary["diff"]
+
+
+def test_multi_line_message_is_kept_whole(repo):
+    newest = next(iter_log_commits(repo))
+    assert newest["message"] == MULTILINE_MESSAGE
+    assert newest["diff"].startswith("diff --git a/config.py b/config.py")
+    assert "-SECTIONS = []\n+SECTIONS = {}" in newest["diff"]
+
+
+def test_revision_range_and_early_stop(repo):
+    root = git(repo.working_dir, "rev-list", "--max-parents=0", "HEAD").strip()
+    assert len(list(iter_log_commits(repo, [f"{root}..HEAD"]))) == 3
+    # Closing the stream part-way kills git log without raising.
+    stream = iter_log_commits(repo)
+    next(stream)
+    stream.close()
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# gitretrieval loads the embedding model on import; the benchmark swaps in a stub encoder after.
+pytest.importorskip("sentence_transformers")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_ingest_peak_rss_is_bounded_on_a_50k_commit_repo(tmp_path):
+    # A process of its own: ru_maxrss is a per-process high-water mark. The synthetic repo
+    # and the store go under TMPDIR.
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.ingest_memory", "--commits", "50000", "--stub-encoder", "--max-mb", "128"],
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])), TMPDIR=str(tmp_path)),
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "50000 commits" in result.stdout
@@ -0,0 +1,36 @@
+import pytest
+
+from lexical_index import RRF_K, rrf_fuse
+
+
+def test_single_ranking_keeps_its_order_with_reciprocal_rank_scores():
+    assert rrf_fuse([["a", "b", "c"]], k=60) == [("a", 1 / 61), ("b", 1 / 62), ("c", 1 / 63)]
+
+
+def test_scores_add_up_across_rankings():
+    fused = dict(rrf_fuse([["a", "b"], ["b", "c"]], k=0))
+    assert fused == pytest.approx({"a": 1.0, "b": 1 / 2 + 1.0, "c": 1 / 2})
+
+
+def test_agreement_beats_one_top_rank():
+    # "b" is second in both lists; "a" and "c" each top only one of them.
+    fused = rrf_fuse([["a", "b", "x"], ["c", "b", "y"]])
+    assert fused[0][0] == "b"
+    assert {fused[1][0], fused[2][0]} == {"a", "c"}
+
+
+def test_ties_keep_first_seen_order():
+    assert [item for item, _ in rrf_fuse([["a", "x"], ["b", "y"]])] == ["a", "b", "x", "y"]
+
+
+def test_empty_and_one_sided_rankings():
+    assert rrf_fuse([]) == []
+    assert rrf_fuse([[], []]) == []
+    assert rrf_fuse([[], [7, 3]]) == [(7, 1 / (RRF_K + 1)), (3, 1 / (RRF_K + 2))]
+
+
+def test_larger_k_flattens_rank_differences():
+    top, second = rrf_fuse([["a", "b"]], k=0)
+    assert top[1] / second[1] == pytest.approx(2.0)
+    top, second = rrf_fuse([["a", "b"]], k=1000)
+    assert top[1] / second[1] == pytest.approx(1002 / 1001)
@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+import pytest
+
+from llm_client import LLMClient
+
+
+def collect(body: str):
+    async def run():
+        client = LLMClient(url="http://llm.test/chat")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+        client._slots = asyncio.Semaphore(1)
+        try:
+            return [text async for text in client.stream_chat({"messages": []}, "key")]
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+
+def chunk(text: str) -> str:
+    return 'data: {"choices": [{"delta": {"content": "%s"}}]}\n\n' % text
+
+
+def test_stream_yields_pieces_until_done():
+    assert collect(": keep-alive\n\n" + chunk("Hello") + chunk(" world") + "data: [DONE]\n\n") == ["Hello", " world"]
+
+
+def test_stream_cut_off_before_done_raises():
+    with pytest.raises(RuntimeError, match="before \\[DONE\\]"):
+        collect(chunk("Hello"))
+
+
+def test_empty_stream_without_done_raises():
+    with pytest.raises(RuntimeError):
+        collect("")
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+# reranker imports CrossEncoder from sentence_transformers; each test swaps in a fake one.
+pytest.importorskip("sentence_transformers")
+
+import reranker
+from reranker import Reranker
+
+QUERIES = ["parse config", "fix cache"]
+CANDIDATES = [
+    [{"hash": f"{n}{i}", "message": f"commit {i}", "diff": f"+{QUERIES[n]} {i}\n"} for i in range(4)]
+    for n in range(len(QUERIES))
+]
+
+
+class FakeCrossEncoder:
+    load_s = 0.0
+    pair_s = 0.0
+
+    def __init__(self, name):
+        time.sleep(self.load_s)
+
+    def predict(self, pairs, **kwargs):
+        time.sleep(self.pair_s * len(pairs))
+        # Scores the number a candidate's diff ends with, so the last first-stage candidate scores best.
+        return [float(text.split()[-1]) if text.split()[-1].isdigit() else 0.0 for _, text in pairs]
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(reranker, "CrossEncoder", FakeCrossEncoder)
+    monkeypatch.setattr(reranker, "_cross_encoder", None)
+    monkeypatch.setattr(reranker, "_loader", None)
+    monkeypatch.setattr(reranker, "_load_failed_at", None)
+    monkeypatch.setattr(FakeCrossEncoder, "load_s", 0.0)
+    monkeypatch.setattr(FakeCrossEncoder, "pair_s", 0.0)
+    yield
+    if reranker._loader is not None:
+        reranker._loader.join()
+
+
+def hashes(results):
+    return [[c["hash"] for c in query_results] for query_results in results]
+
+
+def test_first_stage_order_while_the_model_loads():
+    FakeCrossEncoder.load_s = 0.5
+    r = Reranker()
+    start = time.perf_counter()
+    results = r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=100)
+    assert time.perf_counter() - start < 0.1
+    assert hashes(results) == hashes(CANDIDATES)
+    assert r.stats()["model_loading"] == 1
+
+    reranker._loader.join()
+    results = r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=1000)
+    assert hashes(results) == [[f"{n}{i}" for i in reversed(range(4))] for n in range(len(QUERIES))]
+
+
+def test_waiting_for_the_model_counts_against_the_budget():
+    reranker.get_cross_encoder()
+    r = Reranker()
+    with reranker._cross_encoder_lock:
+        start = time.perf_counter()
+        results = r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=50)
+        elapsed = time.perf_counter() - start
+    assert elapsed < 0.2
+    assert hashes(results) == hashes(CANDIDATES)
+    assert r.stats()["budget_exhausted"] == 1
+
+
+def test_a_slow_estimate_recovers_after_the_probe(monkeypatch):
+    monkeypatch.setattr(reranker, "RERANK_PROBE_S", 0.0)
+    reranker.get_cross_encoder()
+    r = Reranker()
+    r._pair_s["cross-encoder"] = 1.0
+
+    # Too slow: the lexical re-ranker runs, and a background probe times one pair.
+    r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=50)
+    r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=50)
+    assert r.stats()["lexical_fallbacks"] == 2
+    deadline = time.monotonic() + 5
+    while r._pair_s["cross-encoder"] >= 1.0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    results = r.rerank_many(QUERIES, CANDIDATES, "cross-encoder", budget_ms=50)
+    assert r.stats()["lexical_fallbacks"] == 2
+    assert all("rerank_score" in c for c in results[0])
@@ -0,0 +1,99 @@
+import hashlib
+from datetime import datetime, timezone
+
+import pytest
+
+from commit_store import append_commits, commit_generation, commit_id, filter_commit_ids, load_manifest
+from search_filters import commit_timestamp, filter_clause, parse_filters
+
+
+def utc(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.mark.parametrize("raw", [None, {}, {"author": ""}, {"author": "   ", "path": None}])
+def test_nothing_to_filter(raw):
+    assert parse_filters(raw) is None
+
+
+def test_strings_are_stripped():
+    assert parse_filters({"author": " Yemi ", "path": "scanner/ "}) == {"author": "Yemi", "path": "scanner/"}
+
+
+@pytest.mark.parametrize(
+    "raw, error",
+    [
+        (["author"], "must be an object"),
+        ({"branch": "main"}, "Unknown filters: branch"),
+        ({"author": 3}, "'author' must be a string"),
+        ({"since": "last week"}, "'since' must be an ISO date"),
+        ({"until": 20240501}, "'until' must be an ISO date"),
+    ],
+)
+def test_invalid_filters(raw, error):
+    with pytest.raises(ValueError, match=error):
+        parse_filters(raw)
+
+
+def test_date_bounds():
+    # A bare `until` date takes in that whole day; a `since` date starts at midnight UTC.
+    assert parse_filters({"since": "2024-05-01", "until": "2024-05-31"}) == {
+        "since": utc(2024, 5, 1),
+        "until": utc(2024, 6, 1) - 1,
+    }
+    # Datetimes are exact, in their own offset; Z and naive ones are UTC.
+    assert parse_filters({"until": "2024-05-31T12:00:00+02:00"}) == {"until": utc(2024, 5, 31, 10)}
+    assert parse_filters({"since": "2024-05-01T08:30:00Z"}) == {"since": utc(2024, 5, 1, 8, 30)}
+    assert parse_filters({"since": "2024-05-01T08:30:00"}) == {"since": utc(2024, 5, 1, 8, 30)}
+
+
+def test_commit_timestamp():
+    assert commit_timestamp("2024-05-01T10:00:00+02:00") == utc(2024, 5, 1, 8)
+    assert commit_timestamp("") is None
+    assert commit_timestamp(None) is None
+
+
+def test_no_filters_match_everything():
+    assert filter_clause({}) == ("1", [])
+
+
+def make_commit(name, author, email, date, path):
+    return {
+        "hash": hashlib.sha1(name.encode()).hexdigest(),
+        "author": author,
+        "email": email,
+        "date": date,
+        "message": name,
+        "diff": f"diff --git a/{path} b/{path}\n+++ b/{path}\n+x\n",
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    commits = [
+        make_commit("scan", "Yemi Ade", "yemi@example.com", "2024-05-01T09:00:00+00:00", "scanner/lexer.py"),
+        make_commit("docs", "Ada", "ada@example.com", "2024-05-31T23:59:59+00:00", "docs/index.md"),
+        make_commit("late", "ada", "ADA@work.example", "2024-06-01T00:00:00+00:00", "scanner.py"),
+    ]
+    append_commits(str(tmp_path), commits)
+    commit_generation(str(tmp_path), load_manifest(str(tmp_path)))
+    return str(tmp_path), {c["message"]: commit_id(c["hash"]) for c in commits}
+
+
+@pytest.mark.parametrize(
+    "raw, names",
+    [
+        ({"author": "yem"}, ["scan"]),
+        ({"author": "ADA"}, ["docs", "late"]),
+        ({"author": "ada@w"}, ["late"]),
+        ({"since": "2024-05-02", "until": "2024-05-31"}, ["docs"]),
+        ({"until": "2024-05-31T23:59:59Z"}, ["scan", "docs"]),
+        ({"path": "scanner"}, ["scan", "late"]),
+        ({"path": "scanner/lexer.py"}, ["scan"]),
+        ({"path": "*.md"}, ["docs"]),
+        ({"author": "ada", "path": "docs/"}, ["docs"]),
+    ],
+)
+def test_filters_select_commits_in_the_store(store, raw, names):
+    repo_dir, ids = store
+    assert list(filter_commit_ids(repo_dir, parse_filters(raw))) == sorted(ids[name] for name in names)
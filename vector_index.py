@@ -0,0 +1,253 @@
+import os
+import math
+import numpy as np
+import faiss
+
+# Segment index type by live vector count: exact search while a scan is cheap,
+# HNSW above that, IVF-PQ once full-precision vectors get too big to keep hot.
+# benchmarks/ann_selection.py measures the recall / latency trade-off behind these.
+FLAT_MAX_ROWS = int(os.getenv("FLAT_MAX_ROWS", "50000"))
+IVFPQ_MIN_ROWS = int(os.getenv("IVFPQ_MIN_ROWS", "1000000"))
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+# Default search effort, saved inside each built index; both can be overridden per query.
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Training vectors per IVF list (faiss wants at least 39).
+IVF_TRAIN_PER_LIST = 64
+# PQ codebooks have 256 centroids each; below this there is too little to train them on.
+PQ_MIN_ROWS = 10000
+# PQ hits fetched per wanted result, then re-scored on the exact float32 vectors.
+PQ_RERANK_FACTOR = int(os.getenv("PQ_RERANK_FACTOR", "16"))
+# Vectors are normalized and added this many at a time, so building a segment from the
+# embeddings memmap copies one ingest batch at most, never the whole matrix.
+ADD_BATCH_ROWS = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Filters allowing at most this many vectors are answered by scoring exactly those vectors;
+# larger allowed sets go through the ANN indexes with a selector and proportionally more effort.
+FILTER_EXACT_MAX_ROWS = int(os.getenv("FILTER_EXACT_MAX_ROWS", "20000"))
+HNSW_MAX_EF_SEARCH = 1024
+
+KINDS = ("flat", "hnsw", "ivfpq")
+
+
+def choose_index_type(rows: int) -> str:
+    if rows >= max(IVFPQ_MIN_ROWS, PQ_MIN_ROWS):
+        return "ivfpq"
+    if rows > FLAT_MAX_ROWS:
+        return "hnsw"
+    return "flat"
+
+
+def new_index(kind: str, dim: int, rows: int):
+    """An empty index of `kind` sized for `rows` vectors; all kinds accept add_with_ids."""
+    if kind == "flat":
+        return faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+    if kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        return faiss.IndexIDMap(hnsw)
+    if kind == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, _ivf_lists(rows), _pq_subquantizers(dim), 8)
+        index.nprobe = IVF_NPROBE
+        return index
+    raise ValueError(f"Unknown index type {kind!r}; expected one of {', '.join(KINDS)}")
+
+
+def _ivf_lists(rows: int) -> int:
+    return max(1, int(4 * math.sqrt(rows)))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # 8 dimensions per sub-quantizer, 8 bits each: 48 bytes for a 384-dim vector.
+    return next(m for m in range(max(dim // 8, 1), 0, -1) if dim % m == 0)
+
+
+def build_bytes(kind: str, rows: int, dim: int) -> int:
+    """Approximate heap build_index takes to index `rows` vectors of `dim` as `kind`."""
+    if kind == "ivfpq":
+        nlist = _ivf_lists(rows)
+        # Training holds about three copies of the sample (normalized, residuals, PQ's own).
+        train = min(rows, IVF_TRAIN_PER_LIST * nlist) * dim * 4 * 3
+        return train + nlist * dim * 4 + rows * (_pq_subquantizers(dim) + 8)
+    row = dim * 4 + 8
+    if kind == "hnsw":
+        # Base-level links (2 * M ids) and upper levels.
+        row += HNSW_M * 18
+    # Plus allocator slack, as measured.
+    return rows * row * 21 // 20
+
+
+def plan_segments(rows: int, dim: int, max_bytes: int):
+    """Split rows [0, rows) into consecutive (start, end, kind) runs, each buildable within max_bytes.
+
+    One run if they all fit; otherwise runs of the most rows that do, so that leading
+    runs stay put as rows are appended and their segments can be kept.
+    """
+    if not rows:
+        return []
+    if build_bytes(choose_index_type(rows), rows, dim) <= max_bytes:
+        return [(0, rows, choose_index_type(rows))]
+
+    ivfpq_min = max(IVFPQ_MIN_ROWS, PQ_MIN_ROWS)
+    regimes = (
+        ("flat", 1, min(FLAT_MAX_ROWS, ivfpq_min - 1)),
+        ("hnsw", FLAT_MAX_ROWS + 1, ivfpq_min - 1),
+        ("ivfpq", ivfpq_min, rows),
+    )
+    size = 1
+    for kind, lo, hi in regimes:
+        hi = min(hi, rows)
+        if lo > hi or build_bytes(kind, lo, dim) > max_bytes:
+            continue
+        # Largest run of this kind that fits; cost grows with rows within a kind.
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            lo, hi = (mid, hi) if build_bytes(kind, mid, dim) <= max_bytes else (lo, mid - 1)
+        size = max(size, lo)
+
+    plan = []
+    for start in range(0, rows, size):
+        end = min(start + size, rows)
+        kind = choose_index_type(end - start)
+        if build_bytes(kind, end - start, dim) > max_bytes and end - start >= PQ_MIN_ROWS:
+            kind = "ivfpq"
+        plan.append((start, end, kind))
+    return plan
+
+
+def _normalized(vectors):
+    # Unit length makes L2 ranking equal cosine ranking; copies, since inputs are often read-only mmaps.
+    vectors = np.array(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(vectors, ids, kind: str = None):
+    """Build a segment index over `vectors` keyed by `ids`, skipping rows whose id is negative.
+
+    Returns (index, kind). IVF-PQ is trained on a sample of the live rows first.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    live = ids >= 0
+    rows = int(live.sum())
+    kind = kind or choose_index_type(rows)
+    index = new_index(kind, vectors.shape[1], rows)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(np.flatnonzero(live), min(rows, IVF_TRAIN_PER_LIST * index.nlist), replace=False)
+        index.train(_normalized(vectors[np.sort(sample)]))
+
+    for start in range(0, len(vectors), ADD_BATCH_ROWS):
+        batch_live = live[start:start + ADD_BATCH_ROWS]
+        index.add_with_ids(
+            _normalized(vectors[start:start + ADD_BATCH_ROWS][batch_live]),
+            ids[start:start + ADD_BATCH_ROWS][batch_live],
+        )
+    return index, kind
+
+
+def segment_name(generation: int, start: int, end: int, kind: str) -> str:
+    """File name of a segment indexing embedding rows [start, end), e.g. 00000012.0-16384.flat.index."""
+    return f"{generation:08d}.{start}-{end}.{kind}.index"
+
+
+def segment_kind(name: str) -> str:
+    """Index type recorded in a segment file name (see segment_name)."""
+    return os.path.basename(name).split(".")[2]
+
+
+def segment_rows(name: str):
+    """(start, end) embedding rows recorded in a segment file name (see segment_name)."""
+    start, end = os.path.basename(name).split(".")[1].split("-")
+    return int(start), int(end)
+
+
+def read_flags(kind: str) -> int:
+    """faiss read flags that leave the bulk of a segment memory-mapped, read-only."""
+    if kind == "ivfpq":
+        # Inverted lists are served in place from the file.
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Flat vector codes, including HNSW's storage, are mapped; the HNSW graph is read into memory.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _unwrap(index):
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    return inner
+
+
+def mapped_bytes(index) -> int:
+    """Bytes of a memory-mapped segment that stay in the page cache rather than on the heap."""
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexFlatCodes):
+        return inner.ntotal * inner.code_size
+    if isinstance(inner, faiss.IndexIVF):
+        return inner.ntotal * (inner.code_size + 8)
+    return 0
+
+
+def needs_rerank(index) -> bool:
+    return isinstance(index, faiss.IndexIVFPQ)
+
+
+def is_exact(index) -> bool:
+    """True for brute-force segments, where filtered search loses no recall."""
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    return isinstance(inner, faiss.IndexFlat)
+
+
+class ExactVectors:
+    """A repo's exact float32 chunk vectors, looked up by commit id: re-scores PQ hits, answers narrow filters."""
+
+    def __init__(self, vectors, row_ids):
+        self.vectors = vectors
+        self.row_ids = row_ids
+        self.order = np.argsort(row_ids, kind="stable")
+        self.sorted_ids = row_ids[self.order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.row_ids.nbytes + self.order.nbytes + self.sorted_ids.nbytes
+
+    def count_rows(self, ids) -> int:
+        """Number of chunk vectors owned by `ids` (sorted, distinct)."""
+        lo = np.searchsorted(self.sorted_ids, ids, "left")
+        hi = np.searchsorted(self.sorted_ids, ids, "right")
+        return int((hi - lo).sum())
+
+    def rerank(self, queries, ids, k: int):
+        """Exact (D, I) over every chunk of each query's candidate commit ids, best k first, like search()."""
+        D = np.full((len(queries), k), np.inf, dtype="float32")
+        I = np.full((len(queries), k), -1, dtype="int64")
+        for q, (query, candidates) in enumerate(zip(queries, ids)):
+            candidates = np.unique(candidates[candidates >= 0])
+            lo = np.searchsorted(self.sorted_ids, candidates, "left")
+            hi = np.searchsorted(self.sorted_ids, candidates, "right")
+            rows = np.sort(np.concatenate([self.order[a:b] for a, b in zip(lo, hi)] + [np.empty(0, "int64")]))
+            distances = ((_normalized(self.vectors[rows]) - query) ** 2).sum(axis=1)
+            best = np.argsort(distances)[:k]
+            D[q, : len(best)] = distances[best]
+            I[q, : len(best)] = self.row_ids[rows][best]
+        return D, I
+
+
+def search_params(index, selector=None, nprobe: int = None, ef_search: int = None, effort: float = 1.0):
+    """SearchParameters for one segment: the id filter plus per-query nprobe / efSearch if it has them.
+
+    `effort` scales the search effort, so a selector that admits a fraction f of the
+    vectors can be given 1/f times the effort and still find k of them.
+    """
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    kwargs = {"sel": selector} if selector is not None else {}
+    if isinstance(inner, faiss.IndexHNSW) and (ef_search or effort > 1):
+        ef_search = min(int((ef_search or inner.hnsw.efSearch) * effort), max(HNSW_MAX_EF_SEARCH, ef_search or 0))
+        return faiss.SearchParametersHNSW(efSearch=ef_search, **kwargs)
+    if isinstance(inner, faiss.IndexIVF) and (nprobe or effort > 1):
+        nprobe = min(int((nprobe or inner.nprobe) * effort), inner.nlist)
+        return faiss.SearchParametersIVF(nprobe=nprobe, **kwargs)
+    return faiss.SearchParameters(**kwargs) if kwargs else None